@@ -11,6 +11,7 @@ from drf_spectacular.types import OpenApiTypes
 
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
+from django.db import transaction
 from django.utils import timezone
 
 from .models import Account
@@ -21,7 +22,11 @@ from .serializers import (
     ResetPasswordSerializer,
     ProfileSerializer,
 )
-from .tasks import send_verification_email, send_password_reset_email
+from .emails import (
+    queue_verification_email,
+    queue_password_reset_email,
+    queue_once,
+)
 
 
 @extend_schema(
@@ -60,14 +65,15 @@ class SignUpView(APIView):
     def post(self, request):
         serializer = SignUpSerializer(data=request.data)
         if serializer.is_valid():
-            user = serializer.save()
+            with transaction.atomic():
+                user = serializer.save()
 
-            # Send verification email
-            try:
-                send_verification_email.delay(user.email)
-            except Exception:
-                # Log error but don't expose to user
-                pass
+                # Queue verification email, with the new user
+                try:
+                    queue_once(queue_verification_email, user.email)
+                except Exception:
+                    # Logged, but don't expose to user
+                    pass
 
             return Response(
                 {
@@ -307,11 +313,11 @@ class ResendVerificationView(APIView):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            # Send verification email
+            # Queue verification email
             try:
-                send_verification_email.delay(user.email)
+                queue_once(queue_verification_email, user.email)
             except Exception:
-                # Log error but don't expose to user
+                # Logged, but don't expose to user
                 pass
 
             return Response(
@@ -375,11 +381,11 @@ class ForgotPasswordView(APIView):
         if serializer.is_valid():
             email = serializer.validated_data["email"]
 
-            # Send password reset email
+            # Queue password reset email
             try:
-                send_password_reset_email.delay(email)
+                queue_once(queue_password_reset_email, email)
             except Exception:
-                # Log error but don't expose to user
+                # Logged, but don't expose to user
                 pass
 
             return Response(
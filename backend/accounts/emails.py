@@ -0,0 +1,119 @@
+"""
+Emails of the accounts app, added to the outbox in the caller's
+transaction, with the token they carry.
+
+- queue_verification_email
+- queue_password_reset_email
+- queue_once: queue one of those, unless it was just queued
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.crypto import get_random_string
+from django.utils import timezone
+from django.contrib.auth.models import User
+
+from service.outbox import queue_templated_email
+
+
+logger = logging.getLogger(__name__)
+
+
+def queue_verification_email(email):
+    """Queue a verification email to the user with the given email."""
+    try:
+        user = User.objects.get(email=email)
+    except User.DoesNotExist:
+        logger.error(f"Verification email request for nonexistent {email}")
+        return False
+
+    with transaction.atomic():
+        # Generate email verification token
+        token = get_random_string(64)
+        user.account.email_verification_token = token
+        user.account.save()
+
+        # Queue verification email, sent when the token is saved
+        verification_url = f"/auth/verify-email/{token}/"
+        queue_templated_email(
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=user.email,
+            subject="Verify your email address",
+            template_name="accounts/email/verify_email",
+            context_dict={
+                "verification_url": verification_url,
+                "user": user,
+            },
+        )
+    logger.info(f"Verification email queued for {email}")
+    return True
+
+
+def queue_password_reset_email(email):
+    """Queue a password reset email to the user with the given email."""
+    try:
+        user = User.objects.get(email=email)
+    except User.DoesNotExist:
+        logger.error(f"Password reset request for nonexistent {email}")
+        return False
+    account = user.account
+
+    with transaction.atomic():
+        # Generate password reset token
+        token = get_random_string(64)
+        account.password_reset_token = token
+        account.password_reset_expires = timezone.now() + timedelta(hours=24)
+        account.save()
+
+        # Queue password reset email, sent when the token is saved
+        reset_url = f"/auth/reset-password/{token}/"
+        queue_templated_email(
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=user.email,
+            subject="Reset your password",
+            template_name="accounts/email/password_reset",
+            context_dict={"reset_url": reset_url, "user": user},
+        )
+    logger.info(f"Password reset email queued for {email}")
+    return True
+
+
+def queue_once(queue, email):
+    """
+    Call queue(email), unless it was called for the same email address
+    within settings.EMAIL_COALESCE_WINDOW seconds.
+
+    The lock is a cache.add, a SET NX with expiry in Redis. Returns whether
+    queue was called. Suppressed requests are counted per queue function,
+    see suppressed_count and the email_coalescing command. When queueing
+    fails the lock is released, so a retry isn't suppressed.
+
+    The key is the exact address queue looks up, so a request for a
+    differently cased address doesn't suppress the user's own.
+    """
+    key = f"coalesce:{queue.__name__}:{email}"
+    if cache.add(key, True, timeout=settings.EMAIL_COALESCE_WINDOW):
+        try:
+            queue(email)
+        except Exception:
+            logger.exception(f"Failed to {queue.__name__} for {email}")
+            cache.delete(key)
+            raise
+        return True
+    counter = f"coalesce:suppressed:{queue.__name__}"
+    cache.add(counter, 0, timeout=None)
+    suppressed = cache.incr(counter)
+    logger.info(
+        f"Suppressed repeated {queue.__name__} for {email}, "
+        f"{suppressed} suppressed so far"
+    )
+    return False
+
+
+def suppressed_count(queue):
+    """The number of requests for queue suppressed by queue_once."""
+    return cache.get(f"coalesce:suppressed:{queue.__name__}", 0)
@@ -0,0 +1,23 @@
+"""
+Show how many verification and password reset email requests queue_once
+suppressed, because the same address was queued within
+EMAIL_COALESCE_WINDOW seconds.
+
+    python manage.py email_coalescing
+"""
+
+from django.core.management.base import BaseCommand
+
+from accounts.emails import (
+    queue_verification_email,
+    queue_password_reset_email,
+    suppressed_count,
+)
+
+
+class Command(BaseCommand):
+    help = "Show the number of suppressed repeated email requests"
+
+    def handle(self, *args, **options):
+        for queue in [queue_verification_email, queue_password_reset_email]:
+            self.stdout.write(f"{queue.__name__}: {suppressed_count(queue)}")
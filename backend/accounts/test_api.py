@@ -1,15 +1,25 @@
-from django.test import TestCase
+import io
+import time
+
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
 from unittest.mock import patch
 
+from service.models import Outbox
+
 from .models import Account
+from .emails import queue_password_reset_email, suppressed_count
 
 
 class AccountsAPITestCase(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
         self.user = User.objects.create_user(
             username="test@example.com",
@@ -19,8 +29,11 @@ class AccountsAPITestCase(TestCase):
         )
         self.account = Account.objects.get(user=self.user)
 
-    @patch("accounts.tasks.send_verification_email.delay")
-    def test_signup_api(self, mock_send_email):
+    def queued(self):
+        """The addresses of the emails in the outbox"""
+        return [email.to[0] for email in Outbox.objects.order_by("id")]
+
+    def test_signup_api(self):
         """Test user signup via API"""
         url = reverse("accounts_api:signup")
         data = {
@@ -41,8 +54,10 @@ class AccountsAPITestCase(TestCase):
             user.is_active
         )  # Should be inactive until email verification
 
-        # Check verification email was sent
-        mock_send_email.assert_called_once_with("new@example.com")
+        # Check verification email was queued, with the new token
+        email = Outbox.objects.get()
+        self.assertEqual(email.to, ["new@example.com"])
+        self.assertIn(user.account.email_verification_token, email.body)
 
     def test_signup_api_password_mismatch(self):
         """Test signup with mismatched passwords"""
@@ -151,8 +166,7 @@ class AccountsAPITestCase(TestCase):
         # DRF returns 403 for permission denied, not 401
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
-    @patch("accounts.tasks.send_verification_email.delay")
-    def test_resend_verification_api(self, mock_send_email):
+    def test_resend_verification_api(self):
         """Test resending verification email via API"""
         # Make sure user is inactive
         self.user.is_active = False
@@ -164,10 +178,9 @@ class AccountsAPITestCase(TestCase):
         response = self.client.post(url, data, format="json")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn("message", response.data)
-        mock_send_email.assert_called_once_with("test@example.com")
+        self.assertEqual(self.queued(), ["test@example.com"])
 
-    @patch("accounts.tasks.send_password_reset_email.delay")
-    def test_forgot_password_api(self, mock_send_email):
+    def test_forgot_password_api(self):
         """Test forgot password via API"""
         url = reverse("accounts_api:forgot_password")
         data = {"email": "test@example.com"}
@@ -175,7 +188,49 @@ class AccountsAPITestCase(TestCase):
         response = self.client.post(url, data, format="json")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn("message", response.data)
-        mock_send_email.assert_called_once_with("test@example.com")
+        self.assertEqual(self.queued(), ["test@example.com"])
+
+    def test_forgot_password_api_coalesced(self):
+        """Test that repeated requests within the window are suppressed"""
+        url = reverse("accounts_api:forgot_password")
+        for email in ["test@example.com", "test@example.com", "x@example.com"]:
+            response = self.client.post(url, {"email": email}, format="json")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.queued(), ["test@example.com"])
+        self.assertEqual(suppressed_count(queue_password_reset_email), 1)
+        out = io.StringIO()
+        call_command("email_coalescing", stdout=out)
+        self.assertIn("queue_password_reset_email: 1", out.getvalue())
+
+    def test_forgot_password_api_other_case(self):
+        """Test that another casing doesn't suppress the user's address"""
+        url = reverse("accounts_api:forgot_password")
+        for email in ["Test@Example.com", "test@example.com"]:
+            self.client.post(url, {"email": email}, format="json")
+        self.assertEqual(self.queued(), ["test@example.com"])
+        self.assertEqual(suppressed_count(queue_password_reset_email), 0)
+
+    @patch("accounts.emails.queue_templated_email")
+    def test_forgot_password_api_retry_after_failure(self, mock_queue):
+        """Test that a request that failed to queue isn't coalesced"""
+        mock_queue.side_effect = [DatabaseError, None]
+        url = reverse("accounts_api:forgot_password")
+        data = {"email": "test@example.com"}
+        for _ in range(2):
+            response = self.client.post(url, data, format="json")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(mock_queue.call_count, 2)
+        self.assertEqual(suppressed_count(queue_password_reset_email), 0)
+
+    @override_settings(EMAIL_COALESCE_WINDOW=0.01)
+    def test_forgot_password_api_after_window(self):
+        url = reverse("accounts_api:forgot_password")
+        data = {"email": "test@example.com"}
+        self.client.post(url, data, format="json")
+        time.sleep(0.02)
+        self.client.post(url, data, format="json")
+        self.assertEqual(self.queued(), ["test@example.com"] * 2)
+        self.assertEqual(suppressed_count(queue_password_reset_email), 0)
 
     def test_verify_email_api_success(self):
         """Test email verification via API"""
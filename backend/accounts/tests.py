@@ -1,15 +1,18 @@
 from datetime import timedelta
-from unittest.mock import patch
 
 from django.test import TestCase, Client
+from django.core.cache import cache
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.contrib.messages import get_messages
 
+from service.models import Outbox
+
 
 class AccountViewsTest(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = Client()
         self.active_user = User.objects.create_user(
             username="active@example.com",
@@ -38,8 +41,7 @@ class AccountViewsTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, "accounts/signup.html")
 
-    @patch("accounts.tasks.send_verification_email.delay")
-    def test_signup_view_post_success(self, mock_send_email):
+    def test_signup_view_post_success(self):
         data = {
             "email": "new@example.com",
             "password1": "newpass123",
@@ -51,7 +53,7 @@ class AccountViewsTest(TestCase):
         self.assertTrue(User.objects.filter(email="new@example.com").exists())
         messages = list(get_messages(response.wsgi_request))
         self.assertIn("Account created successfully", str(messages[0]))
-        mock_send_email.assert_called_once()
+        self.assertEqual(Outbox.objects.get().to, ["new@example.com"])
 
     def test_signin_view_success(self):
         data = {"username": "active@example.com", "password": "testpass123"}
@@ -82,15 +84,15 @@ class AccountViewsTest(TestCase):
         messages = list(get_messages(response.wsgi_request))
         self.assertIn("Invalid verification link", str(messages[0]))
 
-    @patch("accounts.tasks.send_password_reset_email.delay")
-    def test_forgot_password_view(self, mock_send_email):
+    def test_forgot_password_view(self):
         response = self.client.post(
-            reverse("accounts:forgot_password"), {"email": "test@example.com"}
+            reverse("accounts:forgot_password"),
+            {"email": "active@example.com"},
         )
         self.assertRedirects(response, reverse("accounts:signin"))
         messages = list(get_messages(response.wsgi_request))
         self.assertIn("If an account with that email exists", str(messages[0]))
-        mock_send_email.assert_called_once_with("test@example.com")
+        self.assertEqual(Outbox.objects.get().to, ["active@example.com"])
 
     def test_reset_password_view_success(self):
         # Set up reset token
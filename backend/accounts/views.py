@@ -17,6 +17,7 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.db import transaction
 from django.utils import timezone
 from django.conf import settings
 
@@ -27,7 +28,11 @@ from .forms import (
     SetNewPasswordForm,
 )
 from .models import Account
-from .tasks import send_verification_email, send_password_reset_email
+from .emails import (
+    queue_verification_email,
+    queue_password_reset_email,
+    queue_once,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -37,12 +42,14 @@ def signup_view(request):
     if request.method == "POST":
         form = UserSignUpForm(request.POST)
         if form.is_valid():
-            user = form.save(commit=False)
-            user.is_active = False  # Deactivate until email verification
-            user.save()
-
-            # Send verification email
-            send_verification_email.delay(user.email)
+            with transaction.atomic():
+                user = form.save(commit=False)
+                # Deactivate until email verification
+                user.is_active = False
+                user.save()
+
+                # Queue verification email, with the new user
+                queue_verification_email(user.email)
             messages.success(
                 request,
                 "Account created successfully! Please check your email to "
@@ -129,7 +136,7 @@ def resend_verification_view(request):
     if request.method == "POST":
         email = request.POST.get("email")
         if email:
-            send_verification_email.delay(email)
+            queue_once(queue_verification_email, email)
             messages.success(
                 request,
                 "If an account exists with that email, a verification link "
@@ -147,7 +154,7 @@ def forgot_password_view(request):
         form = ForgotPasswordForm(request.POST)
         if form.is_valid():
             email = form.cleaned_data["email"]
-            send_password_reset_email.delay(email)
+            queue_once(queue_password_reset_email, email)
             messages.success(
                 request,
                 "If an account with that email exists, a password reset link "
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from ordered_model.admin import OrderedInlineModelAdminMixin
 
-from .models import DrawType, Prize, Draw, Ballot
+from .models import DrawType, Prize, Draw, DrawResult, Ballot
 
 
 class PrizeInline(admin.TabularInline):
@@ -37,10 +37,24 @@ class BallotInline(admin.TabularInline):
     )
 
 
+class DrawResultInline(admin.StackedInline):
+    model = DrawResult
+    readonly_fields = (
+        "state",
+        "winners",
+        "dispatched",
+        "emails_sent",
+        "emails_failed",
+        "created",
+        "updated",
+    )
+    can_delete = False
+
+
 @admin.register(Draw)
 class DrawAdmin(admin.ModelAdmin):
     list_display = ("date", "drawtype", "closed")
     list_filter = ("drawtype", "closed")
     search_fields = ("date",)
     date_hierarchy = "date"
-    inlines = [BallotInline]
+    inlines = [DrawResultInline, BallotInline]
@@ -18,6 +18,16 @@ urlpatterns = [
         api_views.DrawDetailView.as_view(),
         name="draw_detail",
     ),
+    path(
+        "draws/<int:pk>/ballots/",
+        api_views.DrawBallotsView.as_view(),
+        name="draw_ballots",
+    ),
+    path(
+        "draws/<int:pk>/winners/",
+        api_views.DrawWinnersView.as_view(),
+        name="draw_winners",
+    ),
     path("stats/", api_views.LotteryStatsView.as_view(), name="lottery_stats"),
     # User-specific endpoints (authentication required)
     path(
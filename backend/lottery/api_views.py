@@ -1,9 +1,23 @@
+import json
+import functools
+from urllib.parse import urlencode
+
 from rest_framework import status, generics
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Prefetch, Q
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date
 from drf_spectacular.utils import (
     extend_schema,
     OpenApiParameter,
@@ -12,20 +26,170 @@ from drf_spectacular.utils import (
 from drf_spectacular.types import OpenApiTypes
 
 from .serializers import (
+    annotate_draws,
     DrawSerializer,
     DrawDetailSerializer,
     BallotSerializer,
     BallotPurchaseSerializer,
     UserBallotsSerializer,
+    WinnerSerializer,
+    winner_rows,
 )
-from .models import Draw, Ballot
+from . import stats, summaries
+from .models import Draw, DrawResult, Ballot
+from .prizes import version as prizes_version
+from .responses import cache_response
 from accounts.models import Account
 
 
+class DrawPagination(CursorPagination):
+    """
+    Keyset pagination on (date, id), 20 draws per page unless page_size
+    asks for fewer or more.
+    """
+
+    ordering = ("date", "id")
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
+class ClosedDrawPagination(DrawPagination):
+    ordering = ("-date", "-id")
+
+
+class WinnerPagination(CursorPagination):
+    """
+    Keyset pagination on (prize amount, ballot id) for winner_rows, the
+    highest prizes first. The cursor is the amount and ballot id of the
+    last winner on the page, so a page never skips over earlier rows,
+    not even within a prize tier of many winners.
+    """
+
+    cursor_query_param = "after"
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        after = request.query_params.get(self.cursor_query_param)
+        if after:
+            try:
+                amount, ballot_id = (int(part) for part in after.split(","))
+            except ValueError:
+                raise NotFound(self.invalid_cursor_message)
+            queryset = queryset.filter(
+                Q(prize_amount__lt=amount)
+                | Q(prize_amount=amount, id__gt=ballot_id)
+            )
+        # One extra row tells whether there is a next page.
+        rows = list(queryset[: self.page_size + 1])
+        self.last = None
+        if len(rows) > self.page_size:
+            rows = rows[: self.page_size]
+            self.last = rows[-1]
+        return rows
+
+    def get_next_link(self):
+        if self.last is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            f"{self.last['prize_amount']},{self.last['id']}",
+        )
+
+    def get_previous_link(self):
+        return None
+
+
+# Draws with a close in progress have no final results yet.
+CLOSING_STATES = [DrawResult.State.CLOSING, DrawResult.State.SELECTED]
+
+
+def final_draw_validators(request, pk, **kwargs):
+    """
+    Strong ETag and Last-Modified of the results of a closed draw, None
+    while the draw is open or being closed. Results don't change once
+    final, only prizes can still be edited, so the prize version is part
+    of the ETag.
+    """
+    closed = (
+        Draw.objects.filter(pk=pk, closed__isnull=False)
+        .exclude(result__state__in=CLOSING_STATES)
+        .values_list("closed", flat=True)
+        .first()
+    )
+    if closed is None:
+        return None, None
+    return f'"draw-{pk}-{closed.timestamp()}-{prizes_version()}"', closed
+
+
+def closed_draws_validators(request, **kwargs):
+    """
+    ETag and Last-Modified of the closed draws list, from the latest
+    close. None while a draw is being closed.
+    """
+    latest = Draw.objects.filter(closed__isnull=False).aggregate(
+        closed=Max("closed"),
+        count=Count("id"),
+        closing=Count("id", filter=Q(result__state__in=CLOSING_STATES)),
+    )
+    if latest["closed"] is None or latest["closing"]:
+        return None, None
+    etag = (
+        f'"draws-{latest["closed"].timestamp()}-{latest["count"]}'
+        f'-{prizes_version()}"'
+    )
+    return etag, latest["closed"]
+
+
+def conditional(validators, max_age):
+    """
+    Conditional GET, like django.views.decorators.http.condition, for
+    views of final results. validators(request, *args, **kwargs) returns
+    the ETag and Last-Modified, or None for both when the results aren't
+    final. When the client's validators still match, the 304 is sent
+    before the view does any work. Responses with validators are public
+    for getattr(settings, max_age) seconds, so browsers and nginx can
+    keep them and revalidate afterwards.
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            etag, last_modified = validators(request, *args, **kwargs)
+            if etag is None:
+                return view(request, *args, **kwargs)
+            timestamp = int(last_modified.timestamp())
+            response = get_conditional_response(
+                request, etag=etag, last_modified=timestamp
+            )
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response.headers["ETag"] = etag
+            response.headers["Last-Modified"] = http_date(timestamp)
+            patch_cache_control(
+                response, public=True, max_age=getattr(settings, max_age)
+            )
+            return response
+
+        return wrapper
+
+    return decorator
+
+
 @extend_schema(
     tags=["Lottery"],
     summary="List Open Draws",
-    description="Get all open draws that are available for ballot assignment",
+    description=(
+        "Get open draws that are available for ballot assignment, "
+        "by date, a page at a time"
+    ),
     responses={
         200: DrawSerializer,
         400: {
@@ -37,27 +201,30 @@ from accounts.models import Account
         },
     },
 )
+@method_decorator(cache_response("open"), name="get")
 class OpenDrawsView(generics.ListAPIView):
     """API endpoint for listing open draws"""
 
     serializer_class = DrawSerializer
     permission_classes = [AllowAny]
+    pagination_class = DrawPagination
 
     def get_queryset(self):
-        """Get open draws ordered by date"""
-        return (
+        """Get open draws, the paginator orders them by date"""
+        return annotate_draws(
             Draw.objects.filter(
                 closed__isnull=True, date__gte=timezone.now().date()
             )
-            .select_related("drawtype")
-            .order_by("date")
-        )
+        ).select_related("drawtype")
 
 
 @extend_schema(
     tags=["Lottery"],
     summary="List Closed Draws",
-    description="Get all closed draws with results and winners",
+    description=(
+        "Get closed draws with results and their top winners, newest "
+        "first, a page at a time"
+    ),
     responses={
         200: DrawDetailSerializer,
         400: {
@@ -69,21 +236,40 @@ class OpenDrawsView(generics.ListAPIView):
         },
     },
 )
+@method_decorator(
+    conditional(closed_draws_validators, "LOTTERY_LISTS_MAX_AGE"),
+    name="get",
+)
+@method_decorator(cache_response("closed"), name="get")
 class ClosedDrawsView(generics.ListAPIView):
     """API endpoint for listing closed draws"""
 
     serializer_class = DrawDetailSerializer
     permission_classes = [AllowAny]
+    pagination_class = ClosedDrawPagination
 
     def get_queryset(self):
-        """Get closed draws ordered by date (newest first)"""
-        return (
-            Draw.objects.filter(closed__isnull=False)
-            .select_related("drawtype")
-            .prefetch_related("ballots__account__user", "ballots__prize")
-            .order_by("-date")
+        """
+        Get closed draws with their summaries, the paginator orders them
+        by date (newest first)
+        """
+        return Draw.objects.filter(closed__isnull=False).select_related(
+            "drawtype", "summary"
         )
 
+    def paginate_queryset(self, queryset):
+        return summaries.attach(super().paginate_queryset(queryset))
+
+    def get_serializer_context(self):
+        """
+        Only the top winners of each draw, the others are available from
+        the winners endpoint
+        """
+        return {
+            **super().get_serializer_context(),
+            "winner_limit": settings.LOTTERY_TOP_WINNERS,
+        }
+
 
 @extend_schema(
     tags=["Lottery"],
@@ -111,14 +297,178 @@ class ClosedDrawsView(generics.ListAPIView):
         },
     },
 )
+@method_decorator(
+    conditional(final_draw_validators, "LOTTERY_RESULTS_MAX_AGE"),
+    name="get",
+)
+@method_decorator(cache_response("draw:{pk}"), name="get")
 class DrawDetailView(generics.RetrieveAPIView):
     """API endpoint for detailed draw information"""
 
     serializer_class = DrawDetailSerializer
     permission_classes = [AllowAny]
-    queryset = Draw.objects.select_related("drawtype").prefetch_related(
-        "ballots__account__user", "ballots__prize"
-    )
+
+    def get_queryset(self):
+        return Draw.objects.select_related("drawtype", "summary")
+
+    def get_object(self):
+        return summaries.attach([super().get_object()])[0]
+
+    def get_serializer_context(self):
+        """
+        Only the top winners, the others are available from the winners
+        endpoint
+        """
+        return {
+            **super().get_serializer_context(),
+            "winner_limit": settings.LOTTERY_TOP_WINNERS,
+        }
+
+
+@extend_schema(
+    tags=["Lottery"],
+    summary="List Winners of a Draw",
+    description=(
+        "Get the winners of a draw, highest prize first, a page at a time"
+    ),
+    parameters=[
+        OpenApiParameter(
+            name="pk",
+            type=OpenApiTypes.INT,
+            location=OpenApiParameter.PATH,
+            description="Draw ID",
+        ),
+    ],
+    responses={
+        200: WinnerSerializer,
+        404: {
+            "description": "Draw not found",
+            "type": "object",
+            "properties": {
+                "error": {"type": "string", "example": "Draw not found"}
+            },
+        },
+    },
+)
+@method_decorator(
+    conditional(final_draw_validators, "LOTTERY_RESULTS_MAX_AGE"),
+    name="get",
+)
+class DrawWinnersView(generics.ListAPIView):
+    """API endpoint for the winners of a draw"""
+
+    serializer_class = WinnerSerializer
+    permission_classes = [AllowAny]
+    pagination_class = WinnerPagination
+
+    def get_queryset(self):
+        """Get the winners of the draw, highest prize first"""
+        draw = get_object_or_404(Draw, pk=self.kwargs["pk"])
+        return winner_rows(draw.id)
+
+
+@extend_schema(
+    tags=["Lottery"],
+    summary="List Ballots of a Draw",
+    description=(
+        "Get the ids of the ballots assigned to a draw, in ascending order. "
+        "Pages hold at most LOTTERY_BALLOT_PAGE_SIZE ids and are streamed; "
+        "follow next to get the following page."
+    ),
+    parameters=[
+        OpenApiParameter(
+            name="pk",
+            type=OpenApiTypes.INT,
+            location=OpenApiParameter.PATH,
+            description="Draw ID",
+        ),
+        OpenApiParameter(
+            name="after",
+            type=OpenApiTypes.INT,
+            location=OpenApiParameter.QUERY,
+            description="Only ballot ids greater than this one",
+        ),
+        OpenApiParameter(
+            name="limit",
+            type=OpenApiTypes.INT,
+            location=OpenApiParameter.QUERY,
+            description="Page size, at most LOTTERY_BALLOT_PAGE_SIZE",
+        ),
+    ],
+    responses={
+        200: {
+            "description": "Page of ballot ids",
+            "type": "object",
+            "properties": {
+                "results": {
+                    "type": "array",
+                    "items": {"type": "integer"},
+                    "example": [1, 2, 3],
+                },
+                "next": {
+                    "type": "string",
+                    "nullable": True,
+                    "example": "/api/lottery/draws/1/ballots/?after=3",
+                },
+            },
+        },
+        400: {
+            "description": "Bad request",
+            "type": "object",
+            "properties": {
+                "error": {"type": "string", "example": "Invalid after"}
+            },
+        },
+        404: {
+            "description": "Draw not found",
+            "type": "object",
+            "properties": {
+                "error": {"type": "string", "example": "Draw not found"}
+            },
+        },
+    },
+)
+class DrawBallotsView(APIView):
+    """API endpoint for the ballot ids of a draw"""
+
+    permission_classes = [AllowAny]
+
+    def get(self, request, pk):
+        """Stream a page of ballot ids, keyed on the last id seen"""
+        draw = get_object_or_404(Draw, pk=pk)
+        page_size = settings.LOTTERY_BALLOT_PAGE_SIZE
+        try:
+            after = int(request.query_params.get("after", 0))
+            limit = int(request.query_params.get("limit", page_size))
+        except ValueError:
+            return Response(
+                {"error": "after and limit must be integers"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        limit = max(1, min(limit, page_size))
+        # One extra id tells whether there is a next page.
+        ids = (
+            draw.ballots.filter(id__gt=after)
+            .order_by("id")
+            .values_list("id", flat=True)[: limit + 1]
+        )
+        return StreamingHttpResponse(
+            self.stream(request, ids.iterator(), limit),
+            content_type="application/json",
+        )
+
+    def stream(self, request, ids, limit):
+        yield '{"results": ['
+        last = None
+        for n, ballot_id in enumerate(ids):
+            if n == limit:
+                query = urlencode({"after": last, "limit": limit})
+                url = request.build_absolute_uri(f"{request.path}?{query}")
+                yield f'], "next": {json.dumps(url)}}}'
+                return
+            yield f"{', ' if n else ''}{ballot_id}"
+            last = ballot_id
+        yield '], "next": null}'
 
 
 @extend_schema(
@@ -294,24 +644,30 @@ class BallotAssignmentView(APIView):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            try:
-                draw = Draw.objects.get(id=draw_id, closed__isnull=True)
-            except Draw.DoesNotExist:
-                return Response(
-                    {"error": "Invalid draw ID"},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-            # Check if ballot is already assigned
-            if ballot.draw:
-                return Response(
-                    {"error": "Ballot is already assigned to a draw"},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-            # Assign ballot to draw
-            ballot.draw = draw
-            ballot.save()
+            # Closing takes the same lock on the draw, so a ballot is
+            # either assigned before the close freezes the ballots, or
+            # refused because the draw is closed.
+            with transaction.atomic():
+                try:
+                    draw = Draw.objects.select_for_update().get(
+                        id=draw_id, closed__isnull=True
+                    )
+                except Draw.DoesNotExist:
+                    return Response(
+                        {"error": "Invalid draw ID"},
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
+
+                # Check if ballot is already assigned
+                if ballot.draw:
+                    return Response(
+                        {"error": "Ballot is already assigned to a draw"},
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
+
+                # Assign ballot to draw
+                ballot.draw = draw
+                ballot.save()
 
             return Response(
                 {"message": "Ballot assigned to draw successfully"},
@@ -359,7 +715,18 @@ class BallotDetailView(generics.RetrieveAPIView):
 
     def get_queryset(self):
         """Get ballots for the current user"""
-        return Ballot.objects.filter(account__user=self.request.user)
+        return (
+            Ballot.objects.filter(account__user=self.request.user)
+            .select_related("prize")
+            .prefetch_related(
+                Prefetch(
+                    "draw",
+                    queryset=annotate_draws(Draw.objects).select_related(
+                        "drawtype"
+                    ),
+                )
+            )
+        )
 
 
 @extend_schema(
@@ -535,6 +902,7 @@ class UserWinningsView(APIView):
         }
     },
 )
+@method_decorator(cache_response("closed"), name="get")
 class LotteryStatsView(APIView):
     """API endpoint for lottery statistics"""
 
@@ -542,57 +910,18 @@ class LotteryStatsView(APIView):
 
     def get(self, request):
         """Get public lottery statistics"""
-        total_draws = Draw.objects.count()
+        totals = stats.get()
+        # Which draws are open changes with the date, it isn't rolled up.
         open_draws = Draw.objects.filter(
             closed__isnull=True, date__gte=timezone.now().date()
         ).count()
-        closed_draws = Draw.objects.filter(closed__isnull=False).count()
-
-        # Total prizes awarded
-        total_prizes_awarded = Ballot.objects.filter(
-            prize__isnull=False
-        ).count()
-        total_amount_awarded = sum(
-            ballot.prize.amount
-            for ballot in Ballot.objects.filter(prize__isnull=False)
-        )
-
-        # Recent winners (last 5 closed draws)
-        recent_draws = Draw.objects.filter(closed__isnull=False).order_by(
-            "-date"
-        )[:5]
-        recent_winners = []
-        for draw in recent_draws:
-            draw_winners = []
-            for ballot in draw.ballots.filter(
-                prize__isnull=False
-            ).select_related("account__user", "prize"):
-                draw_winners.append(
-                    {
-                        "name": ballot.account.user.last_name,
-                        "prize_name": ballot.prize.name,
-                        "prize_amount": ballot.prize.amount,
-                    }
-                )
-            if draw_winners:
-                recent_winners.append(
-                    {
-                        "draw": {
-                            "id": draw.id,
-                            "drawtype_name": draw.drawtype.name,
-                            "date": draw.date,
-                        },
-                        "winners": draw_winners,
-                    }
-                )
-
         return Response(
             {
-                "total_draws": total_draws,
+                "total_draws": totals.total_draws,
                 "open_draws": open_draws,
-                "closed_draws": closed_draws,
-                "total_prizes_awarded": total_prizes_awarded,
-                "total_amount_awarded": total_amount_awarded,
-                "recent_winners": recent_winners,
+                "closed_draws": totals.closed_draws,
+                "total_prizes_awarded": totals.total_prizes_awarded,
+                "total_amount_awarded": totals.total_amount_awarded,
+                "recent_winners": stats.recent_winners(),
             }
         )
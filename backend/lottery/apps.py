@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class LotteryConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "lottery"
+
+    def ready(self):
+        # Connect the prize and response cache invalidation, and the
+        # statistics rollup.
+        from . import prizes, responses, stats  # noqa: F401
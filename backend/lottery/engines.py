@@ -0,0 +1,263 @@
+"""
+Winner selection for closing a lottery draw.
+
+An engine is a function engine(draw, k, rng) that returns up to k ids
+of winning ballots of the draw, in random order. The first id wins the
+first (highest) prize, the second id the second prize, and so on.
+
+- expand_prizes
+- select_winners
+- replay_winners
+- assign_prizes
+
+For closing a draw on several workers, partition_ranges splits the
+draw's ballots into id ranges, partition_candidates draws the candidates
+of one range, and merge_candidates combines them into the winners. Each
+range is keyed from the draw's seed, so a partitioned close is replayed
+from the seed and the ranges in its DrawResult.
+"""
+
+import heapq
+import bisect
+import itertools
+import collections
+import random
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Count, F, Max, Min, Window
+from django.db.models.functions import RowNumber
+
+from .models import Ballot
+from .prizes import prizes
+from .snapshots import open_snapshot
+from .vectorized import numpy_engine
+
+
+# Upper bound on the number of candidate ids checked in one query.
+SAMPLE_BATCH_SIZE = 5000
+
+# DrawResult.engine for draws closed in partitions by a chord.
+PARTITIONED = "partitioned"
+
+
+def expand_prizes(draw):
+    """One entry per prize to give out, highest prize first."""
+    return [p for p in prizes.get(draw.drawtype_id) for _ in range(p.number)]
+
+
+def sample_engine(draw, k, rng):
+    """
+    Pick k ballots by sampling random ids over the draw's id range.
+
+    Candidate ids that are not a ballot of this draw (gaps, or ballots
+    of other draws) are rejected, so every ballot has the same chance.
+    Only the candidates are fetched, the ballot set is never sorted.
+
+    The ballots are only counted when that is cheap: when the id range
+    is small, or when the sample shows fewer ballots than prizes.
+    Otherwise the rejection rate is estimated from the sample so far.
+    """
+    ballots = draw.ballots.all()
+    bounds = ballots.aggregate(low=Min("id"), high=Max("id"))
+    low, high = bounds["low"], bounds["high"]
+    if low is None:
+        return []
+
+    span = high - low + 1
+    count = ballots.count() if span <= SAMPLE_BATCH_SIZE else None
+    seen = set()
+    hits = 0
+    winners = []
+    while len(winners) < k and len(seen) < span:
+        if count is None and seen and hits * span < k * len(seen):
+            count = ballots.count()
+        if count is not None and count <= k:
+            # Everybody wins, no need for sampling.
+            winners = list(ballots.values_list("id", flat=True))
+            rng.shuffle(winners)
+            return winners
+        missing = k - len(winners)
+        # Oversample by the expected rejection rate, a full batch while
+        # there is nothing to estimate it from.
+        if count is not None:
+            expected = missing * span / count
+        elif hits:
+            expected = missing * len(seen) / hits
+        else:
+            expected = SAMPLE_BATCH_SIZE
+        size = min(
+            span - len(seen), int(expected * 1.25) + 16, SAMPLE_BATCH_SIZE
+        )
+        candidates = set(rng.sample(range(low, high + 1), size)) - seen
+        seen |= candidates
+        found = list(
+            ballots.filter(id__in=candidates).values_list("id", flat=True)
+        )
+        hits += len(found)
+        # Query results come back in index order; shuffle before taking
+        # a subset so the pick stays uniform.
+        rng.shuffle(found)
+        winners.extend(found[:missing])
+    return winners
+
+
+def snapshot_engine(draw, k, rng):
+    """
+    Pick k ballots from the frozen ballot snapshot of the draw.
+
+    Positions in the snapshot are sampled without replacement, the
+    ballots table isn't queried at all.
+    """
+    with open_snapshot(draw.result) as ballot_ids:
+        count = len(ballot_ids)
+        return [ballot_ids[i] for i in rng.sample(range(count), min(k, count))]
+
+
+def account_engine(draw, k, rng):
+    """
+    Pick k ballots from per-account ballot counts.
+
+    Ballots of one account only differ by id, so the draw is done on
+    one row per account: k positions out of all ballots are sampled and
+    mapped to accounts through the cumulative counts, which is a
+    multivariate hypergeometric draw. Only then each win is mapped to a
+    concrete ballot, the account's lowest ids first.
+    """
+    counts = list(
+        draw.ballots.values_list("account_id")
+        .annotate(count=Count("id"))
+        .order_by("account_id")
+    )
+    bounds = list(itertools.accumulate(count for _, count in counts))
+    total = bounds[-1] if bounds else 0
+    winning_accounts = [
+        counts[bisect.bisect_right(bounds, position)][0]
+        for position in rng.sample(range(total), min(k, total))
+    ]
+    wins = collections.Counter(winning_accounts)
+    if not wins:
+        return []
+    ballots = collections.defaultdict(list)
+    for account_id, ballot_id in (
+        draw.ballots.filter(account_id__in=wins)
+        .annotate(
+            number=Window(
+                RowNumber(), partition_by=F("account_id"), order_by="id"
+            )
+        )
+        .filter(number__lte=max(wins.values()))
+        .values_list("account_id", "id")
+        .order_by("account_id", "id")
+    ):
+        ballots[account_id].append(ballot_id)
+    # The n-th win of an account goes to its n-th ballot.
+    taken = collections.Counter()
+    winners = []
+    for account_id in winning_accounts:
+        winners.append(ballots[account_id][taken[account_id]])
+        taken[account_id] += 1
+    return winners
+
+
+ENGINES = {
+    "sample": sample_engine,
+    "snapshot": snapshot_engine,
+    "numpy": numpy_engine,
+    "accounts": account_engine,
+}
+
+# Engines that select from a snapshot taken when the draw is closed.
+SNAPSHOT_ENGINES = {"snapshot", "numpy"}
+
+
+def select_winners(draw, k, engine=None, rng=None):
+    """
+    Returns up to k winning ballot ids of the draw, in random order.
+
+    The engine defaults to settings.LOTTERY_DRAW_ENGINE.
+    """
+    name = engine or settings.LOTTERY_DRAW_ENGINE
+    try:
+        engine = ENGINES[name]
+    except KeyError:
+        raise ImproperlyConfigured(f"Unknown lottery draw engine {name!r}")
+    if k <= 0:
+        return []
+    return engine(draw, k, rng or random.SystemRandom())
+
+
+def replay_winners(result):
+    """Select the winners of a closed draw again, from its DrawResult."""
+    if result.engine == PARTITIONED:
+        k = len(result.winners)
+        return merge_candidates(
+            (
+                partition_candidates(result.draw_id, low, high, k, result.seed)
+                for low, high in result.partitions
+            ),
+            k,
+        )
+    return select_winners(
+        result.draw,
+        len(result.winners),
+        engine=result.engine,
+        rng=random.Random(result.seed),
+    )
+
+
+def partition_ranges(draw, partitions):
+    """Split the ballot ids of the draw in at most `partitions` ranges."""
+    bounds = draw.ballots.aggregate(low=Min("id"), high=Max("id"))
+    low, high = bounds["low"], bounds["high"]
+    if low is None:
+        return []
+    size = -(-(high - low + 1) // partitions)
+    return [
+        (start, min(start + size - 1, high))
+        for start in range(low, high + 1, size)
+    ]
+
+
+def keyed_candidates(ballot_ids, k, rng):
+    """
+    Give each ballot a uniform random key and keep the k lowest keys.
+
+    The k lowest keys over all partitions are a uniform random sample of
+    the whole draw, so partitions can be processed independently.
+    """
+    return heapq.nsmallest(k, ((rng.random(), b) for b in ballot_ids))
+
+
+def partition_candidates(draw_id, low, high, k, seed):
+    """
+    The keyed candidates of the ballots of a draw in an id range.
+
+    The keys are drawn from the seed and the range, in id order, so the
+    same range of a closed draw always gives the same candidates.
+    """
+    ballot_ids = (
+        Ballot.objects.filter(draw_id=draw_id, id__gte=low, id__lte=high)
+        .order_by("id")
+        .values_list("id", flat=True)
+        .iterator(chunk_size=10_000)
+    )
+    return keyed_candidates(ballot_ids, k, random.Random(f"{seed}:{low}"))
+
+
+def merge_candidates(partitions, k):
+    """Combine keyed candidates of all partitions into k winner ids."""
+    candidates = heapq.nsmallest(
+        k, (tuple(c) for c in itertools.chain.from_iterable(partitions))
+    )
+    return [ballot_id for key, ballot_id in candidates]
+
+
+def assign_prizes(prizes, winner_ids):
+    """Write all prize assignments with a single bulk update."""
+    ballots = [
+        Ballot(id=ballot_id, prize=prize)
+        for prize, ballot_id in zip(prizes, winner_ids)
+    ]
+    Ballot.objects.bulk_update(ballots, ["prize"])
+    return len(ballots)
@@ -0,0 +1,224 @@
+"""
+Benchmark closing a draw, phase by phase.
+
+Generates synthetic accounts and ballots with bulk inserts, then times
+each phase of closing a draw and counts its queries. Everything is
+rolled back afterwards. The results are written as JSON, so they can be
+compared between commits:
+
+    python manage.py bench_close --accounts 10000 --ballots 1000000 \\
+        --output bench-$(git rev-parse --short HEAD).json
+
+Runs on whatever database is configured, SQLite or Postgres. Winner
+emails are queued in the outbox, then sent from it to the locmem email
+backend chunk by chunk in this process, inside the transaction, instead
+of through the workers.
+"""
+
+import json
+import time
+import random
+import secrets
+import platform
+import subprocess
+from datetime import date
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from accounts.models import Account
+from lottery.engines import (
+    ENGINES,
+    SNAPSHOT_ENGINES,
+    expand_prizes,
+    select_winners,
+    assign_prizes,
+)
+from lottery.models import DrawType, Prize, Draw, DrawResult, Ballot
+from lottery.snapshots import write_snapshot, snapshot_path
+from lottery.tasks import (
+    queue_winner_emails,
+    winner_chunks,
+    send_lottery_winner_chunk,
+    record_winner_emails,
+)
+
+
+BATCH_SIZE = 10_000
+
+
+class Command(BaseCommand):
+    help = "Benchmark closing a draw with synthetic ballots"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--accounts", type=int, default=1000)
+        parser.add_argument("--ballots", type=int, default=100_000)
+        parser.add_argument(
+            "--prizes",
+            type=int,
+            nargs="+",
+            default=[1, 10, 100],
+            help="Number of winners per prize tier",
+        )
+        parser.add_argument(
+            "--engine",
+            choices=sorted(ENGINES),
+            default=settings.LOTTERY_DRAW_ENGINE,
+        )
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument("--output", help="JSON file, default stdout")
+
+    def handle(self, *args, **options):
+        self.phases = {}
+        rng = random.Random(options["seed"])
+        with transaction.atomic():
+            with self.phase("setup"):
+                draw = self.generate(options, rng)
+            with override_settings(
+                EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend"
+            ):
+                result = self.close(draw, options["engine"], rng)
+            transaction.set_rollback(True)
+        if result.snapshot:
+            snapshot_path(result.snapshot).unlink(missing_ok=True)
+
+        results = {
+            "commit": self.commit(),
+            "python": platform.python_version(),
+            "database": connection.vendor,
+            "engine": options["engine"],
+            "accounts": options["accounts"],
+            "ballots": options["ballots"],
+            "winners": sum(options["prizes"]),
+            "timestamp": timezone.now().isoformat(),
+            "phases": self.phases,
+        }
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+        else:
+            self.stdout.write(json.dumps(results, indent=2))
+
+    def generate(self, options, rng):
+        """Bulk insert the accounts, ballots and prizes of a draw."""
+        run = secrets.token_hex(4)
+        users = User.objects.bulk_create(
+            (
+                User(
+                    username=f"bench-{run}-{i}@example.com",
+                    email=f"bench-{run}-{i}@example.com",
+                    last_name=f"Bench {i}",
+                    password="!",
+                )
+                for i in range(options["accounts"])
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        if connection.features.can_return_rows_from_bulk_insert:
+            user_ids = [user.id for user in users]
+        else:
+            user_ids = User.objects.filter(
+                username__startswith=f"bench-{run}-"
+            ).values_list("id", flat=True)
+        Account.objects.bulk_create(
+            (Account(user_id=user_id) for user_id in user_ids),
+            batch_size=BATCH_SIZE,
+        )
+        account_ids = list(
+            Account.objects.filter(user_id__in=user_ids).values_list(
+                "id", flat=True
+            )
+        )
+        drawtype = DrawType.objects.create(name=f"Benchmark {run}")
+        Prize.objects.bulk_create(
+            Prize(
+                name=f"Tier {tier}",
+                amount=10 ** (len(options["prizes"]) - tier),
+                number=number,
+                drawtype=drawtype,
+            )
+            for tier, number in enumerate(options["prizes"])
+        )
+        draw = Draw.objects.create(drawtype=drawtype, date=date(1900, 1, 1))
+        Ballot.objects.bulk_create(
+            (
+                Ballot(draw=draw, account_id=rng.choice(account_ids))
+                for _ in range(options["ballots"])
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        return draw
+
+    def close(self, draw, engine, rng):
+        """The phases of close_lottery_draw, one by one."""
+        seed = rng.getrandbits(63)
+        draw.closed = timezone.now()
+        draw.save()
+        result = DrawResult.objects.create(draw=draw, engine=engine, seed=seed)
+        with self.phase("prize_expansion"):
+            prizes = expand_prizes(draw)
+        if engine in SNAPSHOT_ENGINES:
+            with self.phase("snapshot"):
+                (
+                    result.snapshot,
+                    result.snapshot_count,
+                    result.snapshot_sha256,
+                ) = write_snapshot(draw)
+                result.save()
+        with self.phase("selection"):
+            winners = select_winners(
+                draw, len(prizes), engine=engine, rng=random.Random(seed)
+            )
+        with self.phase("writes"):
+            assign_prizes(prizes, winners)
+        with self.phase("email_queue"):
+            outbox_ids = queue_winner_emails(draw)
+        with self.phase("email_fanout"):
+            # The chunk tasks, as the chord runs them on the workers.
+            record_winner_emails(
+                [
+                    send_lottery_winner_chunk(draw.id, chunk)
+                    for chunk in winner_chunks(outbox_ids)
+                ],
+                draw.id,
+            )
+        return result
+
+    def phase(self, name):
+        return Phase(self.phases, name)
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "HEAD"],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+
+class Phase:
+    """Times a block and counts its queries into phases[name]."""
+
+    def __init__(self, phases, name):
+        self.phases = phases
+        self.name = name
+        self.queries = CaptureQueriesContext(connection)
+
+    def __enter__(self):
+        self.queries.__enter__()
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        self.queries.__exit__(*exc_info)
+        self.phases[self.name] = {
+            "seconds": round(elapsed, 6),
+            "queries": len(self.queries),
+        }
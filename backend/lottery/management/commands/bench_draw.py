@@ -0,0 +1,131 @@
+"""
+Benchmark winner selection for closing a draw.
+
+Creates synthetic draws with the given numbers of ballots, times
+selecting and assigning k winners with each engine, and rolls everything
+back. With the sample engine the time should grow with the number of
+winners, not with the number of ballots.
+
+    python manage.py bench_draw --ballots 10000 100000 --winners 10 1000
+    python manage.py bench_draw --engine sample numpy
+
+For each number of winners k the draw type gets three prize tiers that
+add up to exactly k. With --baseline the original close path is timed
+as well: expanding the prizes, ordering the ballots randomly in the
+database and saving each winning ballot.
+
+    python manage.py bench_draw --baseline --engine numpy \
+        --ballots 10000 1000000 10000000
+"""
+
+import time
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts.models import Account
+from lottery.engines import (
+    ENGINES,
+    SNAPSHOT_ENGINES,
+    select_winners,
+    assign_prizes,
+)
+from lottery.models import DrawType, Prize, Draw, DrawResult, Ballot
+from lottery.snapshots import write_snapshot
+
+
+class Command(BaseCommand):
+    help = "Benchmark winner selection for closing a draw"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ballots", type=int, nargs="+", default=[10_000, 100_000]
+        )
+        parser.add_argument(
+            "--winners", type=int, nargs="+", default=[10, 100, 1000]
+        )
+        parser.add_argument(
+            "--engine", choices=sorted(ENGINES), nargs="+", default=["sample"]
+        )
+        parser.add_argument("--baseline", action="store_true")
+        parser.add_argument("--seed", type=int, default=None)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        self.stdout.write(
+            f"{'engine':>10} {'ballots':>12} {'winners':>8} {'seconds':>10}"
+        )
+        with transaction.atomic():
+            user = User.objects.create(username="bench_draw@example.com")
+            account = Account.objects.get(user=user)
+            drawtype = DrawType.objects.create(name="Benchmark")
+            tiers = {
+                k: self.prize_tiers(drawtype, k) for k in options["winners"]
+            }
+            for n, count in enumerate(options["ballots"]):
+                draw = Draw.objects.create(
+                    drawtype=drawtype,
+                    date=date(1900, 1, 1) + timedelta(days=n),
+                )
+                Ballot.objects.bulk_create(
+                    (Ballot(draw=draw, account=account) for _ in range(count)),
+                    batch_size=10_000,
+                )
+                if SNAPSHOT_ENGINES.intersection(options["engine"]):
+                    self.snapshot(draw)
+                for k, prizes in tiers.items():
+                    if options["baseline"]:
+                        start = time.perf_counter()
+                        self.orm_close(draw, prizes)
+                        self.report("orm", count, k, start)
+                        draw.ballots.update(prize=None)
+                    for engine in options["engine"]:
+                        start = time.perf_counter()
+                        expanded = [p for p in prizes for _ in range(p.number)]
+                        winners = select_winners(
+                            draw, len(expanded), engine=engine, rng=rng
+                        )
+                        assign_prizes(expanded, winners)
+                        self.report(engine, count, k, start)
+                        draw.ballots.update(prize=None)
+            transaction.set_rollback(True)
+
+    def snapshot(self, draw):
+        start = time.perf_counter()
+        name, count, checksum = write_snapshot(draw)
+        DrawResult.objects.create(
+            draw=draw,
+            snapshot=name,
+            snapshot_count=count,
+            snapshot_sha256=checksum,
+        )
+        self.report("snapshot", count, 0, start)
+
+    def prize_tiers(self, drawtype, k):
+        """Three prize tiers for k winners, the numbers adding up to k."""
+        numbers = [k // 3 + (tier < k % 3) for tier in range(3)]
+        return [
+            Prize.objects.create(
+                name=f"Benchmark {k} {tier}",
+                amount=3 - tier,
+                number=number,
+                drawtype=drawtype,
+            )
+            for tier, number in enumerate(numbers)
+            if number
+        ]
+
+    def orm_close(self, draw, prizes):
+        """Award the prizes as close_lottery_draw originally did."""
+        expanded = [p for p in prizes for _ in range(p.number)]
+        ballots = draw.ballots.all().order_by("?")
+        for prize, ballot in zip(expanded, ballots):
+            ballot.prize = prize
+            ballot.save()
+
+    def report(self, engine, count, k, start):
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"{engine:>10} {count:>12} {k:>8} {elapsed:>10.4f}")
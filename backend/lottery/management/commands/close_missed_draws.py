@@ -0,0 +1,34 @@
+"""
+Close all draws up to today that were not closed, for example because
+the beat scheduler was down.
+
+    python manage.py close_missed_draws [--until 2025-07-28] [--workers 4]
+"""
+
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from lottery.tasks import close_draws_until
+
+
+class Command(BaseCommand):
+    help = "Close all draws up to today that were not closed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--until", type=datetime.date.fromisoformat)
+        parser.add_argument("--workers", type=int)
+
+    def handle(self, *args, **options):
+        until = options["until"] or timezone.now().date()
+        closed, failed = close_draws_until(
+            until, workers=options["workers"], progress=self.progress
+        )
+        if failed:
+            raise CommandError(f"Closed {closed} draws, {failed} failed")
+        self.stdout.write(self.style.SUCCESS(f"Closed {closed} draws"))
+
+    def progress(self, done, total, draw_id, error):
+        status = f"failed: {error!r}" if error else "closed"
+        self.stdout.write(f"[{done}/{total}] draw {draw_id} {status}")
@@ -0,0 +1,24 @@
+"""
+Recount the lottery statistics rollup from all draws and ballots, for
+example after draws or prizes were changed in the admin.
+
+    python manage.py rebuild_lottery_stats
+"""
+
+from django.core.management.base import BaseCommand
+
+from lottery import stats
+
+
+class Command(BaseCommand):
+    help = "Recount the lottery statistics from all draws and ballots"
+
+    def handle(self, *args, **options):
+        totals = stats.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{totals.total_draws} draws, {totals.closed_draws} closed, "
+                f"{totals.total_prizes_awarded} prizes awarded "
+                f"for {totals.total_amount_awarded}"
+            )
+        )
@@ -0,0 +1,54 @@
+"""
+Replay the winner selection of a closed draw.
+
+Verifies the ballot snapshot against the checksum in the DrawResult
+ledger, selects the winners again with the recorded engine and seed, and
+compares them with the recorded winners. Partitioned closes are replayed
+from the recorded ballot id ranges.
+
+    python manage.py replay_draw <draw_id>
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lottery.engines import ENGINES, PARTITIONED, replay_winners
+from lottery.models import DrawResult
+from lottery.snapshots import SnapshotError
+
+
+class Command(BaseCommand):
+    help = "Replay the winner selection of a closed draw"
+
+    def add_arguments(self, parser):
+        parser.add_argument("draw_id", type=int)
+
+    def handle(self, *args, **options):
+        try:
+            result = DrawResult.objects.select_related("draw").get(
+                draw_id=options["draw_id"]
+            )
+        except DrawResult.DoesNotExist:
+            raise CommandError("Draw has no result ledger")
+        if result.state == DrawResult.State.CLOSING:
+            raise CommandError("Draw winners have not been selected yet")
+        if result.engine == PARTITIONED:
+            if not result.partitions:
+                raise CommandError(
+                    "Draw was closed in partitions that were not recorded"
+                )
+        elif result.engine not in ENGINES:
+            raise CommandError(f"Engine {result.engine!r} can't be replayed")
+        try:
+            winners = replay_winners(result)
+        except SnapshotError as e:
+            raise CommandError(str(e))
+        if winners != result.winners:
+            raise CommandError(
+                f"Replay of {result.draw} does not match the recorded winners"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Replay of {result.draw} matches "
+                f"{len(winners)} recorded winners"
+            )
+        )
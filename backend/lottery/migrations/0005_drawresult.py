@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lottery", "0004_ballot_prize_draw_closed"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DrawResult",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "state",
+                    models.CharField(
+                        choices=[
+                            ("closing", "Closing"),
+                            ("selected", "Selected"),
+                            ("done", "Done"),
+                        ],
+                        default="closing",
+                        max_length=10,
+                    ),
+                ),
+                ("winners", models.JSONField(blank=True, default=list)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("updated", models.DateTimeField(auto_now=True)),
+                (
+                    "draw",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="result",
+                        to="lottery.draw",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lottery", "0005_drawresult"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="drawresult",
+            name="engine",
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AddField(
+            model_name="drawresult",
+            name="seed",
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="drawresult",
+            name="snapshot",
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name="drawresult",
+            name="snapshot_count",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="drawresult",
+            name="snapshot_sha256",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
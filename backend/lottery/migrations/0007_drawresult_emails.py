@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lottery", "0006_drawresult_snapshot"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="drawresult",
+            name="emails_failed",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="drawresult",
+            name="emails_sent",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
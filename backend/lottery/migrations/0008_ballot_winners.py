@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0002_account_password_reset_expires_and_more"),
+        ("lottery", "0007_drawresult_emails"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="ballot",
+            index=models.Index(
+                condition=models.Q(("prize__isnull", False)),
+                fields=["draw", "prize", "account"],
+                name="ballot_winners",
+            ),
+        ),
+    ]
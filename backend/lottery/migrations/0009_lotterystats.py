@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lottery", "0008_ballot_winners"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LotteryStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("total_draws", models.IntegerField(default=0)),
+                ("closed_draws", models.IntegerField(default=0)),
+                ("total_prizes_awarded", models.IntegerField(default=0)),
+                ("total_amount_awarded", models.BigIntegerField(default=0)),
+            ],
+            options={
+                "verbose_name_plural": "lottery stats",
+            },
+        ),
+    ]
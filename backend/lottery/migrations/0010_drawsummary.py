@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+
+
+def summarize_closed_draws(apps, schema_editor):
+    """Summarize the draws that were closed before there were summaries."""
+    Draw = apps.get_model("lottery", "Draw")
+    Ballot = apps.get_model("lottery", "Ballot")
+    DrawSummary = apps.get_model("lottery", "DrawSummary")
+    draws = Draw.objects.filter(closed__isnull=False).exclude(
+        result__state__in=["closing", "selected"]
+    )
+    for draw in draws.iterator():
+        ballots = Ballot.objects.filter(draw=draw)
+        totals = ballots.aggregate(
+            ballot_count=Count("id"),
+            winner_count=Count(
+                "account", filter=Q(prize__isnull=False), distinct=True
+            ),
+            total_prize_amount=Coalesce(Sum("prize__amount"), 0),
+        )
+        winners = [
+            {
+                "name": ballot.account.user.last_name,
+                "full_name": " ".join(
+                    (
+                        ballot.account.user.first_name,
+                        ballot.account.user.last_name,
+                    )
+                ).strip(),
+                "prize_name": ballot.prize.name,
+                "prize_amount": ballot.prize.amount,
+            }
+            for ballot in ballots.filter(prize__isnull=False)
+            .select_related("account__user", "prize")
+            .order_by("-prize__amount", "id")
+        ]
+        DrawSummary.objects.create(draw=draw, winners=winners, **totals)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lottery", "0009_lotterystats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DrawSummary",
+            fields=[
+                (
+                    "draw",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="summary",
+                        serialize=False,
+                        to="lottery.draw",
+                    ),
+                ),
+                ("ballot_count", models.PositiveIntegerField(default=0)),
+                ("winner_count", models.PositiveIntegerField(default=0)),
+                ("total_prize_amount", models.BigIntegerField(default=0)),
+                ("winners", models.JSONField(blank=True, default=list)),
+            ],
+            options={
+                "verbose_name_plural": "draw summaries",
+            },
+        ),
+        migrations.RunPython(
+            summarize_closed_draws, migrations.RunPython.noop
+        ),
+    ]
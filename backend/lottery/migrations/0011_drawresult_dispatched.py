@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lottery", "0010_drawsummary"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="drawresult",
+            name="dispatched",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lottery", "0011_drawresult_dispatched"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="drawresult",
+            name="partitions",
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:10
+
+from django.db import migrations
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+
+
+def create_stats_row(apps, schema_editor):
+    """Create the rollup row, so stats.add() only ever updates it."""
+    Draw = apps.get_model("lottery", "Draw")
+    Ballot = apps.get_model("lottery", "Ballot")
+    LotteryStats = apps.get_model("lottery", "LotteryStats")
+    draws = Draw.objects.aggregate(
+        total_draws=Count("id"),
+        closed_draws=Count("id", filter=Q(closed__isnull=False)),
+    )
+    prizes = Ballot.objects.filter(prize__isnull=False).aggregate(
+        total_prizes_awarded=Count("id"),
+        total_amount_awarded=Coalesce(Sum("prize__amount"), 0),
+    )
+    LotteryStats.objects.update_or_create(pk=1, defaults={**draws, **prizes})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lottery", "0012_drawresult_partitions"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_stats_row, migrations.RunPython.noop),
+    ]
@@ -106,3 +106,106 @@ class Ballot(models.Model):
 
     class Meta:
         ordering = ("draw", "account")
+        indexes = [
+            # Finds the winning ballots of a draw, and their accounts,
+            # without scanning all of its ballots. It doesn't cover the
+            # winners list: that joins the prizes and sorts the winning
+            # rows by amount.
+            models.Index(
+                fields=["draw", "prize", "account"],
+                condition=models.Q(prize__isnull=False),
+                name="ballot_winners",
+            ),
+        ]
+
+
+class DrawResult(models.Model):
+    """
+    Ledger for closing a draw, so an interrupted close can be resumed.
+
+    closing: the draw is closed for new ballots, no winners yet. If the
+        engine needs it, the ballot snapshot is taken in this state,
+        normally ahead of the close by freeze_todays_draw. A
+        partitioned close records its ballot id ranges, and when its
+        chord was sent in dispatched.
+    selected: winners are stored, prizes are not assigned yet.
+    done: prizes are assigned, winners are being notified. The email
+        counts are filled in when all winners have been notified.
+    """
+
+    class State(models.TextChoices):
+        CLOSING = "closing"
+        SELECTED = "selected"
+        DONE = "done"
+
+    draw = models.OneToOneField(
+        Draw, on_delete=models.CASCADE, related_name="result"
+    )
+    state = models.CharField(
+        max_length=10, choices=State.choices, default=State.CLOSING
+    )
+    # Selection is reproducible from the engine, seed and snapshot, or
+    # for a partitioned close the [low, high] ballot id ranges.
+    engine = models.CharField(max_length=20, blank=True)
+    seed = models.PositiveBigIntegerField(null=True, blank=True)
+    partitions = models.JSONField(default=list, blank=True)
+    snapshot = models.CharField(max_length=100, blank=True)
+    snapshot_count = models.PositiveIntegerField(null=True, blank=True)
+    snapshot_sha256 = models.CharField(max_length=64, blank=True)
+    # Winning ballot ids, the first one wins the highest prize.
+    winners = models.JSONField(default=list, blank=True)
+    dispatched = models.DateTimeField(null=True, blank=True)
+    emails_sent = models.PositiveIntegerField(null=True, blank=True)
+    emails_failed = models.PositiveIntegerField(null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.draw}: {self.state}"
+
+
+class DrawSummary(models.Model):
+    """
+    Totals and winners of a closed draw, written when it is closed.
+
+    winners has the winning ballots, highest prize first, as dicts with
+    name (last name), full_name, prize_name and prize_amount.
+    """
+
+    draw = models.OneToOneField(
+        Draw,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name="summary",
+    )
+    ballot_count = models.PositiveIntegerField(default=0)
+    winner_count = models.PositiveIntegerField(default=0)
+    total_prize_amount = models.BigIntegerField(default=0)
+    winners = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        verbose_name_plural = "draw summaries"
+
+    def __str__(self):
+        return f"{self.draw}: {self.winner_count} winners"
+
+
+class LotteryStats(models.Model):
+    """
+    Totals over all draws, in a single row.
+
+    Creating, closing and deleting draws add to the totals. Changes made
+    around that, in the admin or the shell, are picked up by rebuilding
+    them with the rebuild_lottery_stats command.
+    """
+
+    total_draws = models.IntegerField(default=0)
+    closed_draws = models.IntegerField(default=0)
+    total_prizes_awarded = models.IntegerField(default=0)
+    total_amount_awarded = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "lottery stats"
+
+    def __str__(self):
+        return f"{self.total_draws} draws, {self.closed_draws} closed"
@@ -0,0 +1,90 @@
+"""
+Prize tables by drawtype, cached in the process.
+
+Nearly all draws share a few drawtypes, so the prizes of a drawtype are
+loaded once instead of once per draw. Saving or deleting a Prize or
+DrawType bumps a version in the shared cache; every process drops its
+tables when it sees a new version.
+
+    prizes.get(drawtype_id)         # tuple of Prize, highest prize first
+    DrawTypeCache(load).get(drawtype_id, current=version())
+
+Cached Prize instances are shared, don't modify them.
+"""
+
+import secrets
+import threading
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import DrawType, Prize
+
+
+VERSION_KEY = "lottery:prizes:version"
+
+
+def version():
+    """The current version of the prize tables."""
+    current = cache.get(VERSION_KEY)
+    if current is None:
+        cache.add(VERSION_KEY, secrets.token_hex(8), None)
+        current = cache.get(VERSION_KEY)
+    return current
+
+
+def bump_version():
+    cache.set(VERSION_KEY, secrets.token_hex(8), None)
+
+
+class DrawTypeCache:
+    """
+    Values of load(drawtype_id), kept until the prize version changes.
+    """
+
+    def __init__(self, load):
+        self.load = load
+        self.lock = threading.Lock()
+        self.version = None
+        self.values = {}
+
+    def get(self, drawtype_id, current=None):
+        """
+        The value for the drawtype. Pass the current version when it was
+        read already, for many lookups in one request.
+        """
+        current = current or version()
+        with self.lock:
+            if current != self.version:
+                self.version = current
+                self.values = {}
+            if drawtype_id in self.values:
+                return self.values[drawtype_id]
+        value = self.load(drawtype_id)
+        with self.lock:
+            if current == self.version:
+                self.values[drawtype_id] = value
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.version = None
+            self.values = {}
+
+
+prizes = DrawTypeCache(
+    lambda drawtype_id: tuple(Prize.objects.filter(drawtype_id=drawtype_id))
+)
+
+
+@receiver(post_save, sender=Prize)
+@receiver(post_delete, sender=Prize)
+@receiver(post_save, sender=DrawType)
+@receiver(post_delete, sender=DrawType)
+def invalidate_prizes(sender, **kwargs):
+    # Bump now, so this process doesn't use the old table, and again on
+    # commit, so the old rows aren't cached under the new version.
+    bump_version()
+    transaction.on_commit(bump_version)
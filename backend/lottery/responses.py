@@ -0,0 +1,139 @@
+"""
+Cache of the responses of the public lottery API views.
+
+    @method_decorator(cache_response("draw:{pk}"), name="get")
+
+Responses are cached by their absolute URL, under the generations of
+a scope in the shared cache. Changes start new generations of the scopes
+they affect, older entries are never read again and expire:
+
+- all: prizes and drawtypes, in every response.
+- open: the open draws list, changed by draws and assigned ballots.
+- closed: the closed draws list and the statistics, changed by draws
+  and draw results.
+- draw:<id>: one draw's details, changed by the draw, its result and its
+  ballots.
+
+So assigning a ballot drops the open draws list and that draw's details,
+not the results of closed draws.
+
+A request takes the generations before it reads the database. When the
+data changes while it runs, it stores its response under the old
+generations, so that response is never served after the change.
+
+Entries are fresh for LOTTERY_RESPONSE_CACHE_TIMEOUT seconds. After that
+one request recomputes an entry while the others get the stale copy for
+up to LOTTERY_RESPONSE_CACHE_STALE seconds more, see service.cache. An
+entry of an old generation is never served, stale or not; after a change
+one request recomputes it and the others wait for it.
+"""
+
+import hashlib
+import secrets
+import functools
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.response import Response
+
+from service.cache import single_flight
+from .models import DrawType, Prize, Draw, DrawResult, Ballot
+
+
+def generation_key(scope):
+    return f"lottery:responses:generation:{scope}"
+
+
+def generation(scope="all"):
+    """The generations of the scope, and of all responses."""
+    keys = [generation_key(name) for name in dict.fromkeys(("all", scope))]
+    current = cache.get_many(keys)
+    for key in keys:
+        if key not in current:
+            cache.add(key, secrets.token_hex(8), None)
+            current[key] = cache.get(key)
+    return ":".join(current[key] for key in keys)
+
+
+def next_generation(scope="all"):
+    cache.set(generation_key(scope), secrets.token_hex(8), None)
+
+
+def invalidate(*scopes):
+    """
+    Drop the cached responses of the scopes, all of them without scopes,
+    now and when the transaction commits.
+    """
+    # A request between now and the commit still reads the old rows, the
+    # second bump drops what it caches.
+    for scope in scopes or ["all"]:
+        next_generation(scope)
+        transaction.on_commit(functools.partial(next_generation, scope))
+
+
+def cache_key(request, current):
+    # Scheme and host too: responses hold absolute links built from them.
+    url = request.build_absolute_uri().encode()
+    return f"lottery:response:{current}:{hashlib.md5(url).hexdigest()}"
+
+
+def cache_response(scope):
+    """
+    Serve the view's responses from the cache, in the scope formatted
+    with the view's keyword arguments.
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = None
+
+            def compute():
+                nonlocal response
+                response = view(request, *args, **kwargs)
+                return response.status_code, response.data
+
+            status, data = single_flight(
+                cache_key(request, generation(scope.format(**kwargs))),
+                compute,
+                settings.LOTTERY_RESPONSE_CACHE_TIMEOUT,
+                settings.LOTTERY_RESPONSE_CACHE_STALE,
+            )
+            if response is None:
+                response = Response(data, status=status)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+@receiver(post_save, sender=DrawType)
+@receiver(post_delete, sender=DrawType)
+@receiver(post_save, sender=Prize)
+@receiver(post_delete, sender=Prize)
+def invalidate_responses(sender, **kwargs):
+    invalidate()
+
+
+@receiver(post_save, sender=Draw)
+@receiver(post_delete, sender=Draw)
+def invalidate_draw_responses(sender, instance, **kwargs):
+    invalidate("open", "closed", f"draw:{instance.pk}")
+
+
+@receiver(post_save, sender=DrawResult)
+def invalidate_result_responses(sender, instance, **kwargs):
+    invalidate("closed", f"draw:{instance.draw_id}")
+
+
+@receiver(post_save, sender=Ballot)
+@receiver(post_delete, sender=Ballot)
+def invalidate_ballot_responses(sender, instance, **kwargs):
+    # Unassigned ballots aren't in any public response, and ballots are
+    # only assigned to open draws.
+    if instance.draw_id is not None:
+        invalidate("open", f"draw:{instance.draw_id}")
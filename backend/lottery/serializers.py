@@ -1,6 +1,9 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.db.models import Count, F, Q, Sum, Prefetch
+from django.db.models.functions import Coalesce
 from .models import DrawType, Draw, Prize, Ballot
+from .prizes import DrawTypeCache, prizes, version as prizes_version
 
 
 class UserBasicSerializer(serializers.ModelSerializer):
@@ -29,13 +32,74 @@ class PrizeSerializer(serializers.ModelSerializer):
         fields = ["id", "name", "amount", "number", "drawtype"]
 
 
+# Serialized prizes by drawtype, shared by all draws of a drawtype.
+prize_data = DrawTypeCache(
+    lambda drawtype_id: PrizeSerializer(
+        prizes.get(drawtype_id), many=True
+    ).data
+)
+
+
+def annotate_draws(queryset):
+    """Annotate the draws with the totals that DrawSerializer reads"""
+    return queryset.annotate(
+        ballot_count=Count("ballots"),
+        winner_count=Count(
+            "ballots__account",
+            filter=Q(ballots__prize__isnull=False),
+            distinct=True,
+        ),
+        total_prize_amount=Coalesce(Sum("ballots__prize__amount"), 0),
+    )
+
+
+def winner_rows(draw_id):
+    """
+    The winners of a draw as compact rows, highest prize first.
+
+    The ballot_winners index finds the winning ballots; the ordering by
+    prize amount comes from the prize join and is sorted per query.
+    """
+    return (
+        Ballot.objects.filter(draw_id=draw_id, prize__isnull=False)
+        .values(
+            "id",
+            name=F("account__user__last_name"),
+            prize_name=F("prize__name"),
+            prize_amount=F("prize__amount"),
+        )
+        .order_by("-prize_amount", "id")
+    )
+
+
+class DrawTotalField(serializers.IntegerField):
+    """
+    A total of the draw: annotated by annotate_draws(), or else from the
+    draw's summary, see summaries.attach().
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(read_only=True, **kwargs)
+
+    def get_attribute(self, instance):
+        if hasattr(instance, self.source):
+            return getattr(instance, self.source)
+        return getattr(instance.summary, self.source)
+
+
 class DrawSerializer(serializers.ModelSerializer):
-    """Serializer for Draw model"""
+    """
+    Serializer for Draw model.
+
+    The counts and totals are annotations, use annotate_draws() on the
+    queryset, or summaries from summaries.attach().
+    """
 
     drawtype = DrawTypeSerializer(read_only=True)
+    ballot_count = DrawTotalField()
     prizes = serializers.SerializerMethodField()
-    winner_count = serializers.SerializerMethodField()
-    total_prize_amount = serializers.SerializerMethodField()
+    winner_count = DrawTotalField()
+    total_prize_amount = DrawTotalField()
 
     class Meta:
         model = Draw
@@ -44,7 +108,7 @@ class DrawSerializer(serializers.ModelSerializer):
             "drawtype",
             "date",
             "closed",
-            "ballots",
+            "ballot_count",
             "prizes",
             "winner_count",
             "total_prize_amount",
@@ -52,54 +116,46 @@ class DrawSerializer(serializers.ModelSerializer):
 
     def get_prizes(self, obj):
         """Get prizes for this draw's drawtype"""
-        return PrizeSerializer(obj.drawtype.prizes.all(), many=True).data
-
-    def get_winner_count(self, obj):
-        """Get count of unique winners"""
-        if obj.closed:
-            return (
-                obj.ballots.filter(prize__isnull=False)
-                .values("account__user")
-                .distinct()
-                .count()
-            )
-        return 0
-
-    def get_total_prize_amount(self, obj):
-        """Get total prize amount for this draw"""
-        if obj.closed:
-            return sum(
-                ballot.prize.amount
-                for ballot in obj.ballots.filter(prize__isnull=False)
-            )
-        return 0
+        # The version is read once for all draws in the response.
+        context = self.context
+        if "prizes_version" not in context:
+            context["prizes_version"] = prizes_version()
+        return prize_data.get(
+            obj.drawtype_id, current=context["prizes_version"]
+        )
+
+
+class WinnerSerializer(serializers.Serializer):
+    """Serializer for winner_rows (name and prize only)"""
+
+    name = serializers.CharField()
+    prize_name = serializers.CharField()
+    prize_amount = serializers.IntegerField()
 
 
 class DrawDetailSerializer(DrawSerializer):
-    """Detailed serializer for Draw model with winner information"""
+    """
+    Detailed serializer for Draw model with winner information.
+
+    The winners are read from the draw summaries, use summaries.attach().
+    With a winner_limit in the context, only the top winners are listed;
+    winners_url links to all of them.
+    """
 
     winners = serializers.SerializerMethodField()
+    winners_url = serializers.HyperlinkedIdentityField(
+        view_name="lottery_api:draw_winners"
+    )
 
     class Meta(DrawSerializer.Meta):
-        fields = DrawSerializer.Meta.fields + ["winners"]
+        fields = DrawSerializer.Meta.fields + ["winners", "winners_url"]
 
     def get_winners(self, obj):
         """Get winner information (name and prize amount only)"""
         if not obj.closed:
             return []
-
-        winners = []
-        for ballot in obj.ballots.filter(prize__isnull=False).select_related(
-            "account__user", "prize"
-        ):
-            winners.append(
-                {
-                    "name": ballot.account.user.last_name,
-                    "prize_name": ballot.prize.name,
-                    "prize_amount": ballot.prize.amount,
-                }
-            )
-        return winners
+        winners = obj.summary.winners[: self.context.get("winner_limit")]
+        return WinnerSerializer(winners, many=True).data
 
 
 class BallotSerializer(serializers.ModelSerializer):
@@ -164,16 +220,26 @@ class UserBallotsSerializer(serializers.Serializer):
 
     def get_unassigned_ballots(self, obj):
         """Get unassigned ballots for the user"""
-        ballots = Ballot.objects.filter(
-            account__user=obj, draw__isnull=True
-        ).order_by("-id")
+        ballots = (
+            Ballot.objects.filter(account__user=obj, draw__isnull=True)
+            .select_related("prize")
+            .order_by("-id")
+        )
         return BallotSerializer(ballots, many=True).data
 
     def get_assigned_ballots(self, obj):
         """Get assigned ballots as a flat list"""
         assigned_ballots = (
             Ballot.objects.filter(account__user=obj, draw__isnull=False)
-            .select_related("draw", "prize")
+            .select_related("prize")
+            .prefetch_related(
+                Prefetch(
+                    "draw",
+                    queryset=annotate_draws(Draw.objects).select_related(
+                        "drawtype"
+                    ),
+                )
+            )
             .order_by("-draw__date", "-id")
         )
         return BallotSerializer(assigned_ballots, many=True).data
@@ -0,0 +1,106 @@
+"""
+Ballot snapshots for closing a lottery draw.
+
+Before selecting winners, the ballot ids of a draw are frozen into a
+file of sorted native int64 values. Winner selection reads the file
+through mmap instead of querying the ballots table, and with the seed
+in the DrawResult ledger the draw can be replayed from the snapshot.
+
+- write_snapshot
+- open_snapshot
+"""
+
+import os
+import mmap
+import array
+import hashlib
+import contextlib
+from pathlib import Path
+
+from django.conf import settings
+
+
+CHUNK_SIZE = 65536
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def snapshot_path(name):
+    return Path(settings.LOTTERY_SNAPSHOT_DIR) / name
+
+
+def write_snapshot(draw):
+    """
+    Write the sorted ballot ids of the draw to a snapshot file.
+
+    Returns (name, count, sha256) to store in the DrawResult ledger.
+    """
+    name = f"draw-{draw.id}-{draw.date}.ballots"
+    path = snapshot_path(name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    checksum = hashlib.sha256()
+    count = 0
+    ballot_ids = (
+        draw.ballots.order_by("id")
+        .values_list("id", flat=True)
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "wb") as f:
+        chunk = array.array("q")
+        for ballot_id in ballot_ids:
+            chunk.append(ballot_id)
+            if len(chunk) == CHUNK_SIZE:
+                count += _write_chunk(f, chunk, checksum)
+                chunk = array.array("q")
+        count += _write_chunk(f, chunk, checksum)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return name, count, checksum.hexdigest()
+
+
+def _write_chunk(f, chunk, checksum):
+    data = chunk.tobytes()
+    f.write(data)
+    checksum.update(data)
+    return len(chunk)
+
+
+@contextlib.contextmanager
+def open_snapshot(result):
+    """
+    Map the snapshot of a DrawResult as a read-only sequence of ids.
+
+    The checksum and size are verified before the ids are handed out.
+    """
+    path = snapshot_path(result.snapshot)
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        raise SnapshotError(f"Snapshot {path} is missing")
+    with f:
+        if os.fstat(f.fileno()).st_size == 0:
+            ids = memoryview(b"").cast("q")
+            _verify(result, ids, b"")
+            yield ids
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            ids = memoryview(mapped).cast("q")
+            try:
+                _verify(result, ids, mapped)
+                yield ids
+            finally:
+                ids.release()
+
+
+def _verify(result, ids, data):
+    if len(ids) != result.snapshot_count:
+        raise SnapshotError(
+            f"Snapshot {result.snapshot} has {len(ids)} ballots, "
+            f"expected {result.snapshot_count}"
+        )
+    if hashlib.sha256(data).hexdigest() != result.snapshot_sha256:
+        raise SnapshotError(f"Snapshot {result.snapshot} checksum mismatch")
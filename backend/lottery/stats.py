@@ -0,0 +1,96 @@
+"""
+Lottery statistics, from the LotteryStats rollup.
+
+    stats.get()             # the LotteryStats row
+    stats.add(closed_draws=1, ...)
+    stats.rebuild()         # recount everything
+    stats.recent_winners()
+
+add() updates the row with F() expressions in the caller's transaction,
+so concurrent closes don't overwrite each other's counts. The row is
+created by a migration; should it go missing, add() leaves it to get()
+to rebuild it from the draws and ballots, outside of any close.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import responses, summaries
+from .models import Draw, Ballot, LotteryStats
+from .serializers import WinnerSerializer
+
+
+STATS_ID = 1
+# Number of closed draws in the recent winners.
+RECENT_DRAWS = 5
+
+
+def get():
+    return LotteryStats.objects.filter(pk=STATS_ID).first() or rebuild()
+
+
+def add(**counts):
+    LotteryStats.objects.filter(pk=STATS_ID).update(
+        **{name: F(name) + count for name, count in counts.items()}
+    )
+
+
+def rebuild():
+    draws = Draw.objects.aggregate(
+        total_draws=Count("id"),
+        closed_draws=Count("id", filter=Q(closed__isnull=False)),
+    )
+    prizes = Ballot.objects.filter(prize__isnull=False).aggregate(
+        total_prizes_awarded=Count("id"),
+        total_amount_awarded=Coalesce(Sum("prize__amount"), 0),
+    )
+    stats, _ = LotteryStats.objects.update_or_create(
+        pk=STATS_ID, defaults={**draws, **prizes}
+    )
+    return stats
+
+
+def recent_winners():
+    """The winners of the last closed draws, cached until a change."""
+    current = responses.generation("closed")
+    key = f"lottery:stats:recent_winners:{current}"
+    winners = cache.get(key)
+    if winners is None:
+        winners = load_recent_winners()
+        cache.set(key, winners, settings.LOTTERY_RESPONSE_CACHE_TIMEOUT)
+    return winners
+
+
+def load_recent_winners():
+    draws = summaries.attach(
+        Draw.objects.filter(closed__isnull=False)
+        .select_related("drawtype", "summary")
+        .order_by("-date")[:RECENT_DRAWS]
+    )
+    return [
+        {
+            "draw": {
+                "id": draw.id,
+                "drawtype_name": draw.drawtype.name,
+                "date": draw.date,
+            },
+            "winners": WinnerSerializer(draw.summary.winners, many=True).data,
+        }
+        for draw in draws
+        if draw.summary.winners
+    ]
+
+
+@receiver(post_save, sender=Draw)
+def count_draw(sender, instance, created, **kwargs):
+    if created:
+        add(total_draws=1, closed_draws=int(instance.closed is not None))
+
+
+@receiver(post_delete, sender=Draw)
+def uncount_draw(sender, instance, **kwargs):
+    add(total_draws=-1, closed_draws=-int(instance.closed is not None))
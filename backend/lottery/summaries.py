@@ -0,0 +1,92 @@
+"""
+Draw summaries: the totals and winners of a draw, written once when its
+prizes are awarded, in the same transaction.
+
+    summaries.write(draw)
+    summaries.attach(draws)     # before reading draw.summary
+
+Serving a closed draw then reads one row, whatever its number of
+ballots. A summary is the draw as it was closed; renaming a prize or a
+winner later doesn't change it.
+
+Draws without a stored summary, open draws and draws that are still
+being closed, get one counted from their ballots by attach().
+"""
+
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+
+from .models import Ballot, DrawSummary
+
+
+def summarize(draws):
+    """Unsaved summaries of the draws by id, counted from their ballots."""
+    summaries = {draw.id: DrawSummary(draw_id=draw.id) for draw in draws}
+    totals = (
+        Ballot.objects.filter(draw_id__in=summaries)
+        .values("draw_id")
+        .annotate(
+            ballot_count=Count("id"),
+            winner_count=Count(
+                "account", filter=Q(prize__isnull=False), distinct=True
+            ),
+            total_prize_amount=Coalesce(Sum("prize__amount"), 0),
+        )
+        .order_by()
+    )
+    for row in totals:
+        summary = summaries[row.pop("draw_id")]
+        for name, value in row.items():
+            setattr(summary, name, value)
+    winners = (
+        Ballot.objects.filter(draw_id__in=summaries, prize__isnull=False)
+        .values(
+            "draw_id",
+            first_name=F("account__user__first_name"),
+            last_name=F("account__user__last_name"),
+            prize_name=F("prize__name"),
+            prize_amount=F("prize__amount"),
+        )
+        .order_by("-prize_amount", "id")
+    )
+    for row in winners:
+        # As User.get_full_name().
+        full_name = f"{row['first_name']} {row['last_name']}".strip()
+        summaries[row["draw_id"]].winners.append(
+            {
+                "name": row["last_name"],
+                "full_name": full_name,
+                "prize_name": row["prize_name"],
+                "prize_amount": row["prize_amount"],
+            }
+        )
+    return summaries
+
+
+def write(draw):
+    """Store the summary of the draw, once its prizes are awarded."""
+    summary = summarize([draw])[draw.id]
+    summary.save()
+    return summary
+
+
+def attach(draws):
+    """
+    Give the draws without a stored summary one counted from their
+    ballots. Select the stored ones with select_related("summary").
+    """
+    draws = list(draws)
+    missing = [draw for draw in draws if not has_summary(draw)]
+    if missing:
+        counted = summarize(missing)
+        for draw in missing:
+            draw.summary = counted[draw.id]
+    return draws
+
+
+def has_summary(draw):
+    try:
+        draw.summary
+    except DrawSummary.DoesNotExist:
+        return False
+    return True
@@ -1,92 +1,447 @@
 """
-Tasks for the accounts app.
+Tasks for the lottery app.
 
+- queue_winner_emails
 - send_lottery_winner_emails
+- send_lottery_winner_chunk
+- record_winner_emails
 - close_lottery
+- freeze_todays_draw: the pre-close snapshot
 """
 
 import logging
 import itertools
 import operator
+import random
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 
 from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import Q
 from django.utils import timezone
+from celery import chord
 from celery.schedules import crontab
+from celery.utils.time import get_exponential_backoff_interval
 
 from service.background import celery_app
-from service.email import send_templated_email
+from service.models import Outbox
+from service.outbox import Dispatcher, outbox_email
 
-from .models import Draw
+from .engines import (
+    PARTITIONED,
+    SNAPSHOT_ENGINES,
+    expand_prizes,
+    select_winners,
+    assign_prizes,
+    partition_ranges,
+    partition_candidates,
+    merge_candidates,
+)
+from . import responses, stats, summaries
+from .models import Draw, DrawResult
+from .snapshots import write_snapshot
 
 
 logger = logging.getLogger(__name__)
 
 
+def queue_winner_emails(draw):
+    """
+    Add the winner emails of the draw to the outbox, one per winning
+    account, in the caller's transaction. Returns their outbox ids.
+    """
+    # One query for all winning ballots, with their account, user and
+    # prize, grouped per account in a single pass.
+    winning_ballots = (
+        draw.ballots.filter(prize__isnull=False)
+        .select_related("account__user", "prize")
+        .order_by("account_id", "prize__amount")
+    )
+    emails = Outbox.objects.bulk_create(
+        outbox_email(**winner_email(draw, list(ballots)))
+        for _, ballots in itertools.groupby(
+            winning_ballots, key=operator.attrgetter("account_id")
+        )
+    )
+    return [email.id for email in emails]
+
+
 @celery_app.task(ignore_result=True)
-def send_lottery_winner_emails(draw_id):
-    """Send lottery winner emails."""
-    draw = Draw.objects.get(id=draw_id)
-    winning_ballots = draw.ballots.filter(prize__isnull=False)
-    for account, ballots in itertools.groupby(
-        winning_ballots.order_by("account", "prize__amount"),
-        key=operator.attrgetter("account"),
-    ):
+def send_lottery_winner_emails(draw_id, outbox_ids):
+    """
+    Send the queued winner emails of a draw, in chunks.
+
+    Each chunk is a task of its own, so large draws are spread over the
+    workers. When all chunks are done, the counts are recorded in the
+    DrawResult ledger. Emails this doesn't get to stay in the outbox for
+    the dispatcher.
+    """
+    chunks = winner_chunks(outbox_ids)
+    if not chunks:
+        record_winner_emails([], draw_id)
+        return
+    chord(send_lottery_winner_chunk.s(draw_id, chunk) for chunk in chunks)(
+        record_winner_emails.s(draw_id)
+    )
+
+
+def winner_chunks(outbox_ids):
+    """The outbox ids in chunks of LOTTERY_EMAIL_CHUNK_SIZE."""
+    ids = iter(outbox_ids)
+    size = settings.LOTTERY_EMAIL_CHUNK_SIZE
+    return list(iter(lambda: list(itertools.islice(ids, size)), []))
+
+
+@celery_app.task(bind=True, max_retries=5)
+def send_lottery_winner_chunk(self, draw_id, outbox_ids):
+    """
+    Send some queued winner emails, over one SMTP connection.
+
+    Returns the number of the emails that are sent, by this chunk or by
+    the dispatcher, and the number that aren't. Emails that fail are
+    retried by the dispatcher, with the outbox backoff. When the outbox
+    can't be read the chunk is retried with exponential backoff, and
+    counted as failed after the last retry.
+    """
+    try:
+        dispatcher = Dispatcher(batch_size=len(outbox_ids))
         try:
-            prizes = [b.prize for b in ballots]
-            send_templated_email(
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                to=account.user.email,
-                subject=f"You have won in the {draw.drawtype.name} lottery",
-                template_name="lottery/email/winner",
-                context_dict={
-                    "user": account.user,
-                    "account": account,
-                    "draw": draw,
-                    "prizes": prizes,
-                    "total_amount": sum(p.amount for p in prizes),
-                },
-            )
-            logger.info(f"Lottery winner email sent to {account.user.email}")
-        except Exception:
-            # Don't fail the whole task if one email fails.
+            dispatcher.dispatch(ids=outbox_ids)
+        finally:
+            dispatcher.close()
+        sent = Outbox.objects.filter(
+            id__in=outbox_ids, state=Outbox.State.SENT
+        ).count()
+        return sent, len(outbox_ids) - sent
+    except Exception as e:
+        if self.request.retries >= self.max_retries:
             logger.exception(
-                f"Failed to send lottery winner email to {account.user.email}"
+                f"Failed to send {len(outbox_ids)} lottery winner emails "
+                f"for draw {draw_id}"
             )
-    logger.info(f"Lottery winner emails sent for draw {draw_id}")
+            return 0, len(outbox_ids)
+        raise self.retry(
+            exc=e,
+            countdown=get_exponential_backoff_interval(
+                factor=10,
+                retries=self.request.retries,
+                maximum=600,
+                full_jitter=True,
+            ),
+        )
 
 
 @celery_app.task(ignore_result=True)
-def close_lottery_draw(draw_id):
-    """Close a lottery and send winner emails."""
-    draw = Draw.objects.get(id=draw_id)
-    if draw.closed:
+def record_winner_emails(chunks, draw_id):
+    """Record the number of winner emails sent and failed for the draw."""
+    sent = sum(sent for sent, failed in chunks)
+    failed = sum(failed for sent, failed in chunks)
+    DrawResult.objects.filter(draw_id=draw_id).update(
+        emails_sent=sent, emails_failed=failed
+    )
+    logger.info(
+        f"Lottery winner emails sent for draw {draw_id}: "
+        f"{sent} sent, {failed} failed"
+    )
+
+
+def winner_email(draw, ballots):
+    """The outbox_email arguments for one account's winning ballots."""
+    account = ballots[0].account
+    prizes = [ballot.prize for ballot in ballots]
+    return {
+        "from_email": settings.DEFAULT_FROM_EMAIL,
+        "to": account.user.email,
+        "subject": f"You have won in the {draw.drawtype.name} lottery",
+        "template_name": "lottery/email/winner",
+        "context_dict": {
+            "user": account.user,
+            "account": account,
+            "draw": draw,
+            "prizes": prizes,
+            "total_amount": sum(p.amount for p in prizes),
+        },
+    }
+
+
+def start_closing(draw_id):
+    """
+    Close the draw for new ballots and return its DrawResult ledger.
+
+    Returns None when there's nothing left to do, so duplicate deliveries
+    return without touching any ballots. That includes a partitioned
+    close whose chord was sent less than LOTTERY_PARTITION_TIMEOUT
+    seconds ago.
+    """
+    with transaction.atomic():
+        draw = Draw.objects.select_for_update().get(id=draw_id)
+        result = DrawResult.objects.filter(draw=draw).first()
+        if result is None and not draw.closed:
+            draw.closed = timezone.now()
+            draw.save()
+            stats.add(closed_draws=1)
+            if settings.LOTTERY_CLOSE_PARTITIONS > 1:
+                engine = PARTITIONED
+            else:
+                engine = settings.LOTTERY_DRAW_ENGINE
+            return DrawResult.objects.create(
+                draw=draw,
+                engine=engine,
+                seed=secrets.randbits(63),
+                dispatched=timezone.now() if engine == PARTITIONED else None,
+            )
+        if (
+            result is not None
+            and result.engine == PARTITIONED
+            and result.state == DrawResult.State.CLOSING
+        ):
+            if not partitions_lost(result):
+                logger.info(f"Lottery draw {draw_id} is closing in partitions")
+                return None
+            result.dispatched = timezone.now()
+            result.save()
+    if result is None or result.state == DrawResult.State.DONE:
         logger.info(f"Lottery draw {draw_id} already closed")
+        return None
+    logger.info(f"Resuming close of lottery draw {draw_id} ({result.state})")
+    return result
+
+
+def partitions_lost(result):
+    """Whether the partition chord of the draw should be sent again."""
+    timeout = timedelta(seconds=settings.LOTTERY_PARTITION_TIMEOUT)
+    return result.dispatched is None or (
+        result.dispatched + timeout <= timezone.now()
+    )
+
+
+def store_snapshot(draw_id):
+    """Freeze the ballot ids of the draw into a snapshot file."""
+    with transaction.atomic():
+        result = (
+            DrawResult.objects.select_for_update(skip_locked=True)
+            .select_related("draw")
+            .filter(
+                draw_id=draw_id, state=DrawResult.State.CLOSING, snapshot=""
+            )
+            .first()
+        )
+        if result is not None:
+            (
+                result.snapshot,
+                result.snapshot_count,
+                result.snapshot_sha256,
+            ) = write_snapshot(result.draw)
+            result.save()
+            logger.info(
+                f"Lottery draw {draw_id} snapshot {result.snapshot} "
+                f"with {result.snapshot_count} ballots"
+            )
+
+
+def freeze_draw(draw_id):
+    """
+    The pre-close stage: close the draw for new ballots and freeze its
+    ballot ids into a snapshot, so the close itself reads no ballots.
+
+    Only for snapshot engines; a partitioned close reads the ballots in
+    ranges anyway.
+    """
+    if (
+        settings.LOTTERY_CLOSE_PARTITIONS > 1
+        or settings.LOTTERY_DRAW_ENGINE not in SNAPSHOT_ENGINES
+    ):
         return
-    draw.closed = timezone.now()
-    draw.save()
-    # There's a limited number of prizes and a large number of ballots, keep
-    # ballots as a queryset to avoid fetching more than needed.
-    prizes = [p for p in draw.drawtype.prizes.all() for _ in range(p.number)]
-    ballots = draw.ballots.all().order_by("?")
-    for prize, ballot in zip(prizes, ballots):
-        ballot.prize = prize
-        ballot.save()
+    result = start_closing(draw_id)
+    if result is not None and result.state == DrawResult.State.CLOSING:
+        store_snapshot(draw_id)
+
+
+def store_winners(draw_id, select):
+    """
+    Select the winners with select(result) and store them in the ledger.
+
+    The ledger row stays locked while selecting. A concurrent task for
+    the same draw skips the locked row instead of selecting again.
+    """
+    with transaction.atomic():
+        result = (
+            DrawResult.objects.select_for_update(skip_locked=True)
+            .select_related("draw__drawtype")
+            .filter(draw_id=draw_id, state=DrawResult.State.CLOSING)
+            .first()
+        )
+        if result is not None:
+            result.winners = select(result)
+            result.state = DrawResult.State.SELECTED
+            result.save()
+
+
+def award_prizes(draw_id):
+    """Assign the prizes to the stored winners and notify them."""
+    with transaction.atomic():
+        result = (
+            DrawResult.objects.select_for_update(skip_locked=True)
+            .select_related("draw__drawtype")
+            .filter(draw_id=draw_id, state=DrawResult.State.SELECTED)
+            .first()
+        )
+        if result is None:
+            return
+        # There's a limited number of prizes and a large number of
+        # ballots, only the winners are updated, in one statement.
+        assign_prizes(expand_prizes(result.draw), result.winners)
+        summary = summaries.write(result.draw)
+        stats.add(
+            total_prizes_awarded=len(summary.winners),
+            total_amount_awarded=summary.total_prize_amount,
+        )
+        result.state = DrawResult.State.DONE
+        result.save()
+        # The bulk update sends no signals.
+        responses.invalidate("closed", f"draw:{draw_id}")
+        # Queued with the prizes; the chunk tasks only speed up sending.
+        outbox_ids = queue_winner_emails(result.draw)
+        transaction.on_commit(
+            lambda: send_lottery_winner_emails.delay(draw_id, outbox_ids)
+        )
     logger.info(f"Lottery draw {draw_id} closed")
-    send_lottery_winner_emails.delay(draw_id)
+
+
+@celery_app.task(ignore_result=True, acks_late=True)
+def close_lottery_draw(draw_id):
+    """Close a lottery and send winner emails."""
+    result = start_closing(draw_id)
+    if result is None:
+        return
+    if result.state == DrawResult.State.CLOSING:
+        if result.engine == PARTITIONED:
+            # Let several workers each select candidates from a range of
+            # ballot ids, and merge them in the chord callback. The ranges
+            # are kept in the ledger, to replay the draw.
+            k = len(expand_prizes(result.draw))
+            if not result.partitions:
+                result.partitions = partition_ranges(
+                    result.draw, settings.LOTTERY_CLOSE_PARTITIONS
+                )
+                result.save()
+            chord(
+                draw_partition_candidates.s(draw_id, low, high, k, result.seed)
+                for low, high in result.partitions
+            )(merge_draw_partitions.s(draw_id))
+            return
+        if result.engine in SNAPSHOT_ENGINES:
+            # Normally taken by freeze_draw already, then this is a no-op.
+            store_snapshot(draw_id)
+        store_winners(
+            draw_id,
+            lambda result: select_winners(
+                result.draw,
+                len(expand_prizes(result.draw)),
+                engine=result.engine,
+                rng=random.Random(result.seed),
+            ),
+        )
+    award_prizes(draw_id)
+
+
+@celery_app.task
+def draw_partition_candidates(draw_id, low, high, k, seed):
+    """Random keyed candidates for the ballots of a draw in an id range."""
+    return partition_candidates(draw_id, low, high, k, seed)
+
+
+@celery_app.task(ignore_result=True, acks_late=True)
+def merge_draw_partitions(partitions, draw_id):
+    """Pick the winners from all partition candidates of a draw."""
+    store_winners(
+        draw_id,
+        lambda result: merge_candidates(
+            partitions, len(expand_prizes(result.draw))
+        ),
+    )
+    award_prizes(draw_id)
+
+
+def close_draws_until(date, workers=None, progress=None):
+    """
+    Close all draws up to date that are not closed yet, oldest first.
+
+    This also resumes draws whose close was interrupted. The draws are
+    closed in date order through a pool of at most `workers` threads,
+    settings.LOTTERY_CATCHUP_WORKERS by default. After each draw,
+    progress(done, total, draw_id, error) is called.
+
+    Returns the number of draws closed and the number that failed.
+    """
+    draw_ids = list(
+        Draw.objects.filter(date__lte=date)
+        .filter(
+            Q(closed__isnull=True)
+            | Q(
+                result__state__in=[
+                    DrawResult.State.CLOSING,
+                    DrawResult.State.SELECTED,
+                ]
+            )
+        )
+        .order_by("date")
+        .values_list("id", flat=True)
+    )
+    workers = min(workers or settings.LOTTERY_CATCHUP_WORKERS, len(draw_ids))
+    # SQLite has a single writer, there the draws are closed one by one.
+    if workers > 1 and connection.vendor != "sqlite":
+        executor = ThreadPoolExecutor(max_workers=workers)
+        errors = executor.map(_close_draw, draw_ids, itertools.repeat(True))
+    else:
+        executor = None
+        errors = map(_close_draw, draw_ids, itertools.repeat(False))
+    failed = 0
+    for done, (draw_id, error) in enumerate(zip(draw_ids, errors), 1):
+        failed += error is not None
+        logger.info(f"Closing lottery draws: {done}/{len(draw_ids)}")
+        if progress:
+            progress(done, len(draw_ids), draw_id, error)
+    if executor:
+        executor.shutdown()
+    return len(draw_ids) - failed, failed
+
+
+def _close_draw(draw_id, in_thread):
+    """Close a draw, returns the exception if that failed."""
+    try:
+        close_lottery_draw(draw_id)
+    except Exception as e:
+        logger.exception(f"Failed to close lottery draw {draw_id}")
+        return e
+    finally:
+        if in_thread:
+            # Threads get their own database connection, close it.
+            connections.close_all()
 
 
 @celery_app.task(ignore_result=True)
 def close_todays_draw():
-    """Close today's lottery draw if one exists."""
+    """Close today's lottery draw, and earlier draws that were missed."""
     today = timezone.now().date()
-    try:
-        draw = Draw.objects.get(date=today)
-        close_lottery_draw(draw.id)
-        logger.info(f"Successfully closed today's draw {draw.id}")
-    except Draw.DoesNotExist:
+    closed, failed = close_draws_until(today)
+    if closed or failed:
+        logger.info(f"Closed {closed} lottery draws, {failed} failed")
+    else:
         logger.info("No draw found for today")
-    except Exception:
-        logger.exception("Failed to close today's draw")
+
+
+@celery_app.task(ignore_result=True, acks_late=True)
+def freeze_todays_draw():
+    """Freeze today's open draws into their snapshots, before the close."""
+    today = timezone.now().date()
+    for draw_id in Draw.objects.filter(
+        date=today, closed__isnull=True
+    ).values_list("id", flat=True):
+        freeze_draw(draw_id)
+        logger.info(f"Froze lottery draw {draw_id} for closing")
 
 
 # Schedule the task to run daily at 20:00
@@ -98,3 +453,9 @@ celery_app.conf.beat_schedule.update(
         },
     }
 )
+if settings.LOTTERY_SNAPSHOT_AT:
+    hour, minute = settings.LOTTERY_SNAPSHOT_AT.split(":")
+    celery_app.conf.beat_schedule["freeze-todays-draw"] = {
+        "task": "lottery.tasks.freeze_todays_draw",
+        "schedule": crontab(hour=int(hour), minute=int(minute)),
+    }
@@ -1,4 +1,12 @@
-from django.test import TestCase
+import io
+import json
+import threading
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
 from django.urls import reverse
 from rest_framework.test import APIClient
@@ -6,7 +14,10 @@ from rest_framework import status
 from django.utils import timezone
 from datetime import date, timedelta
 
-from .models import DrawType, Draw, Prize, Ballot
+from . import responses, summaries
+from .api_views import DrawDetailView
+from .models import DrawType, Draw, DrawResult, Prize, Ballot
+from .tasks import close_lottery_draw
 from accounts.models import Account
 
 
@@ -75,9 +86,12 @@ class LotteryAPITestCase(TestCase):
         response = self.client.get(url, format="json")
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]["id"], self.open_draw.id)
-        self.assertIsNone(response.data[0]["closed"])
+        draws = response.data["results"]
+        self.assertEqual(len(draws), 1)
+        self.assertEqual(draws[0]["id"], self.open_draw.id)
+        self.assertIsNone(draws[0]["closed"])
+        self.assertEqual(draws[0]["ballot_count"], 1)
+        self.assertNotIn("ballots", draws[0])
 
     def test_closed_draws_api(self):
         """Test listing closed draws"""
@@ -85,10 +99,179 @@ class LotteryAPITestCase(TestCase):
         response = self.client.get(url, format="json")
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]["id"], self.closed_draw.id)
-        self.assertIsNotNone(response.data[0]["closed"])
-        self.assertIn("winners", response.data[0])
+        draws = response.data["results"]
+        self.assertEqual(len(draws), 1)
+        self.assertEqual(draws[0]["id"], self.closed_draw.id)
+        self.assertIsNotNone(draws[0]["closed"])
+        self.assertIn("winners", draws[0])
+        self.assertIsNone(response.data["next"])
+
+    def test_closed_draws_api_pages(self):
+        """Test paging through closed draws, newest first"""
+        for days in range(8, 13):
+            Draw.objects.create(
+                drawtype=self.draw_type,
+                date=date.today() - timedelta(days=days),
+                closed=timezone.now(),
+            )
+        url = reverse("lottery_api:closed_draws") + "?page_size=2"
+        dates = []
+        while url:
+            response = self.client.get(url, format="json")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data["results"]), 2)
+            dates.extend(draw["date"] for draw in response.data["results"])
+            url = response.data["next"]
+        expected = [
+            (date.today() - timedelta(days=days)).isoformat()
+            for days in range(7, 13)
+        ]
+        self.assertEqual(dates, expected)
+
+    def test_closed_draws_api_totals(self):
+        """Test winner count and prize total of a closed draw"""
+        Ballot.objects.create(
+            account=self.account2, draw=self.closed_draw, prize=self.prize2
+        )
+        Ballot.objects.create(account=self.account1, draw=self.closed_draw)
+        url = reverse("lottery_api:closed_draws")
+        response = self.client.get(url, format="json")
+
+        draw = response.data["results"][0]
+        self.assertEqual(draw["ballot_count"], 3)
+        self.assertEqual(draw["winner_count"], 1)
+        self.assertEqual(draw["total_prize_amount"], 1500)
+        self.assertEqual(len(draw["winners"]), 2)
+
+    def test_closed_draws_api_query_count(self):
+        """Test that the closed draws list takes a constant number of
+        queries"""
+        url = reverse("lottery_api:closed_draws")
+        # Loads the prizes of the drawtype once. Without stored summaries
+        # the queries are the validators, the draws, their totals and
+        # their winners.
+        self.client.get(url, format="json")
+        responses.next_generation()
+        with self.assertNumQueries(4):
+            self.client.get(url, format="json")
+
+        for days in range(8, 13):
+            draw = Draw.objects.create(
+                drawtype=self.draw_type,
+                date=date.today() - timedelta(days=days),
+                closed=timezone.now(),
+            )
+            Ballot.objects.create(
+                account=self.account1, draw=draw, prize=self.prize1
+            )
+        with self.assertNumQueries(4):
+            response = self.client.get(url, format="json")
+        self.assertEqual(len(response.data["results"]), 6)
+
+        # With the summaries written at close, only the validators and
+        # the draws.
+        for draw in Draw.objects.filter(closed__isnull=False):
+            summaries.write(draw)
+        responses.next_generation()
+        with self.assertNumQueries(2):
+            summarized = self.client.get(url, format="json")
+        self.assertEqual(summarized.data, response.data)
+
+    def test_response_cache(self):
+        """Test that public responses are cached until the data changes"""
+        url = reverse("lottery_api:open_draws")
+        self.client.get(url, format="json")
+        with self.assertNumQueries(0):
+            response = self.client.get(url, format="json")
+        self.assertEqual(response.data["results"][0]["ballot_count"], 1)
+
+        # Query parameters are part of the key.
+        with self.assertNumQueries(1):
+            self.client.get(url, {"page_size": 1}, format="json")
+
+        # Assigning a ballot changes the ballot count.
+        self.client.force_authenticate(user=self.user1)
+        self.client.post(
+            reverse(
+                "lottery_api:assign_ballot",
+                kwargs={"ballot_id": self.ballot2.id},
+            ),
+            {"draw_id": self.open_draw.id},
+            format="json",
+        )
+        response = self.client.get(url, format="json")
+        self.assertEqual(response.data["results"][0]["ballot_count"], 2)
+
+        # So does an edit in the admin.
+        self.prize1.name = "Jackpot"
+        self.prize1.save()
+        response = self.client.get(url, format="json")
+        self.assertEqual(
+            response.data["results"][0]["prizes"][0]["name"], "Jackpot"
+        )
+
+    def test_response_cache_per_host(self):
+        """Test that cached links point at the host that asked"""
+        url = reverse("lottery_api:closed_draws")
+        self.client.get(url, format="json", HTTP_HOST="web")
+        response = self.client.get(url, format="json", HTTP_HOST="localhost")
+        self.assertTrue(
+            response.data["results"][0]["winners_url"].startswith(
+                "http://localhost/"
+            )
+        )
+        response = self.client.get(url, format="json", secure=True)
+        self.assertTrue(
+            response.data["results"][0]["winners_url"].startswith("https://")
+        )
+
+    def test_response_cache_scopes(self):
+        """Test that assigning a ballot keeps closed draws cached"""
+        closed_urls = [
+            reverse("lottery_api:closed_draws"),
+            reverse(
+                "lottery_api:draw_detail", kwargs={"pk": self.closed_draw.id}
+            ),
+            reverse("lottery_api:lottery_stats"),
+        ]
+        open_url = reverse(
+            "lottery_api:draw_detail", kwargs={"pk": self.open_draw.id}
+        )
+        for url in closed_urls + [open_url]:
+            self.client.get(url, format="json")
+
+        self.client.force_authenticate(user=self.user1)
+        self.client.post(
+            reverse(
+                "lottery_api:assign_ballot",
+                kwargs={"ballot_id": self.ballot2.id},
+            ),
+            {"draw_id": self.open_draw.id},
+            format="json",
+        )
+        for url in closed_urls:
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url, format="json")
+            # At most the conditional GET validators.
+            self.assertLessEqual(len(queries), 1, url)
+            for query in queries:
+                self.assertNotIn("lottery_ballot", query["sql"])
+        response = self.client.get(open_url, format="json")
+        self.assertEqual(response.data["ballot_count"], 2)
+
+    @override_settings(LOTTERY_RESPONSE_CACHE_TIMEOUT=0)
+    def test_response_cache_stale(self):
+        """Test that a stale response is served while it's recomputed"""
+        url = reverse("lottery_api:open_draws")
+        self.client.get(url, format="json")
+        self.open_draw.ballots.update(draw=None)
+        # Another request holds the lock and recomputes it.
+        with mock.patch("service.cache.acquire", return_value=None):
+            with self.assertNumQueries(0):
+                response = self.client.get(url, format="json")
+        self.assertEqual(response.data["results"][0]["ballot_count"], 1)
+        response = self.client.get(url, format="json")
+        self.assertEqual(response.data["results"][0]["ballot_count"], 0)
 
     def test_draw_detail_api(self):
         """Test getting draw details"""
@@ -103,6 +286,204 @@ class LotteryAPITestCase(TestCase):
         self.assertEqual(len(response.data["winners"]), 1)
         self.assertEqual(response.data["winners"][0]["name"], "User Two")
 
+    def add_winners(self):
+        """Give the closed draw 1 + 5 winners, the second prize 5 times"""
+        self.prize2.number = 5
+        self.prize2.save()
+        Ballot.objects.bulk_create(
+            Ballot(account=self.account1, draw=self.closed_draw, prize=prize)
+            for prize in [self.prize2] * 5
+        )
+        Ballot.objects.create(account=self.account1, draw=self.closed_draw)
+
+    @override_settings(LOTTERY_TOP_WINNERS=2)
+    def test_draw_detail_api_top_winners(self):
+        """Test that draw details embed only the top winners"""
+        self.add_winners()
+        url = reverse(
+            "lottery_api:draw_detail", kwargs={"pk": self.closed_draw.id}
+        )
+        response = self.client.get(url, format="json")
+
+        winners = response.data["winners"]
+        self.assertEqual(
+            [winner["prize_amount"] for winner in winners], [1000, 500]
+        )
+        self.assertEqual(response.data["ballot_count"], 7)
+
+    @override_settings(LOTTERY_TOP_WINNERS=2)
+    def test_closed_draws_api_top_winners(self):
+        """Test that closed draws embed the top winners and link to all"""
+        self.add_winners()
+        response = self.client.get(
+            reverse("lottery_api:closed_draws"), format="json"
+        )
+
+        draw = response.data["results"][0]
+        self.assertEqual(
+            [winner["prize_amount"] for winner in draw["winners"]],
+            [1000, 500],
+        )
+        self.assertEqual(
+            draw["winners_url"],
+            "http://testserver"
+            + reverse(
+                "lottery_api:draw_winners", kwargs={"pk": self.closed_draw.id}
+            ),
+        )
+
+    def test_draw_winners_api(self):
+        """Test paging through the winners of a draw, highest prize first"""
+        self.add_winners()
+        url = reverse(
+            "lottery_api:draw_winners", kwargs={"pk": self.closed_draw.id}
+        )
+        url = f"{url}?page_size=2"
+        winners = []
+        while url:
+            response = self.client.get(url, format="json")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data["results"]), 2)
+            winners.extend(response.data["results"])
+            url = response.data["next"]
+
+        self.assertEqual(
+            [winner["prize_amount"] for winner in winners],
+            [1000, 500, 500, 500, 500, 500],
+        )
+        self.assertEqual(
+            winners[0],
+            {
+                "name": "User Two",
+                "prize_name": "First Prize",
+                "prize_amount": 1000,
+            },
+        )
+
+    def test_draw_detail_api_not_modified(self):
+        """Test conditional GET of the results of a closed draw"""
+        url = reverse(
+            "lottery_api:draw_detail", kwargs={"pk": self.closed_draw.id}
+        )
+        response = self.client.get(url, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+        self.assertIn("public", response["Cache-Control"])
+        self.assertIn("max-age=3600", response["Cache-Control"])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+        self.assertFalse(
+            [q for q in queries if "lottery_ballot" in q["sql"]],
+            "a 304 should not query any ballots",
+        )
+
+        # Editing a prize changes the results.
+        self.prize1.name = "Jackpot"
+        self.prize1.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_draw_detail_api_no_validators_until_final(self):
+        """Test that open draws and draws being closed aren't cached"""
+        url = reverse(
+            "lottery_api:draw_detail", kwargs={"pk": self.open_draw.id}
+        )
+        response = self.client.get(url, format="json")
+        self.assertNotIn("ETag", response)
+
+        result = DrawResult.objects.create(draw=self.closed_draw)
+        url = reverse(
+            "lottery_api:draw_detail", kwargs={"pk": self.closed_draw.id}
+        )
+        response = self.client.get(url, format="json")
+        self.assertNotIn("ETag", response)
+        self.assertNotIn("Cache-Control", response)
+
+        result.state = DrawResult.State.DONE
+        result.save()
+        response = self.client.get(url, format="json")
+        self.assertIn("ETag", response)
+
+    def test_closed_draws_api_not_modified(self):
+        """Test conditional GET of the closed draws list"""
+        url = reverse("lottery_api:closed_draws")
+        response = self.client.get(url, format="json")
+        self.assertIn("max-age=60", response["Cache-Control"])
+        last_modified = response["Last-Modified"]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                url, HTTP_IF_MODIFIED_SINCE=last_modified
+            )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(len(queries), 1)
+
+        # Another draw closes later.
+        Draw.objects.create(
+            drawtype=self.draw_type,
+            date=date.today() - timedelta(days=1),
+            closed=timezone.now() + timedelta(seconds=2),
+        )
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 2)
+
+    def test_draw_winners_api_errors(self):
+        """Test the winners of a missing draw, and a bad cursor"""
+        url = reverse("lottery_api:draw_winners", kwargs={"pk": 999})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        url = reverse(
+            "lottery_api:draw_winners", kwargs={"pk": self.closed_draw.id}
+        )
+        response = self.client.get(url, {"after": "x"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        url = reverse(
+            "lottery_api:draw_winners", kwargs={"pk": self.open_draw.id}
+        )
+        response = self.client.get(url)
+        self.assertEqual(response.data["results"], [])
+
+    def test_draw_ballots_api(self):
+        """Test paging through the ballot ids of a draw"""
+        extra = Ballot.objects.bulk_create(
+            Ballot(account=self.account2, draw=self.open_draw)
+            for _ in range(4)
+        )
+        expected = [self.ballot1.id] + [ballot.id for ballot in extra]
+        url = reverse(
+            "lottery_api:draw_ballots", kwargs={"pk": self.open_draw.id}
+        )
+        url = f"{url}?limit=2"
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response.streaming)
+            page = json.loads(b"".join(response.streaming_content))
+            self.assertLessEqual(len(page["results"]), 2)
+            ids.extend(page["results"])
+            url = page["next"]
+        self.assertEqual(ids, expected)
+
+    def test_draw_ballots_api_errors(self):
+        """Test the ballots of a missing draw, and a bad cursor"""
+        url = reverse("lottery_api:draw_ballots", kwargs={"pk": 999})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        url = reverse(
+            "lottery_api:draw_ballots", kwargs={"pk": self.open_draw.id}
+        )
+        response = self.client.get(url, {"after": "x"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_user_ballots_api_authenticated(self):
         """Test getting user ballots when authenticated"""
         self.client.force_authenticate(user=self.user1)
@@ -179,6 +560,25 @@ class LotteryAPITestCase(TestCase):
         self.ballot2.refresh_from_db()
         self.assertEqual(self.ballot2.draw, self.open_draw)
 
+    def test_assign_ballot_api_locks_draw(self):
+        """Test that assigning a ballot locks the draw against a close"""
+        self.client.force_authenticate(user=self.user1)
+        with mock.patch.object(
+            Draw.objects,
+            "select_for_update",
+            wraps=Draw.objects.select_for_update,
+        ) as select_for_update:
+            response = self.client.post(
+                reverse(
+                    "lottery_api:assign_ballot",
+                    kwargs={"ballot_id": self.ballot2.id},
+                ),
+                {"draw_id": self.open_draw.id},
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        select_for_update.assert_called_once()
+
     def test_assign_ballot_api_already_assigned(self):
         """Test assigning already assigned ballot"""
         self.client.force_authenticate(user=self.user1)
@@ -259,6 +659,8 @@ class LotteryAPITestCase(TestCase):
 
     def test_lottery_stats_api(self):
         """Test getting lottery statistics"""
+        # The fixture awards its prize without closing the draw.
+        call_command("rebuild_lottery_stats", stdout=io.StringIO())
         url = reverse("lottery_api:lottery_stats")
         response = self.client.get(url, format="json")
 
@@ -274,6 +676,9 @@ class LotteryAPITestCase(TestCase):
         self.assertEqual(response.data["closed_draws"], 1)
         self.assertEqual(response.data["total_prizes_awarded"], 1)
         self.assertEqual(response.data["total_amount_awarded"], 1000)
+        recent = response.data["recent_winners"]
+        self.assertEqual(recent[0]["draw"]["id"], self.closed_draw.id)
+        self.assertEqual(recent[0]["winners"][0]["name"], "User Two")
 
     def test_privacy_protection(self):
         """Test that user information is properly protected"""
@@ -282,7 +687,7 @@ class LotteryAPITestCase(TestCase):
         response = self.client.get(url, format="json")
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        winner = response.data[0]["winners"][0]
+        winner = response.data["results"][0]["winners"][0]
         self.assertIn("name", winner)
         self.assertIn("prize_name", winner)
         self.assertIn("prize_amount", winner)
@@ -308,3 +713,62 @@ class LotteryAPITestCase(TestCase):
         data = {"draw_id": self.open_draw.id}
         response = self.client.post(url, data, format="json")
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ResponseCacheConcurrencyTests(TransactionTestCase):
+    """The response cache with a request running while a draw closes"""
+
+    def setUp(self):
+        user = User.objects.create_user(
+            username="winner@example.com",
+            email="winner@example.com",
+            password="testpass123",
+            last_name="Winner",
+        )
+        drawtype = DrawType.objects.create(name="Test Lottery")
+        Prize.objects.create(
+            name="First Prize", amount=1000, number=1, drawtype=drawtype
+        )
+        self.draw = Draw.objects.create(
+            drawtype=drawtype, date=date.today() - timedelta(days=1)
+        )
+        Ballot.objects.create(
+            account=Account.objects.get(user=user), draw=self.draw
+        )
+
+    @override_settings(LOTTERY_DRAW_ENGINE="sample")
+    def test_no_stale_response_after_close(self):
+        """Test that a response computed before a close isn't served"""
+        url = reverse("lottery_api:draw_detail", kwargs={"pk": self.draw.id})
+        computed = threading.Event()
+        release = threading.Event()
+        retrieve = DrawDetailView.retrieve
+
+        def slow_retrieve(view, request, *args, **kwargs):
+            # Reads the open draw, and returns after the draw has closed.
+            response = retrieve(view, request, *args, **kwargs)
+            computed.set()
+            release.wait(10)
+            return response
+
+        stale = []
+
+        def slow_request():
+            try:
+                stale.append(APIClient().get(url, format="json").data)
+            finally:
+                connection.close()
+
+        with mock.patch.object(DrawDetailView, "retrieve", slow_retrieve):
+            thread = threading.Thread(target=slow_request)
+            thread.start()
+            self.assertTrue(computed.wait(10))
+        close_lottery_draw(self.draw.id)
+        release.set()
+        thread.join(10)
+
+        self.assertIsNone(stale[0]["closed"])
+        response = APIClient().get(url, format="json")
+        self.assertIsNotNone(response.data["closed"])
+        self.assertEqual(response.data["winner_count"], 1)
+        self.assertEqual(response.data["winners"][0]["name"], "Winner")
@@ -1,12 +1,97 @@
+import io
+import json
+import random
+import collections
 from datetime import date
+from unittest import mock
 
-from django.test import TestCase, Client
+import numpy as np
+
+from django.core import mail
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from django.contrib.auth.models import User
 from django.urls import reverse
 
-from .models import DrawType, Prize, Draw, Ballot
+from . import stats, summaries
+from .models import (
+    DrawType,
+    Prize,
+    Draw,
+    DrawResult,
+    Ballot,
+    DrawSummary,
+    LotteryStats,
+)
+from .engines import (
+    expand_prizes,
+    select_winners,
+    assign_prizes,
+    partition_ranges,
+    keyed_candidates,
+    merge_candidates,
+    replay_winners,
+)
+from .prizes import DrawTypeCache, prizes, version, bump_version
+from .serializers import DrawSerializer, annotate_draws
+from .vectorized import (
+    load_ballot_ids,
+    sample_winners,
+)
+from .snapshots import SnapshotError, open_snapshot, snapshot_path
 from .forms import BallotPurchaseForm
-from .tasks import close_lottery_draw
+from .tasks import (
+    close_lottery_draw,
+    close_draws_until,
+    freeze_todays_draw,
+    queue_winner_emails,
+    send_lottery_winner_emails,
+)
+from service.background import celery_app
+from service.models import Outbox
+from service.outbox import Dispatcher
+
+
+class DrawSetupMixin:
+    """
+    A draw on 28 July 2025 with the prize tiers of the class, and
+    ballot_count ballots of a single account.
+    """
+
+    # (name, amount, number) of each prize.
+    prize_tiers = [("Test Prize", 1000, 3)]
+    ballot_count = 20
+
+    def setUp(self):
+        self.drawtype = DrawType.objects.create(name="Test Draw")
+        self.prizes = [
+            Prize.objects.create(
+                name=name, amount=amount, number=number, drawtype=self.drawtype
+            )
+            for name, amount, number in self.prize_tiers
+        ]
+        self.prize = self.prizes[0] if self.prizes else None
+        self.draw = Draw.objects.create(
+            date=date(2025, 7, 28), drawtype=self.drawtype
+        )
+        self.user = User.objects.create_user(
+            username="test@example.com",
+            email="test@example.com",
+            password="testpass123",
+            first_name="Test",
+            last_name="Winner",
+        )
+        self.create_ballots()
+
+    def create_ballots(self):
+        Ballot.objects.bulk_create(
+            Ballot(draw=self.draw, account=self.user.account)
+            for _ in range(self.ballot_count)
+        )
 
 
 class DrawTypeTests(TestCase):
@@ -100,6 +185,54 @@ class PrizeTests(TestCase):
         self.assertEqual(prizes[0], self.prize)  # Higher amount first
         self.assertEqual(prizes[1], prize2)
 
+    def test_prize_cache(self):
+        """Test that prizes are loaded once per drawtype"""
+        with self.assertNumQueries(1):
+            self.assertEqual(prizes.get(self.drawtype.id), (self.prize,))
+            self.assertEqual(prizes.get(self.drawtype.id), (self.prize,))
+        with self.assertNumQueries(0):
+            draw = Draw(drawtype=self.drawtype, date=date(2025, 1, 1))
+            self.assertEqual(expand_prizes(draw), [self.prize])
+
+    def test_prize_version_read_once(self):
+        """Test that serializing draws reads the prize version once"""
+        draws = [
+            Draw.objects.create(drawtype=self.drawtype, date=date(2025, 1, n))
+            for n in range(1, 4)
+        ]
+        with mock.patch(
+            "lottery.serializers.prizes_version", wraps=version
+        ) as read:
+            data = DrawSerializer(
+                annotate_draws(
+                    Draw.objects.filter(id__in=[draw.id for draw in draws])
+                ),
+                many=True,
+            ).data
+        self.assertEqual(read.call_count, 1)
+        self.assertEqual([len(draw["prizes"]) for draw in data], [1, 1, 1])
+
+    def test_prize_cache_invalidation(self):
+        """Test that saving or deleting a prize reloads the table"""
+        prizes.get(self.drawtype.id)
+        self.prize.number = 2
+        self.prize.save()
+        self.assertEqual(prizes.get(self.drawtype.id)[0].number, 2)
+
+        prize2 = Prize.objects.create(
+            name="Second Prize", amount=5000, number=1, drawtype=self.drawtype
+        )
+        self.assertEqual(prizes.get(self.drawtype.id), (self.prize, prize2))
+        prize2.delete()
+        self.assertEqual(prizes.get(self.drawtype.id), (self.prize,))
+
+        # Another process sees the new version in the shared cache.
+        other = DrawTypeCache(prizes.load)
+        other.get(self.drawtype.id)
+        Prize.objects.filter(id=self.prize.id).update(number=3)
+        bump_version()
+        self.assertEqual(other.get(self.drawtype.id)[0].number, 3)
+
 
 class DrawTests(TestCase):
     def setUp(self):
@@ -196,6 +329,731 @@ class DrawTests(TestCase):
         self.assertEqual(winning_ballots.count(), 0)
 
 
+class DrawEngineTests(DrawSetupMixin, TestCase):
+    def create_ballots(self):
+        self.other_draw = Draw.objects.create(
+            date=date(2025, 7, 29), drawtype=self.drawtype
+        )
+        # Interleave ballots of two draws, so the id range has gaps.
+        Ballot.objects.bulk_create(
+            Ballot(
+                draw=self.draw if i % 3 == 0 else self.other_draw,
+                account=self.user.account,
+            )
+            for i in range(60)
+        )
+
+    def test_sample_engine_picks_ballots_of_draw(self):
+        """Test that sampled winners are distinct ballots of the draw"""
+        winners = select_winners(self.draw, 5, engine="sample")
+        self.assertEqual(len(winners), 5)
+        self.assertEqual(len(set(winners)), 5)
+        self.assertEqual(
+            Ballot.objects.filter(id__in=winners, draw=self.draw).count(), 5
+        )
+
+    def test_sample_engine_everybody_wins(self):
+        """Test that all ballots win when there are more prizes"""
+        winners = select_winners(self.draw, 100, engine="sample")
+        self.assertCountEqual(
+            winners, self.draw.ballots.values_list("id", flat=True)
+        )
+
+    def test_sample_engine_wide_range_skips_count(self):
+        """Test that a wide id range is sampled without counting ballots"""
+        with mock.patch("lottery.engines.SAMPLE_BATCH_SIZE", 8):
+            with CaptureQueriesContext(connection) as queries:
+                winners = select_winners(self.draw, 5, engine="sample")
+            self.assertCountEqual(
+                select_winners(self.draw, 100, engine="sample"),
+                self.draw.ballots.values_list("id", flat=True),
+            )
+        self.assertEqual(len(set(winners)), 5)
+        self.assertEqual(
+            Ballot.objects.filter(id__in=winners, draw=self.draw).count(), 5
+        )
+        for query in queries:
+            self.assertNotIn("COUNT(", query["sql"])
+
+    def test_sample_engine_reproducible(self):
+        """Test that the same random state gives the same winners"""
+        self.assertEqual(
+            select_winners(
+                self.draw, 5, engine="sample", rng=random.Random(42)
+            ),
+            select_winners(
+                self.draw, 5, engine="sample", rng=random.Random(42)
+            ),
+        )
+
+    def test_numpy_engine_from_database(self):
+        """Test NumPy selection with ballot ids loaded in chunks"""
+        ballot_ids = load_ballot_ids(self.draw, chunk_size=7)
+        self.assertEqual(
+            ballot_ids.tolist(),
+            list(
+                self.draw.ballots.order_by("id").values_list("id", flat=True)
+            ),
+        )
+        winners = select_winners(
+            self.draw, 5, engine="numpy", rng=random.Random(42)
+        )
+        self.assertEqual(len(set(winners)), 5)
+        self.assertEqual(
+            Ballot.objects.filter(id__in=winners, draw=self.draw).count(), 5
+        )
+        self.assertEqual(
+            winners,
+            select_winners(
+                self.draw, 5, engine="numpy", rng=random.Random(42)
+            ),
+        )
+
+    def test_numpy_sample_winners(self):
+        """Test sampling ids without replacement, reproducibly"""
+        ballot_ids = np.arange(100, 110)
+        winners = sample_winners(ballot_ids, 4, seed=1)
+        self.assertEqual(len(set(winners.tolist())), 4)
+        self.assertTrue(set(winners.tolist()) <= set(ballot_ids.tolist()))
+        self.assertEqual(
+            winners.tolist(), sample_winners(ballot_ids, 4, seed=1).tolist()
+        )
+        self.assertEqual(
+            sorted(sample_winners(ballot_ids, 20, seed=1).tolist()),
+            ballot_ids.tolist(),
+        )
+
+    def test_unknown_engine(self):
+        """Test that an unknown engine is a configuration error"""
+        with self.assertRaises(ImproperlyConfigured):
+            select_winners(self.draw, 1, engine="nonexistent")
+
+    def test_assign_prizes_single_statement(self):
+        """Test that prize assignments are written in one query"""
+        prizes = expand_prizes(self.draw)
+        winners = select_winners(self.draw, len(prizes), engine="sample")
+        with self.assertNumQueries(1):
+            assign_prizes(prizes, winners)
+        self.assertEqual(self.draw.ballots.filter(prize=self.prize).count(), 3)
+
+
+class PartitionedCloseTests(DrawSetupMixin, TestCase):
+    prize_tiers = [("First Prize", 1000, 1), ("Second Prize", 500, 2)]
+    ballot_count = 40
+
+    def setUp(self):
+        super().setUp()
+        self.first, self.second = self.prizes
+
+    def test_partition_ranges(self):
+        """Test that partitions cover the whole id range without overlap"""
+        ranges = partition_ranges(self.draw, 3)
+        self.assertEqual(len(ranges), 3)
+        ids = self.draw.ballots.values_list("id", flat=True)
+        self.assertEqual(ranges[0][0], min(ids))
+        self.assertEqual(ranges[-1][1], max(ids))
+        for (_, high), (low, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(low, high + 1)
+
+    @override_settings(LOTTERY_CLOSE_PARTITIONS=4)
+    def test_partitioned_close(self):
+        """Test closing a draw with a chord over partitions (eager)"""
+        close_lottery_draw(self.draw.id)
+        self.draw.refresh_from_db()
+        self.assertIsNotNone(self.draw.closed)
+        self.assertEqual(self.draw.ballots.filter(prize=self.first).count(), 1)
+        self.assertEqual(
+            self.draw.ballots.filter(prize=self.second).count(), 2
+        )
+
+    @override_settings(LOTTERY_CLOSE_PARTITIONS=4)
+    def test_replay_partitioned_close(self):
+        """Test replaying a partitioned close from the seed and ranges"""
+        close_lottery_draw(self.draw.id)
+        result = DrawResult.objects.get(draw=self.draw)
+        self.assertEqual(len(result.partitions), 4)
+        self.assertEqual(len(result.winners), 3)
+        with override_settings(LOTTERY_CLOSE_PARTITIONS=2):
+            self.assertEqual(replay_winners(result), result.winners)
+            out = io.StringIO()
+            call_command("replay_draw", self.draw.id, stdout=out)
+        self.assertIn("matches 3 recorded winners", out.getvalue())
+
+    @override_settings(LOTTERY_CLOSE_PARTITIONS=4)
+    def test_duplicate_partitioned_close_is_cheap(self):
+        """Test that a duplicate delivery doesn't send the chord again"""
+        with mock.patch("lottery.tasks.chord") as chord:
+            close_lottery_draw(self.draw.id)
+            with CaptureQueriesContext(connection) as queries:
+                close_lottery_draw(self.draw.id)
+        self.assertEqual(chord.call_count, 1)
+        for query in queries:
+            self.assertNotIn("lottery_ballot", query["sql"])
+        result = DrawResult.objects.get(draw=self.draw)
+        self.assertEqual(result.state, DrawResult.State.CLOSING)
+        self.assertIsNotNone(result.dispatched)
+
+    @override_settings(LOTTERY_CLOSE_PARTITIONS=4, LOTTERY_PARTITION_TIMEOUT=0)
+    def test_lost_partitions_are_sent_again(self):
+        """Test that the chord is sent again after the timeout"""
+        with mock.patch("lottery.tasks.chord") as chord:
+            close_lottery_draw(self.draw.id)
+            close_lottery_draw(self.draw.id)
+        self.assertEqual(chord.call_count, 2)
+
+    def test_merged_partitions_are_uniform(self):
+        """Test that merging partition candidates gives a uniform draw"""
+        rng = random.Random(1234)
+        partitions = [range(0, 2), range(2, 9), range(9, 12)]
+        trials = 6000
+        wins = collections.Counter()
+        first = collections.Counter()
+        for _ in range(trials):
+            winners = merge_candidates(
+                [keyed_candidates(p, 3, rng) for p in partitions], 3
+            )
+            self.assertEqual(len(set(winners)), 3)
+            wins.update(winners)
+            first[winners[0]] += 1
+        for ballot in range(12):
+            # Each ballot wins with p=1/4, and the first prize with p=1/12.
+            self.assertAlmostEqual(wins[ballot] / trials, 1 / 4, delta=0.03)
+            self.assertAlmostEqual(first[ballot] / trials, 1 / 12, delta=0.02)
+
+
+class DrawResultTests(DrawSetupMixin, TestCase):
+    prize_tiers = [("Test Prize", 1000, 2)]
+    ballot_count = 10
+
+    def test_close_records_ledger(self):
+        """Test that closing a draw records the winners in the ledger"""
+        close_lottery_draw(self.draw.id)
+        result = DrawResult.objects.get(draw=self.draw)
+        self.assertEqual(result.state, DrawResult.State.DONE)
+        self.assertCountEqual(
+            result.winners,
+            self.draw.ballots.filter(prize=self.prize).values_list(
+                "id", flat=True
+            ),
+        )
+
+    def test_winner_emails_queued_with_prizes(self):
+        """Test that the winner emails are queued in the award transaction"""
+        with mock.patch(
+            "lottery.tasks.queue_winner_emails", side_effect=RuntimeError
+        ):
+            with self.assertRaises(RuntimeError):
+                close_lottery_draw(self.draw.id)
+        self.assertFalse(self.draw.ballots.filter(prize__isnull=False))
+        close_lottery_draw(self.draw.id)
+        # Both winning ballots belong to the same account.
+        email = Outbox.objects.get()
+        self.assertEqual(email.to, ["test@example.com"])
+        self.assertEqual(email.state, Outbox.State.PENDING)
+
+    def test_resume_after_failure(self):
+        """Test that a retried close reuses the stored winners"""
+        with mock.patch(
+            "lottery.tasks.assign_prizes", side_effect=RuntimeError
+        ):
+            with self.assertRaises(RuntimeError):
+                close_lottery_draw(self.draw.id)
+        result = DrawResult.objects.get(draw=self.draw)
+        self.assertEqual(result.state, DrawResult.State.SELECTED)
+        self.draw.refresh_from_db()
+        self.assertIsNotNone(self.draw.closed)
+        self.assertFalse(self.draw.ballots.filter(prize__isnull=False))
+
+        with mock.patch("lottery.tasks.select_winners") as select:
+            close_lottery_draw(self.draw.id)
+            select.assert_not_called()
+        self.assertCountEqual(
+            self.draw.ballots.filter(prize=self.prize).values_list(
+                "id", flat=True
+            ),
+            result.winners,
+        )
+
+    def test_duplicate_close_is_cheap(self):
+        """Test that closing a closed draw does not touch any ballots"""
+        close_lottery_draw(self.draw.id)
+        with CaptureQueriesContext(connection) as queries:
+            close_lottery_draw(self.draw.id)
+        for query in queries:
+            self.assertNotIn("lottery_ballot", query["sql"])
+
+    def test_closed_without_ledger(self):
+        """Test that draws closed without a ledger are left alone"""
+        self.draw.closed = timezone.now()
+        self.draw.save()
+        close_lottery_draw(self.draw.id)
+        self.assertFalse(DrawResult.objects.filter(draw=self.draw))
+        self.assertFalse(self.draw.ballots.filter(prize__isnull=False))
+
+
+class LotteryStatsTests(DrawSetupMixin, TestCase):
+    prize_tiers = [("First Prize", 1000, 1), ("Second Prize", 100, 5)]
+    ballot_count = 4
+
+    def totals(self):
+        totals = stats.get()
+        return (
+            totals.total_draws,
+            totals.closed_draws,
+            totals.total_prizes_awarded,
+            totals.total_amount_awarded,
+        )
+
+    def test_rollup(self):
+        """Test that creating and closing draws add to the totals"""
+        other = Draw.objects.create(
+            date=date(2025, 7, 29), drawtype=self.drawtype
+        )
+        self.assertEqual(self.totals(), (2, 0, 0, 0))
+        close_lottery_draw(self.draw.id)
+        # Only 4 ballots for the 6 prizes.
+        self.assertEqual(self.totals(), (2, 1, 4, 1300))
+        other.delete()
+        self.assertEqual(self.totals(), (1, 1, 4, 1300))
+        stats.rebuild()
+        self.assertEqual(self.totals(), (1, 1, 4, 1300))
+
+    def test_rebuild_command(self):
+        """Test that the rollup is recounted from scratch"""
+        close_lottery_draw(self.draw.id)
+        stats.add(total_draws=5, total_amount_awarded=-1300)
+        out = io.StringIO()
+        call_command("rebuild_lottery_stats", stdout=out)
+        self.assertEqual(self.totals(), (1, 1, 4, 1300))
+        self.assertIn("4 prizes awarded", out.getvalue())
+
+    def test_missing_row(self):
+        """Test that a missing rollup is rebuilt, not updated"""
+        close_lottery_draw(self.draw.id)
+        LotteryStats.objects.all().delete()
+        self.assertEqual(self.totals(), (1, 1, 4, 1300))
+
+    def test_add_without_row(self):
+        """Test that add() doesn't recount when the rollup is missing"""
+        LotteryStats.objects.all().delete()
+        with self.assertNumQueries(1):
+            stats.add(closed_draws=1)
+        self.assertFalse(LotteryStats.objects.exists())
+        close_lottery_draw(self.draw.id)
+        self.assertFalse(LotteryStats.objects.exists())
+        self.assertEqual(self.totals(), (1, 1, 4, 1300))
+
+
+class DrawSummaryTests(DrawSetupMixin, TestCase):
+    prize_tiers = [("First Prize", 1000, 1), ("Second Prize", 100, 2)]
+    ballot_count = 5
+
+    def test_written_at_close(self):
+        """Test that closing a draw stores its totals and winners"""
+        close_lottery_draw(self.draw.id)
+        summary = DrawSummary.objects.get(draw=self.draw)
+        self.assertEqual(summary.ballot_count, 5)
+        self.assertEqual(summary.winner_count, 1)
+        self.assertEqual(summary.total_prize_amount, 1200)
+        self.assertEqual(
+            [winner["prize_amount"] for winner in summary.winners],
+            [1000, 100, 100],
+        )
+        self.assertEqual(summary.winners[0]["name"], "Winner")
+        self.assertEqual(summary.winners[0]["full_name"], "Test Winner")
+
+        # Reading it doesn't touch the ballots.
+        draw = Draw.objects.select_related("summary").get(id=self.draw.id)
+        with self.assertNumQueries(0):
+            summaries.attach([draw])
+        self.assertEqual(draw.summary, summary)
+
+    def test_counted_while_closing(self):
+        """Test that draws without a summary get one from their ballots"""
+        with mock.patch(
+            "lottery.tasks.assign_prizes", side_effect=RuntimeError
+        ):
+            with self.assertRaises(RuntimeError):
+                close_lottery_draw(self.draw.id)
+        open_draw = Draw.objects.create(
+            date=date(2025, 7, 29), drawtype=self.drawtype
+        )
+        draws = Draw.objects.select_related("summary").order_by("date")
+        with self.assertNumQueries(3):
+            closing, open_draw = summaries.attach(draws)
+        self.assertFalse(DrawSummary.objects.exists())
+        self.assertEqual(closing.summary.ballot_count, 5)
+        self.assertEqual(closing.summary.winners, [])
+        self.assertEqual(open_draw.summary.ballot_count, 0)
+
+
+class AccountEngineTests(DrawSetupMixin, TestCase):
+    prize_tiers = []
+
+    def create_ballots(self):
+        self.accounts = []
+        for i, count in enumerate([1, 3, 6]):
+            user = User.objects.create_user(
+                username=f"user{i}@example.com",
+                email=f"user{i}@example.com",
+                password="testpass123",
+            )
+            self.accounts.append(user.account)
+            Ballot.objects.bulk_create(
+                Ballot(draw=self.draw, account=user.account)
+                for _ in range(count)
+            )
+
+    def test_account_engine_picks_distinct_ballots(self):
+        """Test that each win maps to a different ballot of the draw"""
+        with self.assertNumQueries(2):
+            winners = select_winners(self.draw, 8, engine="accounts")
+        self.assertEqual(len(set(winners)), 8)
+        self.assertEqual(
+            Ballot.objects.filter(id__in=winners, draw=self.draw).count(), 8
+        )
+        self.assertCountEqual(
+            select_winners(self.draw, 20, engine="accounts"),
+            self.draw.ballots.values_list("id", flat=True),
+        )
+
+    def test_account_engine_replays_lowest_ballots(self):
+        """Test that an account's wins go to its lowest ballot ids"""
+        account = self.accounts[2]
+        ballot_ids = sorted(
+            self.draw.ballots.filter(account=account).values_list(
+                "id", flat=True
+            )
+        )
+        winners = select_winners(self.draw, 6, "accounts", random.Random(1234))
+        won = [ballot_id for ballot_id in winners if ballot_id in ballot_ids]
+        self.assertGreater(len(won), 1)
+        self.assertEqual(won, ballot_ids[: len(won)])
+        self.assertEqual(
+            winners,
+            select_winners(self.draw, 6, "accounts", random.Random(1234)),
+        )
+
+    def test_account_engine_is_proportional(self):
+        """Test that accounts win in proportion to their ballots"""
+        rng = random.Random(1234)
+        account_of = dict(self.draw.ballots.values_list("id", "account_id"))
+        trials = 600
+        wins = collections.Counter(
+            account_of[select_winners(self.draw, 1, "accounts", rng)[0]]
+            for _ in range(trials)
+        )
+        for account, share in zip(self.accounts, [0.1, 0.3, 0.6]):
+            self.assertAlmostEqual(
+                wins[account.id] / trials, share, delta=0.06
+            )
+
+
+class SnapshotTests(DrawSetupMixin, TestCase):
+    def test_close_with_snapshot(self):
+        """Test that the snapshot holds the sorted ballot ids of the draw"""
+        close_lottery_draw(self.draw.id)
+        result = DrawResult.objects.get(draw=self.draw)
+        self.assertEqual(result.engine, "snapshot")
+        self.assertEqual(result.snapshot_count, 20)
+        with open_snapshot(result) as ballot_ids:
+            self.assertEqual(
+                list(ballot_ids),
+                list(
+                    self.draw.ballots.order_by("id").values_list(
+                        "id", flat=True
+                    )
+                ),
+            )
+        self.assertEqual(len(result.winners), 3)
+        self.assertEqual(self.draw.ballots.filter(prize=self.prize).count(), 3)
+
+    @override_settings(LOTTERY_DRAW_ENGINE="snapshot")
+    def test_snapshot_engine_skips_ballots_table(self):
+        """Test that selecting from a snapshot doesn't query ballots"""
+        close_lottery_draw(self.draw.id)
+        result = DrawResult.objects.select_related("draw").get(draw=self.draw)
+        with CaptureQueriesContext(connection) as queries:
+            winners = replay_winners(result)
+        self.assertEqual(winners, result.winners)
+        for query in queries:
+            self.assertNotIn("lottery_ballot", query["sql"])
+
+    @override_settings(LOTTERY_DRAW_ENGINE="numpy")
+    def test_close_with_numpy_engine(self):
+        """Test that the numpy engine selects from the snapshot"""
+        close_lottery_draw(self.draw.id)
+        result = DrawResult.objects.select_related("draw").get(draw=self.draw)
+        self.assertEqual(result.snapshot_count, 20)
+        self.assertEqual(self.draw.ballots.filter(prize=self.prize).count(), 3)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(replay_winners(result), result.winners)
+        for query in queries:
+            self.assertNotIn("lottery_ballot", query["sql"])
+
+    @override_settings(LOTTERY_DRAW_ENGINE="snapshot")
+    def test_tampered_snapshot(self):
+        """Test that a modified snapshot is rejected"""
+        close_lottery_draw(self.draw.id)
+        result = DrawResult.objects.get(draw=self.draw)
+        with open(snapshot_path(result.snapshot), "r+b") as f:
+            f.write(b"\xff")
+        with self.assertRaises(SnapshotError):
+            with open_snapshot(result):
+                pass
+
+    @override_settings(LOTTERY_DRAW_ENGINE="snapshot")
+    def test_freeze_before_close(self):
+        """Test that the close selects from the snapshot frozen before it"""
+        self.draw.date = timezone.now().date()
+        self.draw.save()
+        freeze_todays_draw()
+        self.draw.refresh_from_db()
+        self.assertIsNotNone(self.draw.closed)
+        result = DrawResult.objects.get(draw=self.draw)
+        self.assertEqual(result.state, DrawResult.State.CLOSING)
+        self.assertEqual(result.snapshot_count, 20)
+        with mock.patch("lottery.tasks.write_snapshot") as write:
+            close_lottery_draw(self.draw.id)
+        write.assert_not_called()
+        self.assertEqual(self.draw.ballots.filter(prize=self.prize).count(), 3)
+
+    @override_settings(LOTTERY_DRAW_ENGINE="snapshot")
+    def test_replay_draw_command(self):
+        """Test replaying a closed draw from its snapshot"""
+        close_lottery_draw(self.draw.id)
+        out = io.StringIO()
+        call_command("replay_draw", self.draw.id, stdout=out)
+        self.assertIn("matches 3 recorded winners", out.getvalue())
+
+
+class CatchUpTests(TestCase):
+    def setUp(self):
+        self.drawtype = DrawType.objects.create(name="Test Draw")
+        Prize.objects.create(
+            name="Test Prize", amount=1000, number=1, drawtype=self.drawtype
+        )
+        self.missed = [
+            Draw.objects.create(
+                date=date(2025, 7, day), drawtype=self.drawtype
+            )
+            for day in (23, 21, 22)
+        ]
+        self.future = Draw.objects.create(
+            date=date(2025, 7, 30), drawtype=self.drawtype
+        )
+
+    def test_close_missed_draws_in_date_order(self):
+        """Test that all missed draws are closed, oldest first"""
+        progress = []
+        closed, failed = close_draws_until(
+            date(2025, 7, 28),
+            workers=1,
+            progress=lambda *args: progress.append(args),
+        )
+        self.assertEqual((closed, failed), (3, 0))
+        self.assertEqual(
+            [draw_id for _, _, draw_id, _ in progress],
+            [self.missed[1].id, self.missed[2].id, self.missed[0].id],
+        )
+        self.assertEqual(progress[-1][:2], (3, 3))
+        self.assertEqual(
+            Draw.objects.filter(closed__isnull=True).get(), self.future
+        )
+
+    def test_failure_does_not_stop_catch_up(self):
+        """Test that a failing draw is reported and the others closed"""
+        failing = self.missed[1].id
+
+        def close(draw_id):
+            if draw_id == failing:
+                raise RuntimeError("boom")
+            close_lottery_draw(draw_id)
+
+        with mock.patch("lottery.tasks.close_lottery_draw", close):
+            closed, failed = close_draws_until(date(2025, 7, 28), workers=1)
+        self.assertEqual((closed, failed), (2, 1))
+        self.assertEqual(
+            set(Draw.objects.filter(closed__isnull=True)),
+            {self.missed[1], self.future},
+        )
+
+    @override_settings(LOTTERY_CATCHUP_WORKERS=1)
+    def test_close_missed_draws_command(self):
+        """Test the management command reports progress"""
+        out = io.StringIO()
+        call_command("close_missed_draws", "--until=2025-07-28", stdout=out)
+        self.assertIn("[3/3]", out.getvalue())
+        self.assertIn("Closed 3 draws", out.getvalue())
+
+
+class WinnerEmailTests(TestCase):
+    def setUp(self):
+        drawtype = DrawType.objects.create(name="Test Draw")
+        self.prize = Prize.objects.create(
+            name="Test Prize", amount=1000, number=5, drawtype=drawtype
+        )
+        self.draw = Draw.objects.create(
+            date=date(2025, 7, 28), drawtype=drawtype, closed=timezone.now()
+        )
+        self.result = DrawResult.objects.create(
+            draw=self.draw, state=DrawResult.State.DONE
+        )
+        for n in range(5):
+            user = User.objects.create_user(
+                username=f"winner{n}@example.com",
+                email=f"winner{n}@example.com",
+            )
+            Ballot.objects.create(
+                draw=self.draw, account=user.account, prize=self.prize
+            )
+
+    def send(self):
+        send_lottery_winner_emails(
+            self.draw.id, queue_winner_emails(self.draw)
+        )
+
+    @override_settings(
+        EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+        LOTTERY_EMAIL_CHUNK_SIZE=2,
+    )
+    def test_winner_emails_in_chunks(self):
+        """Test that all winners are notified and the counts recorded"""
+        with mock.patch(
+            "lottery.tasks.Dispatcher", wraps=Dispatcher
+        ) as dispatcher:
+            self.send()
+        self.assertEqual(dispatcher.call_count, 3)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertFalse(
+            Outbox.objects.exclude(state=Outbox.State.SENT).exists()
+        )
+        self.result.refresh_from_db()
+        self.assertEqual(
+            (self.result.emails_sent, self.result.emails_failed), (5, 0)
+        )
+
+    @override_settings(
+        EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+        LOTTERY_EMAIL_CHUNK_SIZE=2,
+    )
+    def test_failed_emails_stay_queued(self):
+        """Test that emails that fail are counted and left in the outbox"""
+
+        def send_each(connection, messages):
+            return [
+                (
+                    ConnectionRefusedError()
+                    if m.to == ["winner2@example.com"]
+                    else None
+                )
+                for m in messages
+            ]
+
+        with mock.patch("service.outbox.send_each", send_each):
+            self.send()
+        email = Outbox.objects.exclude(state=Outbox.State.SENT).get()
+        self.assertEqual(email.to, ["winner2@example.com"])
+        self.assertEqual(email.state, Outbox.State.PENDING)
+        self.assertEqual(email.attempts, 1)
+        self.result.refresh_from_db()
+        self.assertEqual(
+            (self.result.emails_sent, self.result.emails_failed), (4, 1)
+        )
+
+    @override_settings(LOTTERY_EMAIL_CHUNK_SIZE=2)
+    def test_failed_chunk_is_retried(self):
+        """Test that a chunk is retried, then counted as failed"""
+        # Eager tasks only retry when their errors aren't propagated.
+        celery_app.conf.update(CELERY_TASK_EAGER_PROPAGATES=False)
+        self.addCleanup(
+            celery_app.conf.update, CELERY_TASK_EAGER_PROPAGATES=True
+        )
+        with mock.patch(
+            "lottery.tasks.Dispatcher.dispatch", side_effect=DatabaseError
+        ) as dispatch:
+            self.send()
+        self.assertEqual(dispatch.call_count, 3 * 6)
+        self.assertEqual(
+            Outbox.objects.filter(state=Outbox.State.PENDING).count(), 5
+        )
+        self.result.refresh_from_db()
+        self.assertEqual(
+            (self.result.emails_sent, self.result.emails_failed), (0, 5)
+        )
+
+    def test_winner_email_queries(self):
+        """Test that the number of queries doesn't grow with the winners"""
+        with CaptureQueriesContext(connection) as five:
+            queue_winner_emails(self.draw)
+        Outbox.objects.all().delete()
+        for n in range(5, 20):
+            user = User.objects.create_user(
+                username=f"winner{n}@example.com",
+                email=f"winner{n}@example.com",
+            )
+            Ballot.objects.create(
+                draw=self.draw, account=user.account, prize=self.prize
+            )
+            Ballot.objects.create(
+                draw=self.draw, account=user.account, prize=self.prize
+            )
+        with CaptureQueriesContext(connection) as twenty:
+            outbox_ids = queue_winner_emails(self.draw)
+        self.assertEqual(len(outbox_ids), 20)
+        email = Outbox.objects.get(id=outbox_ids[-1])
+        self.assertIn("Total Winnings", email.body)
+        self.assertEqual(len(twenty), len(five))
+        # The winners and inserting their emails.
+        self.assertEqual(len(twenty), 2)
+
+    def test_no_winners(self):
+        """Test that a draw without winners records zero emails"""
+        self.draw.ballots.update(prize=None)
+        self.send()
+        self.assertFalse(Outbox.objects.exists())
+        self.result.refresh_from_db()
+        self.assertEqual(
+            (self.result.emails_sent, self.result.emails_failed), (0, 0)
+        )
+
+
+class BenchCloseTests(TestCase):
+    def test_bench_close_command(self):
+        """Test that the benchmark reports all phases and rolls back"""
+        out = io.StringIO()
+        # The emails are sent in this process, not through the broker.
+        with mock.patch("lottery.tasks.chord") as chord:
+            call_command(
+                "bench_close",
+                "--accounts=5",
+                "--ballots=50",
+                "--prizes",
+                "1",
+                "2",
+                stdout=out,
+            )
+        chord.assert_not_called()
+        self.assertTrue(mail.outbox)
+        results = json.loads(out.getvalue())
+        self.assertEqual(results["ballots"], 50)
+        self.assertEqual(results["winners"], 3)
+        self.assertEqual(
+            set(results["phases"]),
+            {
+                "setup",
+                "prize_expansion",
+                "snapshot",
+                "selection",
+                "writes",
+                "email_queue",
+                "email_fanout",
+            },
+        )
+        self.assertEqual(results["phases"]["writes"]["queries"], 1)
+        self.assertFalse(Ballot.objects.exists())
+
+
 class BallotTests(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(
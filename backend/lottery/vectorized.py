@@ -0,0 +1,68 @@
+"""
+NumPy version of winner selection.
+
+Ballot ids are handled as int64 arrays instead of lists of Python ints,
+taken from the draw's snapshot without copying, or loaded from the
+database in chunks.
+
+- load_ballot_ids
+- sample_winners
+"""
+
+import itertools
+
+import numpy as np
+
+from .snapshots import open_snapshot
+
+
+CHUNK_SIZE = 65536
+
+
+def load_ballot_ids(draw, chunk_size=CHUNK_SIZE):
+    """The ballot ids of the draw as an int64 array, fetched in chunks."""
+    ballot_ids = (
+        draw.ballots.order_by("id")
+        .values_list("id", flat=True)
+        .iterator(chunk_size=chunk_size)
+    )
+    chunks = []
+    while True:
+        chunk = np.fromiter(
+            itertools.islice(ballot_ids, chunk_size), dtype=np.int64
+        )
+        if not len(chunk):
+            break
+        chunks.append(chunk)
+    return np.concatenate(chunks) if chunks else np.empty(0, np.int64)
+
+
+def sample_winners(ballot_ids, k, seed):
+    """
+    Pick k ids without replacement, in random order.
+
+    The same seed gives the same winners for the same ballot ids.
+    """
+    rng = np.random.default_rng(seed)
+    if k >= len(ballot_ids):
+        return rng.permutation(ballot_ids)
+    return ballot_ids[rng.choice(len(ballot_ids), size=k, replace=False)]
+
+
+def numpy_engine(draw, k, rng):
+    """
+    Pick k ballots with NumPy, from the snapshot if there is one.
+
+    The NumPy generator is seeded from rng, so a seeded rng gives
+    reproducible winners.
+    """
+    seed = rng.getrandbits(64)
+    result = getattr(draw, "result", None)
+    if result is None or not result.snapshot:
+        return sample_winners(load_ballot_ids(draw), k, seed).tolist()
+    with open_snapshot(result) as view:
+        ballot_ids = np.frombuffer(view, dtype=np.int64)
+        winners = sample_winners(ballot_ids, k, seed).tolist()
+        # Release the buffer, so the snapshot can be unmapped.
+        del ballot_ids
+    return winners
@@ -3,6 +3,8 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.shortcuts import redirect, get_object_or_404
 from django.contrib import messages
 from django.views import View
+from django.db import transaction
+from . import summaries
 from .models import Draw, Ballot
 from .forms import BallotPurchaseForm
 
@@ -23,8 +25,12 @@ class ClosedDrawsListView(ListView):
     context_object_name = "draws"
 
     def get_queryset(self):
-        """Return all draws that have been closed"""
-        return Draw.objects.filter(closed__isnull=False).order_by("-date")
+        """Return all draws that have been closed, with their summaries"""
+        return summaries.attach(
+            Draw.objects.filter(closed__isnull=False)
+            .select_related("drawtype", "summary")
+            .order_by("-date")
+        )
 
 
 class UserBallotsView(LoginRequiredMixin, ListView):
@@ -106,18 +112,25 @@ class AssignBallotView(LoginRequiredMixin, View):
             )
             return redirect("lottery:user_ballots")
 
-        draw = get_object_or_404(Draw, id=draw_id, closed__isnull=True)
-
-        if ballot.draw:
-            messages.error(
-                request, "This ballot is already assigned to a draw."
-            )
-        else:
-            ballot.draw = draw
-            ballot.save()
-            messages.success(
-                request,
-                f"Ballot assigned to {draw.drawtype.name} on {draw.date}.",
+        # Lock the draw against a concurrent close, as in the API.
+        with transaction.atomic():
+            draw = get_object_or_404(
+                Draw.objects.select_for_update(),
+                id=draw_id,
+                closed__isnull=True,
             )
 
+            if ballot.draw:
+                messages.error(
+                    request, "This ballot is already assigned to a draw."
+                )
+            else:
+                ballot.draw = draw
+                ballot.save()
+                messages.success(
+                    request,
+                    f"Ballot assigned to {draw.drawtype.name} on "
+                    f"{draw.date}.",
+                )
+
         return redirect("lottery:user_ballots")
@@ -0,0 +1,12 @@
+from django.contrib import admin
+
+from .models import Outbox
+
+
+@admin.register(Outbox)
+class OutboxAdmin(admin.ModelAdmin):
+    list_display = ("subject", "to", "state", "attempts", "created", "sent")
+    list_filter = ("state", "template_name")
+    search_fields = ("subject", "to")
+    date_hierarchy = "created"
+    readonly_fields = ("created", "sent", "last_error")
@@ -0,0 +1,262 @@
+"""
+Email backend sending many messages at once over asyncio SMTP sessions.
+
+    EMAIL_BACKEND = "service.backends.AsyncSMTPBackend"
+    EMAIL_CONCURRENCY = 8
+
+Takes the same settings as Django's SMTP backend. Messages are sent over
+a pool of at most EMAIL_CONCURRENCY sessions, so sending a batch doesn't
+wait for every SMTP round trip in turn. Within a session, the envelope
+commands are pipelined when the server supports it (RFC 2920).
+"""
+
+import base64
+import asyncio
+
+from django.conf import settings
+from django.core.mail.backends import smtp
+from django.core.mail.message import sanitize_address
+from django.core.mail.utils import DNS_NAME
+
+
+class SMTPError(Exception):
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class SMTPSession:
+    """One SMTP session on asyncio streams."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.extensions = set()
+
+    @classmethod
+    async def connect(cls, backend):
+        use_ssl = backend.ssl_context if backend.use_ssl else None
+        reader, writer = await asyncio.open_connection(
+            backend.host, backend.port, ssl=use_ssl
+        )
+        session = cls(reader, writer)
+        try:
+            await session.reply(220)
+            await session.ehlo()
+            if backend.use_tls:
+                await session.command("STARTTLS", 220)
+                await writer.start_tls(
+                    backend.ssl_context, server_hostname=backend.host
+                )
+                await session.ehlo()
+            if backend.username and backend.password:
+                token = base64.b64encode(
+                    f"\0{backend.username}\0{backend.password}".encode()
+                ).decode()
+                await session.command(f"AUTH PLAIN {token}", 235)
+        except BaseException:
+            session.abort()
+            raise
+        return session
+
+    async def reply(self, expected):
+        """Read a (multiline) reply, raise if its code isn't expected."""
+        lines = []
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                raise ConnectionResetError("SMTP server closed connection")
+            lines.append(line[4:].decode(errors="replace").rstrip())
+            if line[3:4] != b"-":
+                break
+        code = int(line[:3])
+        if code != expected:
+            raise SMTPError(code, " ".join(lines))
+        return lines
+
+    async def command(self, command, expected):
+        self.writer.write(f"{command}\r\n".encode())
+        await self.writer.drain()
+        return await self.reply(expected)
+
+    async def ehlo(self):
+        lines = await self.command(f"EHLO {DNS_NAME}", 250)
+        self.extensions = {line.split()[0].upper() for line in lines[1:]}
+
+    async def send(self, from_email, recipients, data):
+        """
+        Send one message. Like smtplib, it's sent when at least one of
+        the recipients is accepted.
+        """
+        commands = [
+            (f"MAIL FROM:<{from_email}>", 250),
+            *((f"RCPT TO:<{recipient}>", 250) for recipient in recipients),
+            ("DATA", 354),
+        ]
+        if "PIPELINING" in self.extensions:
+            self.writer.write(
+                b"".join(f"{command}\r\n".encode() for command, _ in commands)
+            )
+            await self.writer.drain()
+            # Read all replies, so the session stays in sync on errors.
+            errors = [await self.error(expected) for _, expected in commands]
+        else:
+            errors = []
+            for command, expected in commands:
+                self.writer.write(f"{command}\r\n".encode())
+                await self.writer.drain()
+                errors.append(await self.error(expected))
+                if (
+                    errors[0]
+                    or len(errors) == len(commands) - 1
+                    and all(errors[1:])
+                ):
+                    # No sender or no recipients, don't ask for DATA.
+                    break
+        if len(errors) < len(commands) or errors[-1]:
+            await self.command("RSET", 250)
+            raise next(error for error in errors if error)
+        self.writer.write(quote_data(data))
+        await self.writer.drain()
+        await self.reply(250)
+
+    async def error(self, expected):
+        """Read a reply, return the error instead of raising it."""
+        try:
+            await self.reply(expected)
+        except SMTPError as e:
+            return e
+
+    async def quit(self):
+        try:
+            await self.command("QUIT", 221)
+        except (OSError, SMTPError):
+            pass
+        self.abort()
+
+    def abort(self):
+        self.writer.close()
+
+
+def quote_data(data):
+    """Message bytes with dots at line starts doubled, and the final dot."""
+    lines = data.split(b"\r\n")
+    if lines[-1] == b"":
+        lines.pop()
+    stuffed = (
+        b"." + line if line.startswith(b".") else line for line in lines
+    )
+    return b"\r\n".join(stuffed) + b"\r\n.\r\n"
+
+
+class AsyncSMTPBackend(smtp.EmailBackend):
+    """
+    SMTP backend sending messages concurrently.
+
+    send_each returns an error or None per message, for callers that
+    count failures per message. send_messages returns the number sent,
+    and raises the first error unless fail_silently.
+    """
+
+    def __init__(self, concurrency=None, **kwargs):
+        super().__init__(**kwargs)
+        self.concurrency = concurrency or settings.EMAIL_CONCURRENCY
+        self.loop = None
+        self.sessions = []
+        self.idle = []
+
+    def open(self):
+        if self.loop is not None:
+            return False
+        self.loop = asyncio.new_event_loop()
+        self.sessions = []
+        self.idle = []
+        return True
+
+    def close(self):
+        if self.loop is None:
+            return
+        try:
+            self.loop.run_until_complete(self._quit())
+        finally:
+            self.loop.close()
+            self.loop = None
+            self.sessions = []
+            self.idle = []
+
+    async def _quit(self):
+        await asyncio.gather(
+            *(session.quit() for session in self.sessions),
+            return_exceptions=True,
+        )
+
+    def send_messages(self, email_messages):
+        errors = self.send_each(email_messages)
+        failures = [error for error in errors if error is not None]
+        if failures and not self.fail_silently:
+            raise failures[0]
+        return len(errors) - len(failures)
+
+    def send_each(self, email_messages):
+        if not email_messages:
+            return []
+        with self._lock:
+            new_connection = self.open()
+            try:
+                return self.loop.run_until_complete(
+                    self._send_all(email_messages)
+                )
+            finally:
+                if new_connection:
+                    self.close()
+
+    async def _send_all(self, email_messages):
+        slots = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(
+            *(self._send(message, slots) for message in email_messages)
+        )
+
+    async def _send(self, message, slots):
+        """Send a message on an idle session, return the error if any."""
+        if not message.recipients():
+            return None
+        try:
+            encoding = message.encoding or settings.DEFAULT_CHARSET
+            from_email = sanitize_address(message.from_email, encoding)
+            recipients = [
+                sanitize_address(addr, encoding)
+                for addr in message.recipients()
+            ]
+            data = message.message().as_bytes(linesep="\r\n")
+        except Exception as e:
+            return e
+        # At most one message per session at a time, so holding a slot
+        # means there's an idle session, or room for a new one.
+        async with slots:
+            try:
+                session = (
+                    self.idle.pop() if self.idle else await self.connect()
+                )
+            except (OSError, SMTPError, asyncio.TimeoutError) as e:
+                return e
+            try:
+                await asyncio.wait_for(
+                    session.send(from_email, recipients, data), self.timeout
+                )
+            except SMTPError as e:
+                # The server refused this message, the session is still good.
+                self.idle.append(session)
+                return e
+            except (OSError, asyncio.TimeoutError) as e:
+                self.sessions.remove(session)
+                session.abort()
+                return e
+            self.idle.append(session)
+            return None
+
+    async def connect(self):
+        session = await asyncio.wait_for(
+            SMTPSession.connect(self), self.timeout
+        )
+        self.sessions.append(session)
+        return session
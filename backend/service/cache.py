@@ -0,0 +1,76 @@
+"""
+Single-flight computation of cached values.
+
+    value = single_flight(key, compute, timeout=300, stale=60)
+
+The value is fresh for timeout seconds, and kept for stale seconds more.
+When it is stale or missing, only the process that gets the lock runs
+compute(); the others serve the stale copy, or without one wait up to
+SINGLE_FLIGHT_WAIT seconds for the new value. So an expired value is
+computed once, not by every worker at the same time.
+
+The lock is a cache.add, SET NX on Redis. It expires after
+SINGLE_FLIGHT_LOCK_TIMEOUT seconds in case its process dies.
+"""
+
+import time
+import secrets
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+# Seconds between checks for the value while another process computes it.
+POLL_INTERVAL = 0.05
+
+
+def single_flight(key, compute, timeout, stale=0):
+    entry = cache.get(key)
+    if entry is not None and time.time() < entry[1]:
+        return entry[0]
+    token = acquire(key)
+    if token is None:
+        if entry is not None:
+            return entry[0]
+        entry = wait(key)
+        if entry is not None:
+            return entry[0]
+        # The lock holder takes too long, don't wait any longer.
+        value = compute()
+        store(key, value, timeout, stale)
+        return value
+    try:
+        value = compute()
+        store(key, value, timeout, stale)
+        return value
+    finally:
+        release(key, token)
+
+
+def store(key, value, timeout, stale):
+    cache.set(key, (value, time.time() + timeout), timeout + stale)
+
+
+def acquire(key):
+    """Take the lock on computing key, return its token or None."""
+    token = secrets.token_hex(8)
+    if cache.add(f"{key}:lock", token, settings.SINGLE_FLIGHT_LOCK_TIMEOUT):
+        return token
+    return None
+
+
+def release(key, token):
+    # Only our own lock, it may have expired and been taken by another.
+    if cache.get(f"{key}:lock") == token:
+        cache.delete(f"{key}:lock")
+
+
+def wait(key):
+    """Wait for another process to store key, return its entry or None."""
+    deadline = time.monotonic() + settings.SINGLE_FLIGHT_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
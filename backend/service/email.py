@@ -1,26 +1,121 @@
 """
-Utility function for sending emails.
+Utility functions for sending emails.
+
+- send_templated_email
+- send_templated_emails
 """
 
 import os
 import re
+import itertools
 import mimetypes
 import logging
-
+import threading
+from collections import OrderedDict
 from email.mime.image import MIMEImage
 
 from django.conf import settings
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.template import loader, TemplateDoesNotExist
 
 
 logger = logging.getLogger(__name__)
 
 
+CID_PATTERN = re.compile("['\"\\(]cid:([^'\"\\)]+)['\"\\)]")
+
+
+def mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class TemplateCache:
+    """
+    The text and html template of an email, by template name.
+
+    Also caches that an email has no html template. With DEBUG, an entry
+    is dropped when its template files change, or a file is added next to
+    the text template.
+    """
+
+    def __init__(self):
+        self.templates = {}
+
+    def get(self, template_name):
+        entry = self.templates.get(template_name)
+        if entry is not None and not (settings.DEBUG and self.stale(entry)):
+            return entry[:2]
+        text = loader.get_template(template_name + ".txt")
+        try:
+            html = loader.get_template(template_name + ".html")
+            paths = [text.origin.name, html.origin.name]
+        except TemplateDoesNotExist:
+            html = None
+            paths = [text.origin.name, os.path.dirname(text.origin.name)]
+        mtimes = [(path, mtime(path)) for path in paths]
+        self.templates[template_name] = (text, html, mtimes)
+        return text, html
+
+    def stale(self, entry):
+        return any(mtime(path) != t for path, t in entry[2])
+
+    def clear(self):
+        self.templates.clear()
+
+
+class ImageCache:
+    """
+    Image bytes from STATIC_ROOT/images, by filename.
+
+    Holds at most settings.EMAIL_IMAGE_CACHE_SIZE bytes, the least
+    recently used images are dropped first. With DEBUG, an image is read
+    again when its file changes.
+    """
+
+    def __init__(self):
+        self.images = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, filename):
+        path = settings.STATIC_ROOT / "images" / filename
+        with self.lock:
+            entry = self.images.get(filename)
+            if entry is not None and not (
+                settings.DEBUG and mtime(path) != entry[0]
+            ):
+                self.images.move_to_end(filename)
+                return entry[1]
+        modified = mtime(path)
+        image = open(path, "rb").read() if modified is not None else None
+        with self.lock:
+            self.pop(filename)
+            if len(image or b"") <= settings.EMAIL_IMAGE_CACHE_SIZE:
+                self.images[filename] = (modified, image)
+                self.size += len(image or b"")
+            while self.size > settings.EMAIL_IMAGE_CACHE_SIZE:
+                self.pop(next(iter(self.images)))
+        return image
+
+    def pop(self, filename):
+        modified, image = self.images.pop(filename, (None, None))
+        self.size -= len(image or b"")
+
+    def clear(self):
+        with self.lock:
+            self.images.clear()
+            self.size = 0
+
+
+templates = TemplateCache()
+images = ImageCache()
+
+
 def read_image(filename):
-    f = settings.STATIC_ROOT / "images" / filename
-    if os.path.exists(f):
-        return open(f, "rb").read()
+    return images.get(filename)
 
 
 class EmailInlineImages(EmailMultiAlternatives):
@@ -43,18 +138,28 @@ class EmailInlineImages(EmailMultiAlternatives):
         self.mixed_subtype = "related"
 
 
-def send_templated_email(
+def render_templated_email(subject, template_name, context_dict):
+    """The text and (optional) html part of a templated email."""
+    if "subject" not in context_dict:
+        context_dict["subject"] = subject
+    context_dict = {"settings": settings, **context_dict}
+    text_template, html_template = templates.get(template_name)
+    text_part = text_template.render(context_dict)
+    html_part = html_template and html_template.render(context_dict)
+    return text_part, html_part
+
+
+def build_email(
     from_email,
     to,
     subject,
-    template_name,
-    context_dict,
+    text_part,
+    html_part=None,
     bcc=None,
     attachments=None,
-    **kwargs
+    **kwargs,
 ):
-    if "subject" not in context_dict:
-        context_dict["subject"] = subject
+    """The message for a rendered email, with its inline images."""
     if isinstance(to, str):
         to = [to]
     if bcc is None:
@@ -62,28 +167,18 @@ def send_templated_email(
     elif isinstance(bcc, str):
         bcc = [bcc]
 
-    # Get and render the text and (optional) html part for the email
-    context_dict = {"settings": settings, **context_dict}
-    template = loader.get_template(template_name + ".txt")
-    text_part = template.render(context_dict)
-    try:
-        template = loader.get_template(template_name + ".html")
-        html_part = template.render(context_dict)
-    except TemplateDoesNotExist:
-        html_part = None
-
     message = EmailInlineImages(
         subject=subject,
         body=text_part,
         from_email=from_email,
         to=to,
         bcc=bcc,
-        **kwargs
+        **kwargs,
     )
 
     if html_part:
         message.attach_alternative(html_part, "text/html")
-        for image in re.findall("['\"\\(]cid:([^'\"\\)]+)['\"\\)]", html_part):
+        for image in CID_PATTERN.findall(html_part):
             message.inline_image(image)
 
     for attachment in attachments or []:
@@ -93,4 +188,96 @@ def send_templated_email(
             mimetypes.guess_type(attachment.name)[0],
         )
 
-    message.send()
+    return message
+
+
+def build_templated_email(
+    from_email,
+    to,
+    subject,
+    template_name,
+    context_dict,
+    bcc=None,
+    attachments=None,
+    **kwargs,
+):
+    text_part, html_part = render_templated_email(
+        subject, template_name, context_dict
+    )
+    return build_email(
+        from_email,
+        to,
+        subject,
+        text_part,
+        html_part,
+        bcc=bcc,
+        attachments=attachments,
+        **kwargs,
+    )
+
+
+def send_templated_email(*args, connection=None, **kwargs):
+    """
+    Render and send one email.
+
+    Pass an open connection to reuse it, otherwise the message opens and
+    closes its own.
+    """
+    build_templated_email(*args, connection=connection, **kwargs).send()
+
+
+def send_templated_emails(emails, chunk_size=None, connection=None):
+    """
+    Render and send many emails over one connection.
+
+    emails is an iterable of dicts with send_templated_email arguments.
+    The connection is reopened every chunk_size messages, as SMTP
+    servers limit the messages per session (settings.EMAIL_BATCH_SIZE).
+    A message that fails is logged and skipped.
+
+    Returns the number of messages sent and the number that failed.
+    """
+    chunk_size = chunk_size or settings.EMAIL_BATCH_SIZE
+    connection = connection or get_connection()
+    emails = iter(emails)
+    sent = failed = 0
+    while chunk := list(itertools.islice(emails, chunk_size)):
+        messages = []
+        for email in chunk:
+            try:
+                messages.append(build_templated_email(**email))
+            except Exception:
+                failed += 1
+                logger.exception(f"Failed to render email to {email['to']}")
+        with connection:
+            errors = send_each(connection, messages)
+        for message, error in zip(messages, errors):
+            if error is None:
+                sent += 1
+            else:
+                failed += 1
+                logger.error(
+                    f"Failed to send email to {message.to}: {error!r}"
+                )
+    return sent, failed
+
+
+def send_each(connection, messages):
+    """
+    Send messages over an open connection, return the error or None for
+    each message.
+
+    Backends with a send_each method, like service.backends.AsyncSMTPBackend,
+    send them all at once, others one by one.
+    """
+    if hasattr(connection, "send_each"):
+        return connection.send_each(messages)
+    errors = []
+    for message in messages:
+        try:
+            connection.send_messages([message])
+        except Exception as e:
+            errors.append(e)
+        else:
+            errors.append(None)
+    return errors
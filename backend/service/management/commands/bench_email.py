@@ -0,0 +1,80 @@
+"""
+Benchmark sending email, in messages per second.
+
+Sends the same messages with Django's SMTP backend, one by one over one
+connection, and with the asyncio backend at each concurrency, to a local
+SMTP server that takes --delay seconds to accept each message.
+
+    python manage.py bench_email --messages 1000 --delay 0.01 \\
+        --concurrency 1 4 16
+"""
+
+import time
+
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand
+
+from service.email import send_each
+from service.smtp_server import LocalSMTPServer
+
+
+BACKENDS = {
+    "smtp": "django.core.mail.backends.smtp.EmailBackend",
+    "async": "service.backends.AsyncSMTPBackend",
+}
+
+
+class Command(BaseCommand):
+    help = "Benchmark sending email, in messages per second"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=1000)
+        parser.add_argument(
+            "--delay",
+            type=float,
+            default=0.005,
+            help="Seconds the server takes to accept a message",
+        )
+        parser.add_argument(
+            "--concurrency", type=int, nargs="+", default=[1, 4, 16]
+        )
+
+    def handle(self, *args, **options):
+        messages = [
+            EmailMessage(
+                subject=f"Benchmark {n}",
+                body="You have won in the lottery.\n" * 20,
+                from_email="noreply@example.com",
+                to=[f"winner{n}@example.com"],
+            )
+            for n in range(options["messages"])
+        ]
+        self.stdout.write(
+            f"{'backend':>8} {'concurrency':>12} {'messages':>9} "
+            f"{'msgs/s':>10}"
+        )
+        self.run("smtp", 1, messages, options["delay"])
+        for concurrency in options["concurrency"]:
+            self.run("async", concurrency, messages, options["delay"])
+
+    def run(self, backend, concurrency, messages, delay):
+        with LocalSMTPServer(delay=delay) as server:
+            connection = get_connection(
+                BACKENDS[backend],
+                host="127.0.0.1",
+                port=server.port,
+                username="",
+                password="",
+                use_tls=False,
+                use_ssl=False,
+                **({"concurrency": concurrency} if backend == "async" else {}),
+            )
+            start = time.perf_counter()
+            with connection:
+                errors = send_each(connection, messages)
+            elapsed = time.perf_counter() - start
+        sent = errors.count(None)
+        self.stdout.write(
+            f"{backend:>8} {concurrency:>12} {sent:>9} "
+            f"{sent / elapsed:>10.1f}"
+        )
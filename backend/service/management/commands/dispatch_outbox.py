@@ -0,0 +1,49 @@
+"""
+Send the emails in the outbox.
+
+Runs until interrupted, polling the outbox when it's empty. Run as many
+as needed, they don't send the same email twice.
+
+    python manage.py dispatch_outbox [--once] [--batch-size 100]
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from service.outbox import Dispatcher
+
+
+class Command(BaseCommand):
+    help = "Send the emails in the outbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Stop when the outbox is empty",
+        )
+        parser.add_argument("--batch-size", type=int)
+
+    def handle(self, *args, **options):
+        dispatcher = Dispatcher(batch_size=options["batch_size"])
+        try:
+            while True:
+                if dispatcher.dispatch():
+                    self.report(dispatcher)
+                elif options["once"]:
+                    break
+                else:
+                    time.sleep(settings.OUTBOX_POLL_INTERVAL)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            dispatcher.close()
+        self.report(dispatcher)
+
+    def report(self, dispatcher):
+        self.stdout.write(
+            f"{dispatcher.sent} sent, {dispatcher.failed} failed, "
+            f"{dispatcher.throughput:.1f} emails/s"
+        )
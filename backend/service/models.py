@@ -0,0 +1,83 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+from .email import build_email
+
+
+class Outbox(models.Model):
+    """
+    An email to send.
+
+    Written in the transaction that causes the email, and sent by the
+    outbox dispatcher (python manage.py dispatch_outbox).
+
+    pending: not sent yet, or sending failed and will be retried at
+        next_attempt.
+    sent: handed over to the SMTP server.
+    failed: sending failed OUTBOX_MAX_ATTEMPTS times, given up.
+    """
+
+    class State(models.TextChoices):
+        PENDING = "pending"
+        SENT = "sent"
+        FAILED = "failed"
+
+    state = models.CharField(
+        max_length=10, choices=State.choices, default=State.PENDING
+    )
+    # Blank for settings.DEFAULT_FROM_EMAIL
+    from_email = models.CharField(max_length=254, blank=True)
+    to = models.JSONField(default=list)
+    bcc = models.JSONField(default=list, blank=True)
+    subject = models.CharField(max_length=255)
+    template_name = models.CharField(max_length=100, blank=True)
+    body = models.TextField()
+    html = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    sent = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = "outbox"
+        indexes = [
+            models.Index(
+                fields=["next_attempt"],
+                condition=models.Q(state="pending"),
+                name="outbox_pending",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.to)}: {self.state}"
+
+    def message(self, connection=None):
+        return build_email(
+            self.from_email or None,
+            self.to,
+            self.subject,
+            self.body,
+            self.html,
+            bcc=self.bcc,
+            connection=connection,
+        )
+
+    def record_sent(self):
+        self.state = self.State.SENT
+        self.attempts += 1
+        self.sent = timezone.now()
+        self.last_error = ""
+
+    def record_failure(self, error):
+        """Retry later, with exponential backoff, or give up."""
+        self.attempts += 1
+        self.last_error = repr(error)
+        if self.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            self.state = self.State.FAILED
+        else:
+            delay = settings.OUTBOX_RETRY_DELAY * 2 ** (self.attempts - 1)
+            self.next_attempt = timezone.now() + timedelta(seconds=delay)
@@ -0,0 +1,149 @@
+"""
+Transactional email outbox.
+
+Emails are added to the Outbox inside the transaction that causes them,
+so they are sent if and only if that transaction commits, and requests
+and tasks don't wait for SMTP. The dispatcher sends them in batches.
+
+- queue_templated_email
+- outbox_email: an unsaved one, to add many with bulk_create
+- Dispatcher
+"""
+
+import time
+import logging
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .email import render_templated_email, send_each
+from .models import Outbox
+
+
+logger = logging.getLogger(__name__)
+
+
+def queue_templated_email(
+    from_email, to, subject, template_name, context_dict, bcc=None
+):
+    """Render an email and add it to the outbox."""
+    email = outbox_email(
+        from_email, to, subject, template_name, context_dict, bcc=bcc
+    )
+    email.save()
+    return email
+
+
+def outbox_email(
+    from_email, to, subject, template_name, context_dict, bcc=None
+):
+    """Render an email into an unsaved Outbox row."""
+    text_part, html_part = render_templated_email(
+        subject, template_name, context_dict
+    )
+    return Outbox(
+        from_email=from_email or "",
+        to=[to] if isinstance(to, str) else list(to),
+        bcc=[bcc] if isinstance(bcc, str) else list(bcc or []),
+        subject=subject,
+        template_name=template_name,
+        body=text_part,
+        html=html_part or "",
+    )
+
+
+class Dispatcher:
+    """
+    Sends pending outbox emails in batches, and records their state.
+
+    A batch is claimed with SELECT ... FOR UPDATE SKIP LOCKED, so
+    dispatchers running in parallel each get their own emails. The rows
+    stay locked until their state is recorded: when a dispatcher dies
+    halfway, the transaction is rolled back and the batch is sent again.
+
+    The SMTP connection stays open between batches, and is reopened after
+    EMAIL_BATCH_SIZE messages, or closed when the outbox is empty.
+    sent, failed and throughput count what this dispatcher did.
+    """
+
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+        self.connection = get_connection()
+        self.session = 0
+        self.sent = 0
+        self.failed = 0
+        self.started = time.monotonic()
+
+    @property
+    def throughput(self):
+        """Emails sent per second since the dispatcher started."""
+        return self.sent / max(time.monotonic() - self.started, 1e-9)
+
+    def dispatch(self, ids=None):
+        """
+        Send one batch, return the number of emails handled. With ids,
+        only pending emails among those are sent.
+        """
+        pending = Outbox.objects.select_for_update(skip_locked=True).filter(
+            state=Outbox.State.PENDING, next_attempt__lte=timezone.now()
+        )
+        if ids is not None:
+            pending = pending.filter(id__in=ids)
+        with transaction.atomic():
+            batch = list(
+                pending.order_by("next_attempt", "id")[: self.batch_size]
+            )
+            self.send(batch)
+            Outbox.objects.bulk_update(
+                batch,
+                ["state", "attempts", "next_attempt", "last_error", "sent"],
+            )
+        if not batch:
+            self.close()
+        return len(batch)
+
+    def send(self, batch):
+        """Send a batch, and record the state of each email."""
+        while batch:
+            if self.session >= settings.EMAIL_BATCH_SIZE:
+                self.close()
+            size = settings.EMAIL_BATCH_SIZE - self.session
+            emails, batch = batch[:size], batch[size:]
+            messages = []
+            for email in emails:
+                try:
+                    messages.append((email, email.message()))
+                except Exception as e:
+                    self.record_failure(email, e)
+            try:
+                self.connection.open()
+            except Exception as e:
+                errors = [e] * len(messages)
+            else:
+                errors = send_each(
+                    self.connection, [message for _, message in messages]
+                )
+            for (email, _), error in zip(messages, errors):
+                if error is None:
+                    email.record_sent()
+                    self.sent += 1
+                else:
+                    self.record_failure(email, error)
+            self.session += len(messages)
+            if any(errors):
+                # Start over with a fresh connection.
+                self.close()
+
+    def record_failure(self, email, error):
+        logger.warning(f"Failed to send {email}: {error!r}")
+        email.record_failure(error)
+        self.failed += 1
+
+    def close(self):
+        try:
+            self.connection.close()
+        except Exception:
+            logger.exception("Failed to close the SMTP connection")
+        self.session = 0
@@ -1,4 +1,5 @@
 import os
+from pathlib import Path
 from importlib import import_module
 
 from .defaults import *
@@ -58,6 +59,21 @@ SPECTACULAR_SETTINGS = {
 }
 
 
+# Send at most this many emails over one SMTP connection
+EMAIL_BATCH_SIZE = 100
+# Number of concurrent SMTP sessions for service.backends.AsyncSMTPBackend
+EMAIL_CONCURRENCY = 8
+# Keep at most this many bytes of inline email images in memory
+EMAIL_IMAGE_CACHE_SIZE = 4 * 1024 * 1024
+# Outbox dispatcher: claim this many emails at a time, poll an empty
+# outbox every OUTBOX_POLL_INTERVAL seconds, and retry a failed email
+# after OUTBOX_RETRY_DELAY seconds, doubling each attempt.
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_POLL_INTERVAL = 1
+OUTBOX_RETRY_DELAY = 60
+OUTBOX_MAX_ATTEMPTS = 8
+
+
 # Celery settings for background tasks
 REDIS_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}/0"
 CELERY_BROKER_URL = REDIS_URL
@@ -71,6 +87,26 @@ CELERY_TASK_TRACK_STARTED = True
 # Celery Beat settings - use writable directory
 CELERY_BEAT_SCHEDULE_FILENAME = "/tmp/celerybeat-schedule"
 
+# Cache in its own Redis database, apart from the Celery broker, unless
+# the layer has its own. Without Redis, like in dev, in the process.
+CACHES = globals().get("CACHES") or {
+    "default": (
+        {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": f"redis://{REDIS_HOST}:{REDIS_PORT}/1",
+        }
+        if REDIS_HOST
+        else {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    )
+}
+# Ignore repeated verification and password reset requests for the same
+# email address within this many seconds.
+EMAIL_COALESCE_WINDOW = 60
+# A cached value being recomputed elsewhere is waited for this many
+# seconds; the lock on recomputing it expires after the timeout.
+SINGLE_FLIGHT_WAIT = 2
+SINGLE_FLIGHT_LOCK_TIMEOUT = 30
+
 
 # Settings for production deployment
 if SITENAME:
@@ -138,3 +174,38 @@ LOGGING = {
         "level": "INFO",
     },
 }
+
+
+# Lottery draw closing
+LOTTERY_DRAW_ENGINE = "snapshot"
+LOTTERY_SNAPSHOT_DIR = Path(
+    LOTTERY_SNAPSHOT_DIR or BASE_DIR.parent / "var" / "snapshots"
+)
+# Time of day ("HH:MM") at which today's draws are closed for new ballots
+# and frozen into their snapshot, ahead of the close at 20:00. None skips
+# this, the close then takes the snapshot itself.
+LOTTERY_SNAPSHOT_AT = "19:45"
+# Close draws on this many workers in parallel, each handling a range of
+# ballot ids.
+LOTTERY_CLOSE_PARTITIONS = 1
+# Seconds after which the partitions of a draw that still has no winners
+# are sent again, in case the chord was lost.
+LOTTERY_PARTITION_TIMEOUT = 3600
+# Close missed draws on this many threads in parallel.
+LOTTERY_CATCHUP_WORKERS = 4
+# Send winner emails in tasks of this many winning accounts each.
+LOTTERY_EMAIL_CHUNK_SIZE = 100
+# Pages of the ballots-of-draw API hold at most this many ballot ids.
+LOTTERY_BALLOT_PAGE_SIZE = 10_000
+# Draw details embed this many winners, the winners API has all of them.
+LOTTERY_TOP_WINNERS = 10
+# Seconds browsers and nginx may keep the results of closed draws, and
+# the closed draws list, before revalidating.
+LOTTERY_RESULTS_MAX_AGE = 3600
+LOTTERY_LISTS_MAX_AGE = 60
+# Seconds the public lottery API responses stay in the cache. Changes
+# invalidate them explicitly; this bounds what depends on the date.
+LOTTERY_RESPONSE_CACHE_TIMEOUT = 300
+# After the timeout, a response is served this many seconds more while
+# one request recomputes it.
+LOTTERY_RESPONSE_CACHE_STALE = 60
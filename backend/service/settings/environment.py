@@ -21,6 +21,7 @@ __all__ = [
     "TIME_ZONE",
     "REDIS_HOST",
     "REDIS_PORT",
+    "LOTTERY_SNAPSHOT_DIR",
 ]
 
 globals().update({envvar: os.getenv(envvar) for envvar in __all__})
@@ -2,6 +2,9 @@
 Test settings for Lottery System
 """
 
+import tempfile
+from pathlib import Path
+
 SECRET_KEY = "test-secret-key-for-testing-only"
 TIME_ZONE = "Europe/Amsterdam"
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
@@ -12,3 +15,11 @@ CELERY_TASK_ALWAYS_EAGER = True
 CELERY_TASK_EAGER_PROPAGATES = True
 REDIS_HOST = "localhost"
 REDIS_PORT = 6379
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+# Keep ballot snapshots out of the source tree
+LOTTERY_SNAPSHOT_DIR = Path(tempfile.gettempdir()) / "lottery-snapshots"
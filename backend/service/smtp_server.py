@@ -0,0 +1,113 @@
+"""
+A local SMTP server on asyncio streams, for tests and benchmarks.
+
+It accepts every message, except for recipients in reject, and keeps
+count. delay simulates a slow server, it's the time taken to accept
+each message.
+
+    with LocalSMTPServer(delay=0.01) as server:
+        ... send email to 127.0.0.1:server.port ...
+        print(server.messages)
+"""
+
+import asyncio
+import threading
+
+
+class LocalSMTPServer:
+    def __init__(self, delay=0, reject=()):
+        self.delay = delay
+        self.reject = set(reject)
+        self.connections = 0
+        self.messages = 0
+        self.received = []
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.server = None
+        self.port = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        self.thread.start()
+        self.server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self.handle, "127.0.0.1", 0), self.loop
+        ).result()
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    def stop(self):
+        async def close():
+            self.server.close()
+            await self.server.wait_closed()
+            # Drop the connections of clients that didn't quit.
+            tasks = asyncio.all_tasks() - {asyncio.current_task()}
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+
+        def reply(line):
+            writer.write(f"{line}\r\n".encode())
+
+        reply("220 localhost ESMTP")
+        recipients = []
+        try:
+            while line := await reader.readline():
+                command = line.decode().strip()
+                verb = command[:4].upper()
+                if verb == "EHLO":
+                    reply("250-localhost")
+                    reply("250-PIPELINING")
+                    reply("250 AUTH PLAIN")
+                elif verb == "MAIL":
+                    recipients = []
+                    reply("250 OK")
+                elif verb == "RCPT":
+                    recipient = command.partition(":")[2].strip("<> ")
+                    if recipient in self.reject:
+                        reply("550 No such user")
+                    else:
+                        recipients.append(recipient)
+                        reply("250 OK")
+                elif verb == "DATA":
+                    if not recipients:
+                        reply("554 No valid recipients")
+                        continue
+                    reply("354 End data with <CR><LF>.<CR><LF>")
+                    await writer.drain()
+                    data = []
+                    while (line := await reader.readline()) != b".\r\n":
+                        data.append(line[1:] if line[:1] == b"." else line)
+                    await asyncio.sleep(self.delay)
+                    self.messages += 1
+                    self.received.append((recipients, b"".join(data)))
+                    recipients = []
+                    reply("250 OK")
+                elif verb == "RSET":
+                    recipients = []
+                    reply("250 OK")
+                elif verb == "AUTH":
+                    reply("235 Authenticated")
+                elif verb == "QUIT":
+                    reply("221 Bye")
+                    break
+                else:
+                    reply("250 OK")
+                await writer.drain()
+        except asyncio.CancelledError:
+            # Stopped while the client is still connected.
+            pass
+        finally:
+            writer.close()
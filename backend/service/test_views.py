@@ -1,3 +1,4 @@
+from django.core.cache import cache
 from django.core.management import call_command
 from django.db import connection
 from django.contrib.auth.models import User
@@ -9,6 +10,7 @@ from rest_framework import status
 
 from lottery.models import DrawType, Prize, Draw, Ballot
 from accounts.models import Account
+from service.models import Outbox
 
 
 @api_view(["POST"])
@@ -17,6 +19,7 @@ def clear_database(request):
     """Clear all test data from database"""
     try:
         # Clear all data
+        Outbox.objects.all().delete()
         Ballot.objects.all().delete()
         Draw.objects.all().delete()
         Prize.objects.all().delete()
@@ -24,6 +27,9 @@ def clear_database(request):
         Account.objects.all().delete()
         User.objects.all().delete()
 
+        # Forget coalesced email requests of removed users
+        cache.clear()
+
         # Reset sequences
         with connection.cursor() as cursor:
             cursor.execute("DELETE FROM sqlite_sequence")
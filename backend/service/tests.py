@@ -0,0 +1,456 @@
+import io
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from accounts.emails import queue_verification_email
+from lottery.models import DrawType, Prize, Draw, Ballot
+from lottery.tasks import queue_winner_emails, send_lottery_winner_emails
+from service import email
+from service.cache import single_flight
+from service.email import build_templated_email, send_templated_emails
+from service.models import Outbox
+from service.outbox import Dispatcher, queue_templated_email
+from service.smtp_server import LocalSMTPServer
+
+
+class SMTPTestCase(TestCase):
+    """Runs a local SMTP server and sends email to it."""
+
+    backend = "django.core.mail.backends.smtp.EmailBackend"
+
+    def setUp(self):
+        self.smtp = LocalSMTPServer(reject=["reject@example.com"])
+        self.smtp.start()
+        self.addCleanup(self.smtp.stop)
+        settings = override_settings(
+            EMAIL_BACKEND=self.backend,
+            EMAIL_HOST="127.0.0.1",
+            EMAIL_PORT=self.smtp.port,
+            EMAIL_USE_TLS=False,
+            EMAIL_USE_SSL=False,
+            EMAIL_HOST_USER="",
+            EMAIL_HOST_PASSWORD="",
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+
+class SendTemplatedEmailsTests(SMTPTestCase):
+    def email(self, n):
+        user = User(email=f"user{n}@example.com", last_name=f"User {n}")
+        return {
+            "from_email": "noreply@example.com",
+            "to": user.email,
+            "subject": "Verify your email address",
+            "template_name": "accounts/email/verify_email",
+            "context_dict": {"verification_url": "/verify/", "user": user},
+        }
+
+    def test_one_connection_per_chunk(self):
+        emails = [self.email(n) for n in range(5)]
+        sent, failed = send_templated_emails(emails, chunk_size=2)
+        self.assertEqual((sent, failed), (5, 0))
+        self.assertEqual(self.smtp.messages, 5)
+        self.assertEqual(self.smtp.connections, 3)
+
+    def test_failed_email_is_skipped(self):
+        emails = [self.email(0), self.email(1), self.email(2)]
+        emails[1]["template_name"] = "does/not/exist"
+        sent, failed = send_templated_emails(emails)
+        self.assertEqual((sent, failed), (2, 1))
+        self.assertEqual(self.smtp.messages, 2)
+        self.assertEqual(self.smtp.connections, 1)
+
+    @override_settings(
+        EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend"
+    )
+    def test_other_backend(self):
+        sent, failed = send_templated_emails([self.email(0)])
+        self.assertEqual((sent, failed), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_lottery_winner_emails(self):
+        drawtype = DrawType.objects.create(name="Daily")
+        prize = Prize.objects.create(
+            name="Prize", amount=10, number=3, drawtype=drawtype
+        )
+        draw = Draw.objects.create(
+            drawtype=drawtype,
+            date=timezone.now().date(),
+            closed=timezone.now(),
+        )
+        for n in range(3):
+            user = User.objects.create_user(
+                username=f"winner{n}@example.com",
+                email=f"winner{n}@example.com",
+            )
+            Ballot.objects.create(draw=draw, account=user.account, prize=prize)
+        send_lottery_winner_emails(draw.id, queue_winner_emails(draw))
+        self.assertEqual(self.smtp.messages, 3)
+        self.assertEqual(self.smtp.connections, 1)
+
+
+class OutboxTests(SMTPTestCase):
+    def queue(self, n):
+        return queue_templated_email(
+            from_email="noreply@example.com",
+            to=f"user{n}@example.com",
+            subject="Reset your password",
+            template_name="accounts/email/password_reset",
+            context_dict={"reset_url": "/reset/", "user": User()},
+        )
+
+    def test_dispatch_in_batches(self):
+        """Test that batches are sent over one connection"""
+        for n in range(5):
+            self.queue(n)
+        dispatcher = Dispatcher(batch_size=2)
+        handled = [dispatcher.dispatch() for _ in range(4)]
+        self.assertEqual(handled, [2, 2, 1, 0])
+        self.assertEqual(self.smtp.messages, 5)
+        self.assertEqual(self.smtp.connections, 1)
+        self.assertEqual((dispatcher.sent, dispatcher.failed), (5, 0))
+        self.assertFalse(
+            Outbox.objects.exclude(state=Outbox.State.SENT).exists()
+        )
+
+    @override_settings(EMAIL_BATCH_SIZE=2)
+    def test_connection_reopened_after_batch_size(self):
+        for n in range(5):
+            self.queue(n)
+        Dispatcher().dispatch()
+        self.assertEqual(self.smtp.messages, 5)
+        self.assertEqual(self.smtp.connections, 3)
+
+    @override_settings(OUTBOX_MAX_ATTEMPTS=2)
+    def test_failed_email_retried(self):
+        """Test that a failed email is retried later, then given up"""
+        email = self.queue(0)
+        with override_settings(EMAIL_PORT=1):
+            dispatcher = Dispatcher()
+            self.assertEqual(dispatcher.dispatch(), 1)
+            email.refresh_from_db()
+            self.assertEqual(email.state, Outbox.State.PENDING)
+            self.assertEqual(email.attempts, 1)
+            self.assertGreater(email.next_attempt, timezone.now())
+            self.assertIn("ConnectionRefusedError", email.last_error)
+            self.assertEqual(dispatcher.dispatch(), 0)
+
+            email.next_attempt = timezone.now() - timedelta(seconds=1)
+            email.save()
+            self.assertEqual(dispatcher.dispatch(), 1)
+            email.refresh_from_db()
+            self.assertEqual(email.state, Outbox.State.FAILED)
+            self.assertEqual(dispatcher.failed, 2)
+        self.assertEqual(Dispatcher().dispatch(), 0)
+        self.assertEqual(self.smtp.messages, 0)
+
+    def test_verification_email_queued(self):
+        """Test that the email is queued with the new token"""
+        user = User.objects.create_user(
+            username="new@example.com", email="new@example.com"
+        )
+        queue_verification_email("new@example.com")
+        email = Outbox.objects.get()
+        user.account.refresh_from_db()
+        self.assertEqual(email.to, ["new@example.com"])
+        self.assertIn(user.account.email_verification_token, email.body)
+        self.assertEqual(self.smtp.messages, 0)
+
+    def test_dispatch_outbox_command(self):
+        self.queue(0)
+        out = io.StringIO()
+        call_command("dispatch_outbox", "--once", stdout=out)
+        self.assertIn("1 sent, 0 failed", out.getvalue())
+        self.assertEqual(self.smtp.messages, 1)
+
+
+class AsyncSMTPBackendTests(SMTPTestCase):
+    backend = "service.backends.AsyncSMTPBackend"
+
+    def message(self, to, body="You have won"):
+        return mail.EmailMessage(
+            "Lottery",
+            body,
+            "noreply@example.com",
+            to if isinstance(to, list) else [to],
+        )
+
+    @override_settings(EMAIL_CONCURRENCY=4)
+    def test_concurrent_sessions(self):
+        """Test that messages are sent over a pool of sessions"""
+        messages = [self.message(f"user{n}@example.com") for n in range(20)]
+        self.assertEqual(mail.get_connection().send_messages(messages), 20)
+        self.assertEqual(self.smtp.messages, 20)
+        self.assertEqual(self.smtp.connections, 4)
+
+    def test_message_data(self):
+        """Test that lines starting with a dot arrive intact"""
+        self.message("user@example.com", "Hello\n.\n..dots\n").send()
+        [(recipients, data)] = self.smtp.received
+        self.assertEqual(recipients, ["user@example.com"])
+        self.assertIn(b"Subject: Lottery\r\n", data)
+        self.assertTrue(data.endswith(b"Hello\r\n.\r\n..dots\r\n"))
+
+    @override_settings(EMAIL_CONCURRENCY=1)
+    def test_rejected_recipient(self):
+        """Test that a refused message fails alone, the session is reused"""
+        messages = [
+            self.message("user@example.com"),
+            self.message("reject@example.com"),
+            self.message(["user@example.com", "reject@example.com"]),
+        ]
+        connection = mail.get_connection()
+        errors = connection.send_each(messages)
+        self.assertIsNone(errors[0])
+        self.assertIn("550", str(errors[1]))
+        self.assertIsNone(errors[2])
+        self.assertEqual(self.smtp.messages, 2)
+        self.assertEqual(self.smtp.connections, 1)
+        with self.assertRaises(Exception):
+            connection.send_messages(messages)
+        connection = mail.get_connection(fail_silently=True)
+        self.assertEqual(connection.send_messages(messages), 2)
+
+    @override_settings(EMAIL_PORT=1)
+    def test_connection_refused(self):
+        connection = mail.get_connection()
+        with self.assertRaises(ConnectionRefusedError):
+            connection.send_messages([self.message("user@example.com")])
+
+    def test_templated_emails(self):
+        """Test that templated emails count failures per message"""
+        emails = [
+            {
+                "from_email": "noreply@example.com",
+                "to": to,
+                "subject": "Reset your password",
+                "template_name": "accounts/email/password_reset",
+                "context_dict": {"reset_url": "/reset/", "user": User()},
+            }
+            for to in ["a@example.com", "reject@example.com", "b@example.com"]
+        ]
+        self.assertEqual(send_templated_emails(emails), (2, 1))
+        self.assertEqual(self.smtp.messages, 2)
+
+    def test_outbox(self):
+        for n in range(5):
+            queue_templated_email(
+                "noreply@example.com",
+                f"user{n}@example.com",
+                "Reset your password",
+                "accounts/email/password_reset",
+                {"reset_url": "/reset/", "user": User()},
+            )
+        dispatcher = Dispatcher()
+        self.assertEqual(dispatcher.dispatch(), 5)
+        self.assertEqual(dispatcher.sent, 5)
+        self.assertEqual(self.smtp.messages, 5)
+
+    def test_bench_email_command(self):
+        out = io.StringIO()
+        call_command(
+            "bench_email",
+            "--messages=10",
+            "--delay=0",
+            "--concurrency",
+            "2",
+            stdout=out,
+        )
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertIn("msgs/s", lines[0])
+        self.assertEqual(lines[2].split()[:3], ["async", "2", "10"])
+
+
+class EmailCacheTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.root = Path(self.dir.name)
+        (self.root / "mail").mkdir()
+        (self.root / "images").mkdir()
+        self.write("mail/hello.txt", "Hello {{ name }}")
+        settings = override_settings(
+            DEBUG=True,
+            STATIC_ROOT=self.root,
+            EMAIL_IMAGE_CACHE_SIZE=10,
+            TEMPLATES=[
+                {
+                    "BACKEND": "django.template.backends.django."
+                    "DjangoTemplates",
+                    "DIRS": [self.root],
+                    "OPTIONS": {
+                        "loaders": [
+                            "django.template.loaders.filesystem.Loader"
+                        ]
+                    },
+                }
+            ],
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        email.templates.clear()
+        email.images.clear()
+        self.addCleanup(email.templates.clear)
+        self.addCleanup(email.images.clear)
+
+    def write(self, name, content, age=0):
+        path = self.root / name
+        path.write_bytes(content.encode())
+        # Make sure the change is visible in the mtime.
+        timestamp = 1_000_000_000 + age
+        os.utime(path, (timestamp, timestamp))
+        os.utime(path.parent, (timestamp, timestamp))
+
+    def build(self):
+        return build_templated_email(
+            "noreply@example.com",
+            "user@example.com",
+            "Hello",
+            "mail/hello",
+            {"name": "World"},
+        )
+
+    def test_templates_cached(self):
+        """Test that templates and a missing html part are cached"""
+        with mock.patch(
+            "service.email.loader.get_template",
+            wraps=email.loader.get_template,
+        ) as get_template:
+            for _ in range(3):
+                message = self.build()
+        self.assertEqual(message.body, "Hello World")
+        self.assertEqual(message.alternatives, [])
+        self.assertEqual(get_template.call_count, 2)
+
+    def test_templates_evicted_on_change(self):
+        """Test that changed and added templates are picked up in DEBUG"""
+        self.build()
+        self.write("mail/hello.txt", "Hi {{ name }}", age=1)
+        self.write(
+            "mail/hello.html", "<img src='cid:logo.gif'>{{ name }}", age=1
+        )
+        self.write("images/logo.gif", "GIF89a", age=1)
+        message = self.build()
+        self.assertEqual(message.body, "Hi World")
+        self.assertEqual(len(message.alternatives), 1)
+        self.assertEqual(message.inlined_images, {"logo.gif"})
+
+    @override_settings(DEBUG=False)
+    def test_templates_not_evicted_in_production(self):
+        self.build()
+        self.write("mail/hello.txt", "Hi {{ name }}", age=1)
+        self.assertEqual(self.build().body, "Hello World")
+
+    def test_images_cached(self):
+        """Test that images are read once, and again when changed"""
+        self.write("images/logo.png", "logo")
+        with mock.patch("service.email.open", wraps=open) as opened:
+            self.assertEqual(email.read_image("logo.png"), b"logo")
+            self.assertEqual(email.read_image("logo.png"), b"logo")
+            self.assertEqual(opened.call_count, 1)
+            self.write("images/logo.png", "new logo", age=1)
+            self.assertEqual(email.read_image("logo.png"), b"new logo")
+            self.assertEqual(opened.call_count, 2)
+        self.assertIsNone(email.read_image("missing.png"))
+
+    def test_images_bounded(self):
+        """Test that least recently used images are dropped"""
+        for name in ("a", "b", "c"):
+            self.write(f"images/{name}.png", "1234")
+            email.read_image(f"{name}.png")
+        self.write("images/big.png", "12345678901")
+        self.assertEqual(email.read_image("big.png"), b"12345678901")
+        self.assertEqual(list(email.images.images), ["b.png", "c.png"])
+        self.assertEqual(email.images.size, 8)
+
+
+@override_settings(SINGLE_FLIGHT_WAIT=0.5)
+class SingleFlightTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return self.calls
+
+    def test_fresh(self):
+        """Test that a fresh value isn't computed again"""
+        self.assertEqual(single_flight("key", self.compute, 60), 1)
+        self.assertEqual(single_flight("key", self.compute, 60), 1)
+        self.assertEqual(self.calls, 1)
+
+    def test_stale(self):
+        """Test that a stale value is recomputed by the lock holder"""
+        single_flight("key", self.compute, 0, stale=60)
+        # Another process is recomputing it.
+        cache.add("key:lock", "other")
+        self.assertEqual(single_flight("key", self.compute, 0, stale=60), 1)
+        self.assertEqual(self.calls, 1)
+        cache.delete("key:lock")
+        self.assertEqual(single_flight("key", self.compute, 0, stale=60), 2)
+        self.assertIsNone(cache.get("key:lock"))
+
+    def test_wait(self):
+        """Test that a miss waits for the value computed elsewhere"""
+        cache.add("key:lock", "other")
+        timer = threading.Timer(
+            0.1, lambda: cache.set("key", ("theirs", 1e12), 60)
+        )
+        timer.start()
+        self.addCleanup(timer.cancel)
+        self.assertEqual(single_flight("key", self.compute, 60), "theirs")
+        self.assertEqual(self.calls, 0)
+
+    def test_wait_timeout(self):
+        """Test that a miss is computed when the lock holder is too slow"""
+        cache.add("key:lock", "other")
+        self.assertEqual(single_flight("key", self.compute, 60), 1)
+        self.assertEqual(cache.get("key:lock"), "other")
+
+    def test_error(self):
+        """Test that the lock is released when computing fails"""
+
+        def fail():
+            raise ValueError
+
+        with self.assertRaises(ValueError):
+            single_flight("key", fail, 60)
+        self.assertIsNone(cache.get("key:lock"))
+        self.assertEqual(single_flight("key", self.compute, 60), 1)
+
+    def test_concurrent_misses(self):
+        """Test that concurrent misses compute the value once"""
+        started = threading.Barrier(8)
+        results = []
+
+        def compute():
+            self.calls += 1
+            threading.Event().wait(0.1)
+            return "value"
+
+        def request():
+            started.wait()
+            results.append(single_flight("key", compute, 60))
+
+        threads = [threading.Thread(target=request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ["value"] * 8)
+        self.assertEqual(self.calls, 1)
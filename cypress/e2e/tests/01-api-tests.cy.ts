@@ -59,10 +59,11 @@ describe('API Endpoints', () => {
     it('Should return open draws', () => {
         cy.request('GET', '/api/lottery/draws/open/').then((response) => {
             expect(response.status).to.eq(200)
-            expect(response.body).to.be.an('array')
+            expect(response.body).to.have.property('next')
+            expect(response.body.results).to.be.an('array')
 
-            if (response.body.length > 0) {
-                const draw = response.body[0]
+            if (response.body.results.length > 0) {
+                const draw = response.body.results[0]
                 expect(draw).to.have.property('id')
                 expect(draw).to.have.property('drawtype')
                 expect(draw).to.have.property('date')
@@ -74,10 +75,11 @@ describe('API Endpoints', () => {
     it('Should return closed draws', () => {
         cy.request('GET', '/api/lottery/draws/closed/').then((response) => {
             expect(response.status).to.eq(200)
-            expect(response.body).to.be.an('array')
+            expect(response.body).to.have.property('next')
+            expect(response.body.results).to.be.an('array')
 
-            if (response.body.length > 0) {
-                const draw = response.body[0]
+            if (response.body.results.length > 0) {
+                const draw = response.body.results[0]
                 expect(draw).to.have.property('id')
                 expect(draw).to.have.property('drawtype')
                 expect(draw).to.have.property('closed')
@@ -3,7 +3,7 @@
 import { useState, useEffect } from 'react';
 import Link from 'next/link';
 import { Calendar, Euro, Trophy, Users, ArrowLeft } from 'lucide-react';
-import { LotteryService } from '@/lib/lottery';
+import { LotteryService, nextCursor } from '@/lib/lottery';
 import { Draw } from '@/lib/types';
 import { formatCurrency, formatDate } from '@/lib/utils';
 import toast from 'react-hot-toast';
@@ -11,6 +11,8 @@ import toast from 'react-hot-toast';
 export default function ClosedDrawsPage() {
   const [draws, setDraws] = useState<Draw[]>([]);
   const [loading, setLoading] = useState(true);
+  const [cursor, setCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     loadDraws();
@@ -18,8 +20,9 @@ export default function ClosedDrawsPage() {
 
   const loadDraws = async () => {
     try {
-      const data = await LotteryService.getClosedDraws();
-      setDraws(data);
+      const page = await LotteryService.getClosedDraws();
+      setDraws(page.results);
+      setCursor(nextCursor(page));
     } catch {
       toast.error('Failed to load closed draws');
     } finally {
@@ -27,6 +30,19 @@ export default function ClosedDrawsPage() {
     }
   };
 
+  const loadMoreDraws = async () => {
+    setLoadingMore(true);
+    try {
+      const page = await LotteryService.getClosedDraws(cursor);
+      setDraws((prev) => [...prev, ...page.results]);
+      setCursor(nextCursor(page));
+    } catch {
+      toast.error('Failed to load closed draws');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   if (loading) {
     return (
       <div className="flex items-center justify-center min-h-[60vh]">
@@ -164,6 +180,20 @@ export default function ClosedDrawsPage() {
           ))}
         </div>
       )}
+
+      {cursor && (
+        <div className="text-center">
+          <button
+            type="button"
+            onClick={loadMoreDraws}
+            disabled={loadingMore}
+            data-testid="load-more-draws"
+            className="button-primary"
+          >
+            {loadingMore ? 'Loading...' : 'Load More Draws'}
+          </button>
+        </div>
+      )}
     </div>
   );
 }
@@ -3,7 +3,7 @@
 import { useState, useEffect } from 'react';
 import Link from 'next/link';
 import { Calendar, Euro, Users, ArrowRight, CheckCircle } from 'lucide-react';
-import { LotteryService } from '@/lib/lottery';
+import { LotteryService, nextCursor } from '@/lib/lottery';
 import { Draw } from '@/lib/types';
 import { formatCurrency, formatDate } from '@/lib/utils';
 import toast from 'react-hot-toast';
@@ -11,6 +11,8 @@ import toast from 'react-hot-toast';
 export default function OpenDrawsPage() {
   const [draws, setDraws] = useState<Draw[]>([]);
   const [loading, setLoading] = useState(true);
+  const [cursor, setCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     loadDraws();
@@ -18,8 +20,9 @@ export default function OpenDrawsPage() {
 
   const loadDraws = async () => {
     try {
-      const data = await LotteryService.getOpenDraws();
-      setDraws(data);
+      const page = await LotteryService.getOpenDraws();
+      setDraws(page.results);
+      setCursor(nextCursor(page));
     } catch {
       toast.error('Failed to load draws');
     } finally {
@@ -27,6 +30,19 @@ export default function OpenDrawsPage() {
     }
   };
 
+  const loadMoreDraws = async () => {
+    setLoadingMore(true);
+    try {
+      const page = await LotteryService.getOpenDraws(cursor);
+      setDraws((prev) => [...prev, ...page.results]);
+      setCursor(nextCursor(page));
+    } catch {
+      toast.error('Failed to load draws');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   if (loading) {
     return (
       <div className="flex items-center justify-center min-h-[60vh]">
@@ -149,6 +165,20 @@ export default function OpenDrawsPage() {
         </div>
       )}
 
+      {cursor && (
+        <div className="text-center">
+          <button
+            type="button"
+            onClick={loadMoreDraws}
+            disabled={loadingMore}
+            data-testid="load-more-draws"
+            className="button-primary"
+          >
+            {loadingMore ? 'Loading...' : 'Load More Draws'}
+          </button>
+        </div>
+      )}
+
       <div className="text-center pt-8">
         <Link
           href="/draws/closed"
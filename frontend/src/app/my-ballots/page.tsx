@@ -71,7 +71,7 @@ export default function MyBallotsPage() {
 
   const loadDraws = async () => {
     try {
-      const data = await LotteryService.getOpenDraws();
+      const data = await LotteryService.getAllOpenDraws();
       setDraws(data);
     } catch {
       console.error('Failed to load draws');
@@ -1,6 +1,7 @@
 import api from './api';
 import {
   Draw,
+  Page,
   UserBallots,
   UserWinnings,
   LotteryStats,
@@ -8,14 +9,34 @@ import {
   BallotAssignmentForm,
 } from './types';
 
+// The cursor of the next page of a paginated list, null on the last page.
+export function nextCursor<T>(page: Page<T>): string | null {
+  return page.next ? new URL(page.next).searchParams.get('cursor') : null;
+}
+
 export class LotteryService {
-  static async getOpenDraws(): Promise<Draw[]> {
-    const response = await api.get('/lottery/draws/open/');
+  static async getOpenDraws(cursor?: string | null): Promise<Page<Draw>> {
+    const response = await api.get('/lottery/draws/open/', {
+      params: { cursor: cursor ?? undefined },
+    });
     return response.data;
   }
 
-  static async getClosedDraws(): Promise<Draw[]> {
-    const response = await api.get('/lottery/draws/closed/');
+  static async getAllOpenDraws(): Promise<Draw[]> {
+    const draws: Draw[] = [];
+    let cursor: string | null = null;
+    do {
+      const page: Page<Draw> = await LotteryService.getOpenDraws(cursor);
+      draws.push(...page.results);
+      cursor = nextCursor(page);
+    } while (cursor);
+    return draws;
+  }
+
+  static async getClosedDraws(cursor?: string | null): Promise<Page<Draw>> {
+    const response = await api.get('/lottery/draws/closed/', {
+      params: { cursor: cursor ?? undefined },
+    });
     return response.data;
   }
 
@@ -42,6 +42,7 @@ export const mockDraw = {
   },
   date: '2024-01-15T20:00:00Z',
   closed: null,
+  ballot_count: 1,
   prizes: [
     {
       id: 1,
@@ -34,12 +34,20 @@ export interface Draw {
   drawtype: DrawType;
   date: string;
   closed: string | null;
+  ballot_count: number;
   prizes: Prize[];
   winner_count: number;
   total_prize_amount: number;
   winners?: Winner[];
 }
 
+// A page of a keyset paginated list, next and previous are URLs.
+export interface Page<T> {
+  next: string | null;
+  previous: string | null;
+  results: T[];
+}
+
 export interface Winner {
   name: string;
   prize_name: string;